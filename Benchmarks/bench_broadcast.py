@@ -0,0 +1,91 @@
+"""
+Measures the CPU time the server spends on broadcasting player states.
+
+For every player count one relay round is simulated: every player's state is
+broadcast to all other players (N * (N - 1) sends). The clients are not
+connected, the encoded messages are only queued in their outbound queues, so
+the result is the serialization and queueing cost without any network I/O.
+
+* ``per-client``: every recipient encodes the message itself (the behaviour
+  before the encode-once broadcast)
+* ``encode-once``: ``CarGameServer.broadcast`` encodes once per protocol
+
+Both are measured with every available JSON backend (see Shared/Serializer.py)
+and with the JSON and the binary protocol.
+
+Usage (from the repository root):
+    python Benchmarks/bench_broadcast.py [--players 8 16 32 64 128] [--rounds 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CarGameServer import CarGameServer, ClientConnection
+from Protocol import PROTOCOL_BINARY, PROTOCOL_JSON, create_codec
+import Serializer
+
+
+class BenchClient(ClientConnection):
+    """Client without a connection, sent messages stay in its queue."""
+
+    def __init__(self, index, server, protocol):
+        self.setup_connection(("127.0.0.1", 10000 + index), server)
+        self.name = f"bench{index}"
+        self.codec = create_codec(protocol)
+
+
+def _state(client):
+    return {
+        "id": client.player_id, "name": client.name, "x": 1234.5, "y": -42.25, "angle": 90.0,
+        "is_drifting": False, "car_color": [255, 0, 0], "points": 17.0, "is_boosting": True, "speed_kmh": 88.0
+    }
+
+
+def _per_client_broadcast(server, message, exclude):
+    for client in server.clients:
+        if client != exclude and client.running:
+            client.send(message)
+
+
+def measure(players, protocol, encode_once, rounds) -> float:
+    """Returns the CPU time in milliseconds of one relay round."""
+    server = CarGameServer(host="127.0.0.1", port=0)
+    server.clients = [BenchClient(i, server, protocol) for i in range(players)]
+    states = [(client, _state(client)) for client in server.clients]
+
+    total = 0.0
+    for _ in range(rounds):
+        start = time.process_time()
+        for sender, state in states:
+            if encode_once:
+                server.broadcast(state, exclude=sender)
+            else:
+                _per_client_broadcast(server, state, sender)
+        total += time.process_time() - start
+        for client in server.clients:
+            client.queue.drain()
+    return total / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[8, 16, 32, 64, 128])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'protocol':>8} | {'serializer':>10} | {'players':>7} | {'per-client':>12} | {'encode-once':>12} | speedup")
+    for protocol in (PROTOCOL_JSON, PROTOCOL_BINARY):
+        for serializer in Serializer.SERIALIZERS:
+            Serializer.set_default_serializer(serializer)
+            for players in args.players:
+                per_client = measure(players, protocol, False, args.rounds)
+                encode_once = measure(players, protocol, True, args.rounds)
+                print(f"{protocol:>8} | {serializer:>10} | {players:7d} | {per_client:9.2f} ms | "
+                      f"{encode_once:9.2f} ms | {per_client / encode_once:6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
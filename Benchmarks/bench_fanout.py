@@ -0,0 +1,380 @@
+"""
+Fan-out benchmark suite of the CarGameServer over loopback, with JSON results.
+
+For every player count N the CarGameServer runs in this process (relay mode,
+newline-JSON) on 127.0.0.1 and a client process connects N raw sockets.
+Because the clients run in their own process, time.process_time() of this
+process is the CPU time of the server.
+
+Per player count:
+
+* ``broadcast``: CPU time of ``CarGameServer.broadcast`` per delivered message
+  (one state to N - 1 unconnected clients, see bench_broadcast.py)
+* ``receive``: CPU time of the receive path per received state (frame
+  splitting, JSON decoding, handle_message and the broadcast to N - 1 clients)
+* ``latency``: the clients send states paced at a fixed total delivery rate,
+  every state carries its send time (``points``, time.monotonic() is shared by
+  all processes) and the receivers measure p50/p99 of the relay latency
+* ``throughput``: in rounds, every client sends one state and the next round
+  starts as soon as all N * (N - 1) deliveries arrived. Peak throughput is the
+  number of delivered messages per second, the server CPU time per delivered
+  message is reported too. Sending faster would only let the server coalesce
+  queued states of the same player.
+
+The JSON path (encoding and decoding one state) is measured once, it doesn't
+depend on N. On a machine with few cores the client process competes with the
+server, compare results from the same machine only.
+
+The results are written to a JSON file with the git commit and the Python
+version. ``--compare`` prints the change against an older result file.
+
+Usage (from the repository root):
+    python Benchmarks/bench_fanout.py [--players 2 4 8 16 32 64 128 256] [--seconds 2]
+                                      [--output fanout.json] [--compare fanout-old.json]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import selectors
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CarGameServer import CarGameServer, ClientConnection
+from Protocol import PROTOCOL_JSON, create_codec
+import Serializer
+
+# Deliveries per second (sent states * (N - 1)) in the latency phase
+DEFAULT_LATENCY_LOAD = 20000
+# A throughput round that isn't delivered completely within this time is given up
+ROUND_TIMEOUT = 1.0
+# Longest time to wait until all clients announced themselves
+WARMUP_TIMEOUT = 10.0
+# Time to wait for the last deliveries after the latency phase
+DRAIN_TIME = 0.3
+
+
+class BenchClient(ClientConnection):
+    """Client without a connection, sent messages stay in its queue."""
+
+    def __init__(self, index, server):
+        self.setup_connection(("127.0.0.1", 10000 + index), server)
+        self.name = f"bench{index}"
+        self.car_color = [255, 0, 0]
+        self.announced_info = (self.name, self.car_color)
+
+
+def _state(index, sent_time=0.0) -> dict:
+    return {
+        "name": f"bench{index}", "x": 1234.5, "y": -42.25, "angle": 90.0, "is_drifting": False,
+        "car_color": [255, 0, 0], "points": sent_time, "is_boosting": True, "speed_kmh": 88.0
+    }
+
+
+def _drain_queues(clients):
+    for client in clients:
+        client.queue.drain()
+
+
+def measure_broadcast(players, rounds=200) -> float:
+    """Returns the CPU time in microseconds per delivered message of server.broadcast."""
+    server = CarGameServer(host="127.0.0.1", port=0)
+    server.clients = [BenchClient(i, server) for i in range(players)]
+    state = _state(0)
+    state["id"] = server.clients[0].player_id
+    total = 0.0
+    for _ in range(rounds):
+        start = time.process_time()
+        server.broadcast(state, exclude=server.clients[0])
+        total += time.process_time() - start
+        _drain_queues(server.clients)
+    return total / (rounds * (players - 1)) * 1e6
+
+
+def measure_receive(players, messages=2000) -> float:
+    """Returns the CPU time in microseconds per received state of the receive path (decode, handle, broadcast)."""
+    server = CarGameServer(host="127.0.0.1", port=0)
+    server.clients = [BenchClient(i, server) for i in range(players)]
+    sender = server.clients[0]
+    data = create_codec(PROTOCOL_JSON).encode(_state(0)) * 50
+    total = 0.0
+    for _ in range(messages // 50):
+        start = time.process_time()
+        server.receive_data(sender, data)
+        total += time.process_time() - start
+        _drain_queues(server.clients)
+    return total / messages * 1e6
+
+
+def measure_json_path(messages=20000) -> dict:
+    """Returns the CPU time in microseconds to encode and to decode one state with the JSON codec."""
+    codec = create_codec(PROTOCOL_JSON)
+    state = _state(0)
+    start = time.process_time()
+    for _ in range(messages):
+        frame = codec.encode(state)
+    encode = time.process_time() - start
+    start = time.process_time()
+    for _ in range(messages):
+        codec.decode(frame[:-1])
+    decode = time.process_time() - start
+    return {"serializer": Serializer.get_serializer().name, "encode_us": encode / messages * 1e6, "decode_us": decode / messages * 1e6}
+
+
+class _Receiver:
+    """Counts (and optionally parses) the newline-JSON messages arriving at the client sockets."""
+
+    def __init__(self, sockets):
+        self.selector = selectors.DefaultSelector()
+        for sock in sockets:
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ, bytearray())
+        self.received = 0
+        self.latencies = []
+        self.parse = False
+        self.since = 0.0     # states sent before this time aren't counted while parsing
+
+    def poll(self, timeout: float):
+        for key, _ in self.selector.select(timeout):
+            try:
+                data = key.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            if not self.parse:
+                self.received += data.count(b'\n')
+                continue
+            now = time.monotonic()
+            buffer = key.data
+            buffer += data
+            *lines, rest = buffer.split(b'\n')
+            buffer[:] = rest
+            for line in lines:
+                message = json.loads(line)
+                if "event" not in message and message["points"] >= self.since:
+                    self.received += 1
+                    self.latencies.append((now - message["points"]) * 1000)
+
+
+def _send(sock, data: bytes):
+    sock.setblocking(True)
+    sock.sendall(data)
+    sock.setblocking(False)
+
+
+def _client_process(port, players, seconds, latency_load, conn):
+    """Connects the players and runs the latency and the throughput phase when the benchmark says go."""
+    sockets = [socket.create_connection(("127.0.0.1", port)) for _ in range(players)]
+    for sock in sockets:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    receiver = _Receiver(sockets)
+    codec = create_codec(PROTOCOL_JSON)
+    # First state per player: the server announces names and colors
+    for index, sock in enumerate(sockets):
+        _send(sock, codec.encode(_state(index)))
+    # Every client gets the player_info and the state of every other client
+    end = time.monotonic() + WARMUP_TIMEOUT
+    while receiver.received < 2 * players * (players - 1) and time.monotonic() < end:
+        receiver.poll(0.05)
+    conn.send("ready")
+
+    # Latency: one state at a time, round robin over the senders
+    conn.recv()
+    receiver.received = 0
+    receiver.parse = True
+    receiver.since = time.monotonic()
+    interval = (players - 1) / latency_load
+    sent = 0
+    next_send = time.monotonic()
+    end = next_send + seconds
+    while next_send < end:
+        receiver.poll(max(0.0, next_send - time.monotonic()))
+        if time.monotonic() >= next_send:
+            index = sent % players
+            _send(sockets[index], codec.encode(_state(index, time.monotonic())))
+            sent += 1
+            next_send += interval
+    drain_end = time.monotonic() + DRAIN_TIME
+    while time.monotonic() < drain_end:
+        receiver.poll(0.05)
+    conn.send({"sent": sent, "received": receiver.received, "latencies": receiver.latencies})
+
+    # Throughput: closed loop, every player sends one state and the next round starts once it was delivered
+    conn.recv()
+    receiver.received = 0
+    receiver.parse = False
+    lines = [codec.encode(_state(index)) for index in range(players)]
+    sent = 0
+    timeouts = 0
+    lost = 0
+    start = time.monotonic()
+    end = start + seconds
+    while time.monotonic() < end:
+        for sock, line in zip(sockets, lines):
+            _send(sock, line)
+        sent += players
+        expected = sent * (players - 1) - lost
+        round_end = time.monotonic() + ROUND_TIMEOUT
+        while receiver.received < expected:
+            if time.monotonic() > round_end:
+                # Lost to coalescing or dropping, count it and go on
+                timeouts += 1
+                lost += expected - receiver.received
+                break
+            receiver.poll(0.01)
+    conn.send({"sent": sent, "received": receiver.received, "timeouts": timeouts, "seconds": time.monotonic() - start})
+    # Stay connected until the benchmark read the server's counters
+    conn.recv()
+    for sock in sockets:
+        sock.close()
+
+
+def _start_server() -> CarGameServer:
+    server = CarGameServer(host="127.0.0.1", port=0)
+
+    def serve():
+        try:
+            server.start()
+        except OSError:
+            # Socket closed by stop()
+            pass
+
+    threading.Thread(target=serve, daemon=True).start()
+    while server.server_socket is None or not server.running:
+        time.sleep(0.01)
+    return server
+
+
+def _percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))] if sorted_values else None
+
+
+def measure_loopback(players, seconds, latency_load) -> dict:
+    """Runs the latency and the throughput phase against a fresh server."""
+    server = _start_server()
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_client_process,
+                                      args=(server.server_socket.getsockname()[1], players, seconds, latency_load, child_conn))
+    process.start()
+    try:
+        parent_conn.recv()
+
+        parent_conn.send("go")
+        latency = parent_conn.recv()
+
+        sent_before = server.metrics.messages_sent.value
+        dropped_before = sum(client.queue.dropped for client in server.clients)
+        cpu = time.process_time()
+        parent_conn.send("go")
+        throughput = parent_conn.recv()
+        cpu = time.process_time() - cpu
+        queued = server.metrics.messages_sent.value - sent_before
+        dropped = sum(client.queue.dropped for client in server.clients) - dropped_before
+        parent_conn.send("done")
+    finally:
+        process.join(timeout=ROUND_TIMEOUT + 5)
+        if process.is_alive():
+            process.terminate()
+        server.stop()
+
+    latencies = sorted(latency["latencies"])
+    expected = latency["sent"] * (players - 1)
+    return {
+        "latency_p50_ms": _percentile(latencies, 0.5),
+        "latency_p99_ms": _percentile(latencies, 0.99),
+        "latency_delivered_ratio": latency["received"] / expected if expected else None,
+        "throughput_sent_per_second": throughput["sent"] / throughput["seconds"],
+        "throughput_delivered_per_second": throughput["received"] / throughput["seconds"],
+        "throughput_cpu_us_per_delivery": cpu / throughput["received"] * 1e6 if throughput["received"] else None,
+        "throughput_queued": queued,
+        "throughput_dropped": dropped,
+        "throughput_round_timeouts": throughput["timeouts"],
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, old_path: str):
+    """Prints the relative change of every value against an older result file."""
+    with open(old_path) as f:
+        old = json.load(f)
+    print(f"\nChange against {old_path} (commit {old.get('commit')}), negative = faster / lower:")
+    old_by_players = {entry["players"]: entry for entry in old.get("results", [])}
+    keys = ["broadcast_us_per_delivery", "receive_us_per_message", "latency_p50_ms", "latency_p99_ms",
+            "throughput_delivered_per_second", "throughput_cpu_us_per_delivery"]
+    print(f"{'players':>7} | " + " | ".join(f"{key[:20]:>20}" for key in keys))
+    for entry in results["results"]:
+        before = old_by_players.get(entry["players"])
+        if before is None:
+            continue
+        changes = []
+        for key in keys:
+            if entry.get(key) is None or not before.get(key):
+                changes.append(f"{'-':>20}")
+            else:
+                changes.append(f"{(entry[key] / before[key] - 1) * 100:+19.1f}%")
+        print(f"{entry['players']:7d} | " + " | ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, nargs="+", default=[2, 4, 8, 16, 32, 64, 128, 256])
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration of the latency and the throughput phase")
+    parser.add_argument("--latency-load", type=float, default=DEFAULT_LATENCY_LOAD, help="Deliveries per second in the latency phase")
+    parser.add_argument("--output", default="fanout.json", help="Result file")
+    parser.add_argument("--compare", default=None, help="Older result file to compare with")
+    args = parser.parse_args()
+
+    results = {
+        "commit": _git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "json_path": measure_json_path(),
+        "results": [],
+    }
+    json_path = results["json_path"]
+    print(f"JSON path ({json_path['serializer']}): encode {json_path['encode_us']:.2f} us, decode {json_path['decode_us']:.2f} us per state")
+    print(f"{'players':>7} | {'broadcast':>12} | {'receive':>12} | {'p50':>8} | {'p99':>8} | {'delivered/s':>11} | {'CPU/delivery':>12} | {'dropped':>7}")
+
+    # Silence the per-connection prints of the server
+    stdout = sys.stdout
+    for players in args.players:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            entry = {
+                "players": players,
+                "broadcast_us_per_delivery": measure_broadcast(players),
+                "receive_us_per_message": measure_receive(players),
+            }
+            entry.update(measure_loopback(players, args.seconds, args.latency_load))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        results["results"].append(entry)
+        print(f"{players:7d} | {entry['broadcast_us_per_delivery']:9.2f} us | {entry['receive_us_per_message']:9.1f} us | "
+              f"{entry['latency_p50_ms'] or 0:5.2f} ms | {entry['latency_p99_ms'] or 0:5.2f} ms | "
+              f"{entry['throughput_delivered_per_second']:11.0f} | {entry['throughput_cpu_us_per_delivery'] or 0:9.2f} us | "
+              f"{entry['throughput_dropped']:7d}")
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Compares the old receive-buffer framing with the zero-copy FrameBuffer on bursty input.
+
+A burst of messages (e.g. a client that was stalled, or a whole tick of states
+arriving at once) is written into a socketpair and read by two receivers:
+
+* ``legacy``: ``recv(n)``, ``buffer += data`` and ``buffer.split`` per frame,
+  like the receive loops before the FrameBuffer. The larger the reads, the
+  more of the buffer is copied again for every frame.
+* ``framebuffer``: ``recv_into`` a preallocated bytearray and memoryview frames
+  (``Shared/FrameBuffer.py``).
+
+Only framing is measured, the frames are not decoded.
+
+Usage (from the repository root):
+    python Benchmarks/bench_framing.py [--burst 5000] [--rounds 20] [--legacy-recv-size 1024]
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from FrameBuffer import FrameBuffer
+from Protocol import LENGTH, BinaryCodec, JsonCodec
+
+STATE = {
+    "id": 1, "name": "bench", "x": 1234.5, "y": -42.25, "angle": 90.0, "is_drifting": False,
+    "car_color": [255, 0, 0], "points": 17.0, "is_boosting": True, "speed_kmh": 88.0
+}
+
+
+def legacy_json(sock, total, recv_size):
+    buffer = b""
+    frames = 0
+    received = 0
+    while received < total:
+        data = sock.recv(recv_size)
+        received += len(data)
+        buffer += data
+        while b'\n' in buffer:
+            line, buffer = buffer.split(b'\n', 1)
+            frames += 1
+    return frames
+
+
+def legacy_binary(sock, total, recv_size):
+    buffer = b""
+    frames = 0
+    received = 0
+    while received < total:
+        data = sock.recv(recv_size)
+        received += len(data)
+        buffer += data
+        while len(buffer) >= LENGTH.size:
+            (length,) = LENGTH.unpack_from(buffer)
+            end = LENGTH.size + length
+            if len(buffer) < end:
+                break
+            frame = buffer[LENGTH.size:end]
+            buffer = buffer[end:]
+            frames += 1
+    return frames
+
+
+def framebuffer_json(sock, total, recv_size=None):
+    buffer = FrameBuffer()
+    frames = 0
+    received = 0
+    while received < total:
+        received += buffer.recv_into(sock)
+        while buffer.next_line() is not None:
+            frames += 1
+    return frames
+
+
+def framebuffer_binary(sock, total, recv_size=None):
+    buffer = FrameBuffer()
+    frames = 0
+    received = 0
+    while received < total:
+        received += buffer.recv_into(sock)
+        while buffer.next_length_prefixed(LENGTH) is not None:
+            frames += 1
+    return frames
+
+
+def measure(receiver, payload, burst, rounds, recv_size=None):
+    """Returns the average time in seconds to receive and split one burst."""
+    total = 0.0
+    for _ in range(rounds):
+        reader, writer = socket.socketpair()
+        # Large enough to hold the whole burst, so it is already waiting when reading starts
+        reader.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * len(payload))
+        writer.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4 * len(payload))
+        sender = threading.Thread(target=writer.sendall, args=(payload,))
+        sender.start()
+        time.sleep(0.01)
+        start = time.perf_counter()
+        frames = receiver(reader, len(payload), recv_size)
+        total += time.perf_counter() - start
+        sender.join()
+        reader.close()
+        writer.close()
+        assert frames == burst, f"{receiver.__name__} got {frames} of {burst} frames"
+    return total / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--burst", type=int, default=5000, help="Messages per burst")
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--legacy-recv-size", type=int, default=1024, help="recv() size of the legacy receiver")
+    args = parser.parse_args()
+
+    cases = [
+        ("json", JsonCodec().encode(STATE), legacy_json, framebuffer_json),
+        ("bin1", BinaryCodec().encode(STATE), legacy_binary, framebuffer_binary),
+    ]
+    for protocol, message, legacy, framebuffer in cases:
+        payload = message * args.burst
+        legacy_time = measure(legacy, payload, args.burst, args.rounds, args.legacy_recv_size)
+        framebuffer_time = measure(framebuffer, payload, args.burst, args.rounds)
+        print(f"{protocol:>4} | {args.burst} messages ({len(payload) / 1024:.0f} KiB) | "
+              f"legacy {legacy_time * 1000:7.2f} ms | framebuffer {framebuffer_time * 1000:7.2f} ms | "
+              f"{legacy_time / framebuffer_time:5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Compares how many players the threaded and the asyncio server can relay at 60 Hz.
+
+For every server mode the benchmark starts the server in its own process and
+connects an increasing number of simulated players. Every player sends one
+state message per frame (60 Hz) and counts the messages it receives. A player
+count is considered sustained if the players receive at least 95% of the
+expected (N - 1) * 60 messages per second.
+
+Usage (from the repository root):
+    python Benchmarks/bench_max_players.py [--duration 3] [--max-players 256]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server'))
+
+FPS = 60
+SUSTAINED_RATIO = 0.95
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_server(mode, port):
+    from CarGameServer import CarGameServer
+    from AsyncCarGameServer import AsyncCarGameServer
+
+    # Silence the per-connection prints of the server
+    sys.stdout = open(os.devnull, 'w')
+    server_class = AsyncCarGameServer if mode == "asyncio" else CarGameServer
+    server = server_class(host="127.0.0.1", port=port)
+    server.start()
+
+
+async def _player(index, port, duration, received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    message = {
+        "name": f"bench{index}", "x": 0.0, "y": 0.0, "angle": 0.0, "is_drifting": False,
+        "car_color": [255, 0, 0], "points": 0, "is_boosting": False, "speed_kmh": 0.0
+    }
+
+    async def read_loop():
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            received[index] += data.count(b'\n')
+
+    read_task = asyncio.create_task(read_loop())
+    next_frame = time.perf_counter()
+    end = next_frame + duration
+    while time.perf_counter() < end:
+        message["x"] += 1.0
+        writer.write((json.dumps(message) + '\n').encode('utf-8'))
+        next_frame += 1 / FPS
+        await asyncio.sleep(max(0.0, next_frame - time.perf_counter()))
+    read_task.cancel()
+    writer.close()
+
+
+async def _run_players(port, players, duration):
+    received = [0] * players
+    await asyncio.gather(*(_player(i, port, duration, received) for i in range(players)))
+    return sum(received)
+
+
+def measure(mode, players, duration):
+    """Returns the ratio of delivered to expected messages for one player count."""
+    port = _free_port()
+    server = multiprocessing.Process(target=_run_server, args=(mode, port), daemon=True)
+    server.start()
+    time.sleep(0.5)
+    try:
+        delivered = asyncio.run(_run_players(port, players, duration))
+    finally:
+        server.terminate()
+        server.join()
+    expected = players * (players - 1) * FPS * duration
+    return delivered / expected if expected else 1.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds to measure per player count")
+    parser.add_argument("--max-players", type=int, default=256)
+    args = parser.parse_args()
+
+    results = {}
+    for mode in ("threaded", "asyncio"):
+        max_sustained = 0
+        players = 2
+        while players <= args.max_players:
+            ratio = measure(mode, players, args.duration)
+            print(f"{mode:>8} | {players:4d} players | {ratio * 100:6.1f}% delivered")
+            if ratio < SUSTAINED_RATIO:
+                break
+            max_sustained = players
+            players *= 2
+        results[mode] = max_sustained
+
+    print()
+    for mode, players in results.items():
+        print(f"{mode:>8}: max sustained players at {FPS} Hz = {players}")
+
+
+if __name__ == "__main__":
+    main()
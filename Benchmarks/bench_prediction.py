@@ -0,0 +1,120 @@
+"""
+Measures the client-side cost of reconciling a server correction.
+
+A client and an authoritative server are simulated in virtual time without
+network I/O: the client predicts its car every physics step and records it
+in a PredictionBuffer, the inputs reach the server half an RTT later, and the
+server's corrections (one per tick) reach the client another half RTT later.
+At 200 ms RTT a correction is about 12 steps behind the client's prediction.
+
+* ``exact``: the server simulates the same inputs, every prediction is right
+  and a correction only drops the acknowledged steps
+* ``mismatch``: the server moves the car a little before every correction
+  (as a collision would), so every correction rewinds and replays all
+  unacknowledged steps
+
+Usage (from the repository root):
+    python Benchmarks/bench_prediction.py [--rtt 50 100 200 300] [--seconds 60] [--tick-rate 30]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Client'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CarPhysics import CarPhysics, PHYSICS_RATE, INPUT_ACCELERATE, INPUT_LEFT, INPUT_RIGHT, INPUT_DRIFT, INPUT_NITRO
+from PredictionBuffer import PredictionBuffer
+
+# How far the server moves the car before every correction in the mismatch mode
+MISMATCH_OFFSET = 0.5
+
+
+def input_pattern(steps: int, seed: int = 1) -> list:
+    """Returns a driving-like input bitmask per step (mostly accelerating, changing steering)."""
+    rng = random.Random(seed)
+    inputs = []
+    bits = INPUT_ACCELERATE
+    for step in range(steps):
+        if step % 20 == 0:
+            bits = INPUT_ACCELERATE | rng.choice([0, INPUT_LEFT, INPUT_RIGHT])
+            bits |= INPUT_DRIFT if rng.random() < 0.2 else 0
+            bits |= INPUT_NITRO if rng.random() < 0.1 else 0
+        inputs.append(bits)
+    return inputs
+
+
+def run(rtt: float, steps: int, tick_rate: float, mismatch: bool) -> dict:
+    """Simulates one session and returns the reconcile timings."""
+    delay = round(rtt / 2 * PHYSICS_RATE)       # one-way latency in steps
+    steps_per_tick = max(1, round(PHYSICS_RATE / tick_rate))
+    inputs = input_pattern(steps)
+    client_car = CarPhysics()
+    server_car = CarPhysics()
+    buffer = PredictionBuffer()
+    in_flight = deque()     # (arrival step, correction)
+    timings = []
+
+    for step in range(steps):
+        # Server: simulates the input the client sent delay steps ago
+        if step >= delay:
+            seq = step - delay + 1
+            server_car.step(inputs[seq - 1])
+            if step % steps_per_tick == 0:
+                if mismatch:
+                    server_car.x += MISMATCH_OFFSET
+                correction = {"event": "correction", "seq": seq}
+                correction.update(server_car.get_physics_state())
+                in_flight.append((step + delay, correction))
+
+        # Client: applies the corrections that arrived, then predicts the next step
+        while in_flight and in_flight[0][0] <= step:
+            correction = in_flight.popleft()[1]
+            start = time.perf_counter()
+            buffer.reconcile(client_car, correction)
+            timings.append(time.perf_counter() - start)
+        client_car.step(inputs[step])
+        buffer.record(step + 1, inputs[step], client_car)
+
+    return {
+        "timings": timings,
+        "replays": buffer.replays,
+        "replayed_steps": buffer.replayed_steps,
+    }
+
+
+def measure_step_cost(steps: int = 20000) -> float:
+    """Returns the CPU time of one physics step (seconds) for reference."""
+    car = CarPhysics()
+    inputs = input_pattern(steps)
+    start = time.perf_counter()
+    for bits in inputs:
+        car.step(bits)
+    return (time.perf_counter() - start) / steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rtt", type=float, nargs="+", default=[50, 100, 200, 300], help="Round trip times in ms")
+    parser.add_argument("--seconds", type=float, default=60, help="Simulated session length")
+    parser.add_argument("--tick-rate", type=float, default=30, help="Corrections per second")
+    args = parser.parse_args()
+
+    steps = int(args.seconds * PHYSICS_RATE)
+    print(f"physics step: {measure_step_cost() * 1e6:.1f} us, frame budget at {PHYSICS_RATE} FPS: {1e6 / PHYSICS_RATE:.0f} us")
+    print(f"{'RTT':>6} | {'mode':>8} | {'corrections':>11} | {'replayed steps':>14} | {'mean':>9} | {'p99':>9} | {'max':>9}")
+    for rtt in args.rtt:
+        for mismatch in (False, True):
+            result = run(rtt / 1000, steps, args.tick_rate, mismatch)
+            timings = sorted(result["timings"])
+            per_replay = result["replayed_steps"] / result["replays"] if result["replays"] else 0
+            p99 = timings[int(len(timings) * 0.99)]
+            print(f"{rtt:4.0f}ms | {'mismatch' if mismatch else 'exact':>8} | {len(timings):11d} | {per_replay:14.1f} | "
+                  f"{statistics.mean(timings) * 1e6:7.1f}us | {p99 * 1e6:7.1f}us | {timings[-1] * 1e6:7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
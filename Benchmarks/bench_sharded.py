@@ -0,0 +1,156 @@
+"""
+Load test of the sharded server: message throughput against the number of worker processes.
+
+The ShardedCarGameServer is started in its own process with 1, 2, 4, ...
+workers. Simulated players join several rooms (every room gets its own
+worker as long as there are enough workers) and send one state per frame
+(60 Hz). The players are spread over several client processes, so the load
+generator isn't limited to one core either. The result is the number of
+relayed messages the players received per second.
+
+The server is built like ``Server/main.py --headless --workers N`` builds it
+(see create_server), including the admin interface as UI callback. The
+messages the workers forward to it are counted: only joins, leaves and
+player infos go through the acceptor, the states stay in the workers.
+
+Throughput can only scale with the worker count up to the number of cores
+that are left next to the client processes.
+
+Usage (from the repository root):
+    python Benchmarks/bench_sharded.py [--rooms 8] [--players 12] [--duration 5] [--max-workers 4]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server'))
+
+FPS = 60
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _run_server(workers, port, stop_event, forwarded):
+    import threading
+    from main import create_server, parse_args
+    from ServerLog import ServerLog
+
+    # Silence the per-connection prints of the server, on file descriptor level so the workers inherit it
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    server, admin = create_server(parse_args(["--headless", "--workers", str(workers), "--admin-port", "0"]), ServerLog(), port=port)
+    on_message = admin.on_message
+
+    def count_forwarded(message: dict):
+        forwarded.value += 1
+        on_message(message)
+
+    admin.on_message = count_forwarded
+    admin.start()
+    threading.Thread(target=server.start, daemon=True).start()
+    stop_event.wait()
+    # Also stops the worker processes
+    server.stop()
+
+
+async def _player(room, index, port, duration, received):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    name = f"bench{room}-{index}"
+    hello = {"event": "hello", "name": name, "car_color": [255, 0, 0], "protocols": ["json"], "room": f"room{room}"}
+    writer.write((json.dumps(hello) + '\n').encode('utf-8'))
+    message = {
+        "name": name, "x": 0.0, "y": 0.0, "angle": 0.0, "is_drifting": False,
+        "car_color": [255, 0, 0], "points": 0, "is_boosting": False, "speed_kmh": 0.0
+    }
+
+    async def read_loop():
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                return
+            received[0] += data.count(b'\n')
+
+    read_task = asyncio.create_task(read_loop())
+    next_frame = time.perf_counter()
+    end = next_frame + duration
+    while time.perf_counter() < end:
+        message["x"] += 1.0
+        writer.write((json.dumps(message) + '\n').encode('utf-8'))
+        next_frame += 1 / FPS
+        await asyncio.sleep(max(0.0, next_frame - time.perf_counter()))
+    read_task.cancel()
+    writer.close()
+
+
+async def _run_players(rooms, players, port, duration):
+    received = [0]
+    await asyncio.gather(*(_player(room, i, port, duration, received) for room in rooms for i in range(players)))
+    return received[0]
+
+
+def _client_process(rooms, players, port, duration, results):
+    results.put(asyncio.run(_run_players(rooms, players, port, duration)))
+
+
+def measure(workers, rooms, players, duration, client_processes):
+    """Returns the relayed messages per second the players received and the number of messages forwarded to the UI callback."""
+    port = _free_port()
+    stop_event = multiprocessing.Event()
+    forwarded = multiprocessing.Value('i', 0)
+    # Not a daemon process, those can't start the worker processes
+    server = multiprocessing.Process(target=_run_server, args=(workers, port, stop_event, forwarded))
+    server.start()
+    # Workers are spawned, give them time to start
+    time.sleep(1.0 + 0.2 * workers)
+    results = multiprocessing.Queue()
+    clients = []
+    for i in range(client_processes):
+        process = multiprocessing.Process(
+            target=_client_process,
+            args=(list(range(i, rooms, client_processes)), players, port, duration, results)
+        )
+        process.start()
+        clients.append(process)
+    try:
+        delivered = sum(results.get(timeout=duration + 30) for _ in clients)
+    finally:
+        for process in clients:
+            process.join()
+        stop_event.set()
+        server.join()
+    return delivered / duration, forwarded.value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, default=8)
+    parser.add_argument("--players", type=int, default=12, help="Players per room")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to measure per worker count")
+    parser.add_argument("--max-workers", type=int, default=max(2, os.cpu_count() or 1))
+    parser.add_argument("--client-processes", type=int, default=None, help="Processes running the players (default: half the cores)")
+    args = parser.parse_args()
+    client_processes = min(args.rooms, args.client_processes or max(1, (os.cpu_count() or 1) // 2))
+
+    expected = args.rooms * args.players * (args.players - 1) * FPS
+    print(f"{args.rooms} rooms x {args.players} players, {client_processes} client processes, "
+          f"{os.cpu_count()} cores, expected {expected} messages/s")
+    baseline = None
+    workers = 1
+    while workers <= args.max_workers:
+        throughput, forwarded = measure(workers, args.rooms, args.players, args.duration, client_processes)
+        baseline = baseline or throughput
+        print(f"{workers:3d} workers | {throughput:10.0f} messages/s | {throughput / expected * 100:6.1f}% delivered | "
+              f"{throughput / baseline:5.2f}x | {forwarded} UI messages")
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,28 @@
+import os
+import sys
 import socket
 import threading
-import json
+import itertools
+import time
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from Protocol import JsonCodec, ProtocolError, SUPPORTED_PROTOCOLS, create_codec, decode_datagram, encode_datagram
+from SendRateLimiter import SendRateLimiter
+
+HANDSHAKE_TIMEOUT = 2.0
+UDP_PROBE_INTERVAL = 0.5
+MAX_WORLD_HISTORY = 64
+# RTT measurement for the send rate adaption
+PING_INTERVAL = 1.0
+# Inputs that weren't acknowledged yet are sent again, at most this many per message
+MAX_INPUTS_PER_MESSAGE = 32
 
 class CarGameClient:
     """Client for connecting to the car game server."""
 
-    def __init__(self, server_ip, server_port, player_name, car_color: list[int], error_close_function):
+    def __init__(self, server_ip, server_port, player_name, car_color: list[int], error_close_function, protocols=None, use_udp=True, use_delta=True, room=None, send_rate=60,
+                 use_inputs=True):
         self.server_ip = server_ip
         self.server_port = server_port
         self.player_name = player_name
@@ -14,54 +31,133 @@ class CarGameClient:
         self.receive_thread = None
         self.car_color = car_color
 
+        # Latest state per player, keyed by the session ID (by name on servers without IDs)
         self.other_players = {}
         self.on_player_update = None
         self.on_player_disconnect = None
+        self.on_player_out_of_range = None
 
         self.error_close_function = error_close_function
 
+        # Room to join on servers with rooms (None = the server's default room)
+        self.room = room
+
+        # Wire protocol, negotiated in handshake()
+        self.protocols = SUPPORTED_PROTOCOLS if protocols is None else protocols
+        self.codec = JsonCodec()
+        self.player_id = None
+        self.sent_info = None
+
+        # Optional UDP state channel, offered by the server in the welcome message
+        self.use_udp = use_udp
+        self.udp_sock = None
+        self.udp_token = None
+        self.udp_ready = False
+        self.udp_send_seq = itertools.count(1)
+        self.udp_recv_seq = 0
+        self.last_udp_probe = 0
+
+        # Delta compressed snapshots: tick -> {player id: state} of the worlds received
+        self.use_delta = use_delta
+        self.world_history = {}
+
+        # States are sent at send_rate at most and only when they changed (see SendRateLimiter)
+        self.rate_limiter = SendRateLimiter(send_rate)
+        self.last_ping = 0
+
+        # Server-side simulation: only inputs are sent if the server is authoritative (see CarPhysics)
+        self.use_inputs = use_inputs
+        self.authoritative = False
+        self.input_seq = 0
+        self.sent_input_seq = 0
+        self.pending_inputs = deque(maxlen=MAX_INPUTS_PER_MESSAGE)     # (seq, bitmask) not acknowledged yet
+        self.input_lock = threading.Lock()
+        self.latest_correction = None
+
+        # receive threads send acks while the game loop sends states
+        self.send_lock = threading.Lock()
+
     def connect(self):
         """Establish connection to the server and start listening thread."""
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.connect((self.server_ip, self.server_port))
+        self.handshake()
         self.running = True
         self.receive_thread = threading.Thread(target=self.receive_loop, daemon=True)
         self.receive_thread.start()
-        print(f"[INFO] Connected to server at {self.server_ip}:{self.server_port}")
+        if self.udp_sock:
+            threading.Thread(target=self.udp_receive_loop, daemon=True).start()
+        print(f"[INFO] Connected to server at {self.server_ip}:{self.server_port} (protocol: {self.codec.name})")
+
+    def handshake(self):
+        """Negotiates the wire protocol with the server. Falls back to JSON if the server doesn't answer."""
+        hello = {
+            "event": "hello",
+            "name": self.player_name,
+            "car_color": self.car_color,
+            "protocols": self.protocols,
+            "udp": self.use_udp,
+            "delta": self.use_delta,
+            "inputs": self.use_inputs
+        }
+        if self.room:
+            hello["room"] = self.room
+        self.sock.sendall(self.codec.encode(hello))
+        deadline = time.monotonic() + HANDSHAKE_TIMEOUT
+        try:
+            while True:
+                frame = self.codec.next_frame()
+                if frame is None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise socket.timeout()
+                    self.sock.settimeout(remaining)
+                    if not self.codec.recv_into(self.sock):
+                        raise ConnectionError("Server closed the connection during handshake")
+                    continue
+
+                message = self.codec.decode(frame)
+                if message.get("event") != "welcome":
+                    # Sent before the server processed our hello (or an older server without negotiation)
+                    self.handle_message(message)
+                    continue
+
+                self.player_id = message["id"]
+                self.sent_info = (self.player_name, list(self.car_color))
+                self.authoritative = bool(message.get("authoritative"))
+                codec = create_codec(message.get("protocol"))
+                codec.feed(self.codec.buffer.pending())
+                self.codec = codec
+                if "udp_port" in message:
+                    self.udp_token = message["udp_token"]
+                    self.udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    self.udp_sock.connect((self.server_ip, message["udp_port"]))
+                break
+        except socket.timeout:
+            print("[WARN] Server did not answer the handshake, using JSON")
+        except ProtocolError as e:
+            print(f"[WARN] Invalid handshake answer, using JSON: {e}")
+        finally:
+            self.sock.settimeout(None)
 
     def receive_loop(self):
         """Listen for incoming messages from server."""
-        buffer = ""
         while self.running:
             try:
-                data = self.sock.recv(1024)
-                if not data:
+                if not self.codec.recv_into(self.sock):
                     break
 
-                buffer += data.decode('utf-8')
-
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if not line.strip():
-                        continue
+                while True:
+                    frame = self.codec.next_frame()
+                    if frame is None:
+                        break
 
                     try:
-                        message = json.loads(line)
-
-                        if "event" in message:
-                            self.event_handler(message)
-                            continue
-
-                        name = message.get("name")
-                        if name == self.player_name:
-                            continue
-
-                        self.other_players[name] = message
-                        if self.on_player_update:
-                            self.on_player_update(name, message)
-
-                    except json.JSONDecodeError:
-                        print(f"[WARN] Received invalid JSON: {line}")
+                        message = self.codec.decode(frame)
+                    except ProtocolError as e:
+                        print(f"[WARN] Received invalid data: {e}")
+                        continue
+                    self.handle_message(message)
             except ConnectionResetError:
                 print("[ERROR] Server connection lost (ConnectionResetError)")
                 self.error_close_function("ConnectionResetError")
@@ -69,40 +165,260 @@ class CarGameClient:
 
         self.running = False
 
+    def udp_receive_loop(self):
+        """Listen for states and snapshots sent over the UDP channel."""
+        while self.running:
+            try:
+                data = self.udp_sock.recv(2048)
+                token, sequence, frame = decode_datagram(data)
+            except ProtocolError:
+                continue
+            except OSError:
+                # Socket closed or ICMP port unreachable
+                if not self.running:
+                    break
+                continue
+
+            if token != self.udp_token or frame is None:
+                continue
+            if sequence <= self.udp_recv_seq:
+                # Stale datagram, a newer state was already applied
+                continue
+            self.udp_recv_seq = sequence
+
+            try:
+                message = self.codec.decode(frame)
+            except ProtocolError as e:
+                print(f"[WARN] Received invalid datagram: {e}")
+                continue
+            self.handle_message(message)
+
+    def handle_message(self, message: dict):
+        event = message.get("event")
+        if event == "snapshot":
+            # One combined world snapshot per server tick
+            for player_state in message.get("players", []):
+                self.player_state_handler(player_state)
+        elif event == "delta":
+            self.delta_handler(message)
+        elif event == "player_info":
+            # Names and colors of binary states are resolved by the codec
+            pass
+        elif event == "pong":
+            self.pong_handler(message)
+        elif event == "correction":
+            self.correction_handler(message)
+        elif event is not None:
+            self.event_handler(message)
+        else:
+            self.player_state_handler(message)
+
     def send_player_state(self, x, y, angle, is_drifting, car_color, points, is_boosting, speed_kmh):
         """Send the local player's position/state to the server."""
         if not self.running:
             return
         try:
+            self.send_player_info(car_color)
+
             message = {
-                "name": self.player_name,
                 "x": x,
                 "y": y,
                 "angle": angle,
                 "is_drifting": is_drifting,
-                "car_color": car_color,
                 "points" : points,
                 "is_boosting" : is_boosting,
                 "speed_kmh" : speed_kmh
             }
-            # send JSON with newline delimiter
-            self.sock.sendall((json.dumps(message) + '\n').encode('utf-8'))
+            if self.player_id is not None:
+                # The server knows name and color from the hello and player_info messages
+                message["id"] = self.player_id
+            else:
+                message["name"] = self.player_name
+                message["car_color"] = car_color
+
+            now = time.monotonic()
+            self.send_ping(now)
+            if not self.rate_limiter.should_send(now, message):
+                return
+            self.send_unreliable(message)
         except Exception as e:
             print(f"[ERROR] Failed to send data: {e}")
             self.running = False
 
+    def send_input(self, inputs: int, car_color, idle=False):
+        """
+        Records the input bitmask of one physics step and sends the inputs the server didn't acknowledge yet.
+
+        Only used if the server is authoritative (see CarPhysics).
+
+        :param inputs: Bitmask of the INPUT_* bits of this step
+        :param idle: The car stood still before the step, steps without input aren't sent then (the server steps them on its own)
+        :return: Sequence number of the step or None if it isn't sent
+        """
+        if not self.running:
+            return None
+        seq = None
+        try:
+            self.send_player_info(car_color)
+            now = time.monotonic()
+            self.send_ping(now)
+            with self.input_lock:
+                if inputs or not idle:
+                    self.input_seq += 1
+                    seq = self.input_seq
+                    self.pending_inputs.append((seq, inputs))
+                if self.udp_sock and self.udp_ready:
+                    # Datagrams can get lost, so every datagram repeats all unacknowledged inputs
+                    unsent = list(self.pending_inputs)
+                else:
+                    unsent = [entry for entry in self.pending_inputs if entry[0] > self.sent_input_seq]
+                if not unsent or not self.rate_limiter.due(now):
+                    return seq
+                self.sent_input_seq = self.input_seq
+                message = {"event": "input", "seq": unsent[0][0], "inputs": [bits for _, bits in unsent]}
+            self.send_unreliable(message)
+        except Exception as e:
+            print(f"[ERROR] Failed to send data: {e}")
+            self.running = False
+        return seq
+
+    def send_player_info(self, car_color):
+        if self.player_id is not None and (self.player_name, list(car_color)) != self.sent_info:
+            # Name and color are only sent when they change
+            self.sent_info = (self.player_name, list(car_color))
+            self.send({"event": "player_info", "id": self.player_id, "name": self.player_name, "car_color": car_color})
+
+    def send_ping(self, now: float):
+        if self.player_id is not None and now - self.last_ping > PING_INTERVAL:
+            # Servers without handshake don't know pings
+            self.last_ping = now
+            self.send({"event": "ping", "time": now})
+
+    def send_unreliable(self, message: dict):
+        """Sends a state or inputs over UDP once the server confirmed the UDP path, over TCP until then."""
+        if self.udp_sock and self.udp_ready:
+            self.send_datagram(self.codec.encode(message))
+            return
+        elif self.udp_sock and time.monotonic() - self.last_udp_probe > UDP_PROBE_INTERVAL:
+            # Until the server confirms the UDP path, states go over TCP
+            self.last_udp_probe = time.monotonic()
+            self.send_datagram()
+        self.send(message)
+
+    def send_viewport(self, width, height):
+        """Reports the window size, the server only sends players that can be visible in it."""
+        if not self.running:
+            return
+        try:
+            self.send({"event": "viewport", "width": width, "height": height})
+        except OSError as e:
+            print(f"[ERROR] Failed to send data: {e}")
+
+    def send(self, message: dict):
+        """Sends a message over the TCP connection."""
+        data = self.codec.encode(message)
+        with self.send_lock:
+            self.sock.sendall(data)
+
+    def send_datagram(self, frame: bytes = b""):
+        try:
+            self.udp_sock.send(encode_datagram(self.udp_token, next(self.udp_send_seq), frame))
+        except OSError:
+            # Unreliable channel, the next state replaces this one anyway
+            pass
+
+    def delta_handler(self, message: dict):
+        """Applies a delta to the acknowledged baseline world it refers to and acknowledges the result."""
+        tick = message["tick"]
+        base_tick = message["base"]
+        if base_tick == 0:
+            base = {}
+        elif base_tick in self.world_history:
+            base = self.world_history[base_tick]
+        else:
+            # Baseline unknown (shouldn't happen), ask for a full state
+            self.send({"event": "resync"})
+            return
+
+        world = dict(base)
+        for changes in message.get("players", []):
+            state = {**world.get(changes["id"], {}), **changes}
+            world[changes["id"]] = state
+            self.player_state_handler(state)
+
+        # The server never builds deltas against ticks older than this base again
+        for old_tick in [t for t in self.world_history if t < base_tick]:
+            del self.world_history[old_tick]
+        self.world_history[tick] = world
+        if len(self.world_history) > MAX_WORLD_HISTORY:
+            del self.world_history[min(self.world_history)]
+        try:
+            self.send({"event": "ack", "tick": tick})
+        except OSError:
+            pass
+
+    def pong_handler(self, message: dict):
+        """Measures the RTT of a ping and applies the rate limit the server sent along."""
+        sent_time = message.get("time")
+        if isinstance(sent_time, (int, float)):
+            self.rate_limiter.add_rtt_sample(time.monotonic() - sent_time)
+        if "max_rate" in message:
+            self.rate_limiter.set_server_max_rate(message["max_rate"])
+
+    def correction_handler(self, message: dict):
+        """Forgets the inputs the server simulated and keeps the correction for the game loop (see take_correction)."""
+        with self.input_lock:
+            while self.pending_inputs and self.pending_inputs[0][0] <= message["seq"]:
+                self.pending_inputs.popleft()
+        self.latest_correction = message
+
+    def take_correction(self):
+        """Returns the newest correction of the server since the last call or None."""
+        correction, self.latest_correction = self.latest_correction, None
+        return correction
+
+    @staticmethod
+    def player_key(message: dict):
+        """Returns the session ID of the player a message is about (the name on servers without IDs)."""
+        player_id = message.get("id")
+        return player_id if player_id is not None else message.get("name")
+
+    def player_state_handler(self, message: dict):
+        if message.get("name") is None:
+            # player_info (TCP) not received yet, can happen with states sent over UDP
+            return
+        if self.player_id is not None:
+            if message.get("id") == self.player_id:
+                return
+        elif message["name"] == self.player_name:
+            return
+
+        key = self.player_key(message)
+        self.other_players[key] = message
+        if self.on_player_update:
+            self.on_player_update(key, message)
+
     def event_handler(self, message: dict):
         print(f'[INFO] Received Event: {message["event"]}')
         event = message.get("event")
 
-        if event == "disconnect":
-            self.on_player_disconnect(message.get("name"))
+        if event == "udp_ready":
+            self.udp_ready = True
+        elif event == "disconnect":
+            self.other_players.pop(self.player_key(message), None)
+            self.on_player_disconnect(self.player_key(message))
+        elif event == "out_of_range":
+            # No more updates until the player is close again
+            if self.on_player_out_of_range:
+                self.on_player_out_of_range(self.player_key(message))
         elif event == "kicked":
             self.error_close_function(f"You have been kicked from the Server. Reason: {message.get('reason', 'No reason specified by the Server.')}")
 
     def close(self):
         """Close the connection to the server."""
         self.running = False
+        if self.udp_sock:
+            self.udp_sock.close()
         if self.sock:
             self.sock.close()
             print("[INFO] Disconnected from server")
@@ -1,8 +1,14 @@
+import os
+import sys
 import time
 import pygame
 import math
 import random
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CarPhysics import CarPhysics, INPUT_ACCELERATE, INPUT_BRAKE, INPUT_LEFT, INPUT_RIGHT, INPUT_DRIFT, INPUT_NITRO
+from SnapshotInterpolation import SnapshotBuffer, DEFAULT_INTERPOLATION_DELAY
+
 # Colors
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -11,6 +17,22 @@ BLUE = (0, 0, 255)
 GREEN = (0, 255, 0)
 GRAY = (128, 128, 128)
 
+# Corrections of the server are blended in over a few frames (error left after each frame),
+# corrections larger than the snap distance are shown right away
+CORRECTION_SMOOTHING = 0.8
+CORRECTION_SNAP_DISTANCE = 100
+
+def input_bits(keys) -> int:
+    """Converts the pressed keys into the input bitmask of the physics (see CarPhysics)."""
+    return (
+        (INPUT_ACCELERATE if keys[pygame.K_w] else 0)
+        | (INPUT_BRAKE if keys[pygame.K_s] else 0)
+        | (INPUT_LEFT if keys[pygame.K_a] else 0)
+        | (INPUT_RIGHT if keys[pygame.K_d] else 0)
+        | (INPUT_DRIFT if keys[pygame.K_SPACE] else 0)
+        | (INPUT_NITRO if keys[pygame.K_LSHIFT] else 0)
+    )
+
 class SkidMark:
     def __init__(self, x, y, angle):
         self.x = x
@@ -46,7 +68,7 @@ class SkidMark:
 class MultiplayerCar:
     """A car controlled externally (e.g., via network) for multiplayer visualization."""
 
-    def __init__(self, x, y, name, car_color):
+    def __init__(self, x, y, name, car_color, interpolation_delay=DEFAULT_INTERPOLATION_DELAY):
         """
         Initialize a multiplayer car.
 
@@ -54,6 +76,7 @@ class MultiplayerCar:
         :param y: Initial y-position in world coordinates.
         :param name: String containing the player's name to render above the car.
         :param car_color: A List containing three integers between 0-255
+        :param interpolation_delay: Seconds the car is drawn in the past (see SnapshotBuffer)
         """
         self.x = x
         self.y = y
@@ -68,25 +91,54 @@ class MultiplayerCar:
         self.points = 0
         self.boosting = False
         self.speed_kmh = 0
+        # Received states, drawn with a delay so they can be interpolated
+        self.snapshots = SnapshotBuffer(interpolation_delay)
 
     def update_state(self, x, y, angle, car_color, drifting=False, visible=True, points=0, boosting=False, speed_kmh=0):
         """
         Update the car's position and rotation from external state.
 
+        The state is drawn after the interpolation delay (see interpolate),
+        hiding the car takes effect right away.
+
         :param x: New x-position.
         :param y: New y-position.
         :param angle: New angle (in degrees).
         :param drifting: Whether the car is drifting.
         """
-        self.x = x
-        self.y = y
-        self.angle = angle
-        self.is_drifting = drifting
         self.visible = visible
-        self.car_color = car_color
-        self.points = points
-        self.boosting = boosting
-        self.speed_kmh = speed_kmh
+        if not visible:
+            self.car_color = car_color
+            self.snapshots.clear()
+            return
+        self.snapshots.add(time.monotonic(), {
+            "x": x,
+            "y": y,
+            "angle": angle,
+            "car_color": car_color,
+            "is_drifting": drifting,
+            "points": points,
+            "boosting": boosting,
+            "speed_kmh": speed_kmh
+        })
+
+    def interpolate(self, now):
+        """
+        Moves the car to its interpolated state at the render time, called once per frame.
+
+        :param now: time.monotonic() of the frame
+        """
+        state = self.snapshots.sample(now)
+        if state is None:
+            return
+        self.x = state["x"]
+        self.y = state["y"]
+        self.angle = state["angle"]
+        self.car_color = state["car_color"]
+        self.is_drifting = state["is_drifting"]
+        self.points = state["points"]
+        self.boosting = state["boosting"]
+        self.speed_kmh = state["speed_kmh"]
 
 
     def draw(self, screen, camera):
@@ -112,61 +164,27 @@ class MultiplayerCar:
         name_rect = name_surface.get_rect(midbottom=(screen_x, screen_y - self.height // 2 - 5))
         screen.blit(name_surface, name_rect)
 
-class Car:
+class Car(CarPhysics):
+    """The local player's car: the shared physics plus skid marks, nitro flames and drawing."""
+
     def __init__(self, x, y, car_color, max_speed: int, acceleration: float, turn_speed: float, drift_turn_speed: float, max_nitro: int):
-        self.x = x
-        self.y = y
-        self.angle = 0
-        self.velocity_x = 0
-        self.velocity_y = 0
-        self.max_speed = max_speed
-        self.acceleration = acceleration
-        self.friction = 0.1
-        self.turn_speed = turn_speed
-        self.drift_turn_speed = drift_turn_speed
-        self.is_drifting = False
+        super().__init__(x, y, max_speed, acceleration, turn_speed, drift_turn_speed, max_nitro)
         self.width = 30
         self.height = 15
         self.last_skid_time = 0
         self.skid_interval = 0.05
         self.car_color = car_color
-        self.current_nitro = max_nitro
-        self.nitro_active = False
-        self.nitro_acceleration_boost = 0.3  # zusätzliche Beschleunigung bei Nitro
-        self.nitro_usage_rate = 20.0  # ml pro Sekunde
+        # Input bitmask of the last update (see CarPhysics)
+        self.inputs = 0
+        # Difference between the drawn and the simulated car after a correction of the server
+        self.error_x = 0
+        self.error_y = 0
+        self.error_angle = 0
         
         # Flammen-Parameter für Nitro-Effekt
         self.flame_particles = []
         self.flame_spawn_timer = 0
 
-    def get_speed(self):
-        """Returns the Car's current speed in m/s"""
-        return math.sqrt(self.velocity_x**2 + self.velocity_y**2)
-    
-    def get_speed_kmh(self):
-        """Returns the Car's current speed in km/h"""
-        return self.get_speed() * 3.6
-
-    def handle_nitro(self, keys, dt):
-        """
-        Handle nitro activation based on key input.
-
-        :param keys: Pressed key states
-        :param dt: Delta time in seconds (for frame-rate-independent consumption)
-        """
-        using_nitro = keys[pygame.K_LSHIFT] and self.current_nitro > 0
-        self.nitro_active = using_nitro
-
-        if using_nitro:
-            self.current_nitro -= self.nitro_usage_rate * dt
-            self.current_nitro = max(0, self.current_nitro)
-            
-            # Flammen-Partikel spawnen während Nitro aktiv ist
-            self.spawn_flame_particles(dt)
-        
-        # Flammen-Partikel aktualisieren (auch wenn Nitro nicht aktiv, damit sie auslaufen)
-        self.update_flame_particles(dt)
-
     def spawn_flame_particles(self, dt):
         """Spawnt Flammen-Partikel am Heck des Autos während Nitro aktiv ist"""
         self.flame_spawn_timer += dt
@@ -237,53 +255,58 @@ class Car:
         car_surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
         pygame.draw.rect(car_surface, self.car_color, (0, 0, self.width, self.height))
         pygame.draw.rect(car_surface, RED, (self.width - 5, 0, 5, self.height))
-        rotated_car = pygame.transform.rotate(car_surface, -self.angle)
-        screen_x, screen_y = camera.apply(self.x, self.y)
+        rotated_car = pygame.transform.rotate(car_surface, -(self.angle + self.error_angle))
+        screen_x, screen_y = camera.apply(*self.get_display_position())
         car_rect = rotated_car.get_rect(center=(screen_x, screen_y))
         screen.blit(rotated_car, car_rect)
 
     def update(self, keys, skid_marks, dt):
-        current_speed = math.sqrt(self.velocity_x**2 + self.velocity_y**2)
-        self.handle_nitro(keys, dt)
-        self.is_drifting = keys[pygame.K_SPACE] and current_speed > 1
-
-        if keys[pygame.K_w]:
-            accel = self.acceleration + (self.nitro_acceleration_boost if self.nitro_active else 0)
-            self.velocity_x += accel * math.cos(math.radians(self.angle))
-            self.velocity_y += accel * math.sin(math.radians(self.angle))
-        elif keys[pygame.K_s]:
-            self.velocity_x -= self.acceleration * 0.5 * math.cos(math.radians(self.angle))
-            self.velocity_y -= self.acceleration * 0.5 * math.sin(math.radians(self.angle))
-
-        if current_speed > 0.1:
-            turn_speed = self.drift_turn_speed if self.is_drifting else self.turn_speed
-            if keys[pygame.K_a]:
-                self.angle -= turn_speed
-            elif keys[pygame.K_d]:
-                self.angle += turn_speed
+        """
+        Advances the car by one physics step with the pressed keys.
 
-        if self.is_drifting:
-            self.velocity_x *= 0.96
-            self.velocity_y *= 0.96
-        else:
-            forward_x = math.cos(math.radians(self.angle))
-            forward_y = math.sin(math.radians(self.angle))
+        :param keys: Pressed key states
+        :param skid_marks: List the skid marks of a drift are added to
+        :param dt: Delta time in seconds (for the flame particles)
+        """
+        self.inputs = input_bits(keys)
+        self.step(self.inputs)
+        self.update_effects(skid_marks, dt)
+
+        self.error_x *= CORRECTION_SMOOTHING
+        self.error_y *= CORRECTION_SMOOTHING
+        self.error_angle *= CORRECTION_SMOOTHING
 
-            forward_velocity = self.velocity_x * forward_x + self.velocity_y * forward_y
-            sideways_velocity_x = self.velocity_x - forward_velocity * forward_x
-            sideways_velocity_y = self.velocity_y - forward_velocity * forward_y
+        if keys[pygame.K_c]:
+            self.car_color = [random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)]
 
-            sideways_velocity_x *= 0.3
-            sideways_velocity_y *= 0.3
-            forward_velocity *= 0.98
+    def get_display_position(self):
+        """Returns the position the car is drawn at (the camera follows it too)."""
+        return self.x + self.error_x, self.y + self.error_y
 
-            self.velocity_x = forward_velocity * forward_x + sideways_velocity_x
-            self.velocity_y = forward_velocity * forward_y + sideways_velocity_y
+    def apply_correction(self, dx, dy, dangle):
+        """
+        Keeps the drawn car in place after a correction moved the simulated car, the difference fades out.
 
-            current_speed = math.sqrt(self.velocity_x**2 + self.velocity_y**2)
-            if current_speed > self.max_speed:
-                self.velocity_x = (self.velocity_x / current_speed) * self.max_speed
-                self.velocity_y = (self.velocity_y / current_speed) * self.max_speed
+        :param dx: x difference by which the correction moved the car
+        :param dy: y difference by which the correction moved the car
+        :param dangle: Angle difference by which the correction turned the car
+        """
+        if math.hypot(self.error_x - dx, self.error_y - dy) > CORRECTION_SNAP_DISTANCE:
+            # Too far off to blend, e.g. after a desync
+            self.error_x = self.error_y = self.error_angle = 0
+            return
+        self.error_x -= dx
+        self.error_y -= dy
+        self.error_angle -= dangle
+
+    def update_effects(self, skid_marks, dt):
+        """Spawns skid marks and nitro flames for the current physics state."""
+        if self.nitro_active:
+            # Flammen-Partikel spawnen während Nitro aktiv ist
+            self.spawn_flame_particles(dt)
+        
+        # Flammen-Partikel aktualisieren (auch wenn Nitro nicht aktiv, damit sie auslaufen)
+        self.update_flame_particles(dt)
 
         if self.is_drifting:
             current_time = time.time()
@@ -301,9 +324,3 @@ class Car:
                 skid_marks.append(SkidMark(left_x, left_y, self.angle))
                 skid_marks.append(SkidMark(right_x, right_y, self.angle))
                 self.last_skid_time = current_time
-
-        if keys[pygame.K_c]:
-            self.car_color = [random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)]
-
-        self.x += self.velocity_x
-        self.y += self.velocity_y
@@ -0,0 +1,95 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CarPhysics import CarPhysics
+
+# Physics steps that can wait for their acknowledgement (about 4 seconds)
+DEFAULT_CAPACITY = 256
+
+# Predicted and corrected states closer than this count as equal
+STATE_EPSILON = 1e-6
+PHYSICS_FIELDS = ("x", "y", "angle", "velocity_x", "velocity_y", "nitro", "points")
+
+
+class PredictionBuffer:
+    """
+    Client-side prediction of the local car for an authoritative server.
+
+    The client simulates its car right away and remembers the input and the
+    predicted state of every step in a ring buffer (slot = seq % capacity,
+    the sequence numbers are consecutive). When a correction arrives for a
+    step whose prediction was right, the buffer only forgets the
+    acknowledged steps. Otherwise the car is reset to the corrected state
+    and all newer inputs are simulated again (replay). The returned error
+    lets the car blend the jump away over a few frames.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.seqs = [0] * capacity
+        self.inputs = [0] * capacity
+        self.states = [None] * capacity
+        self.acked_seq = 0
+        self.latest_seq = 0
+
+        # Statistics
+        self.corrections = 0
+        self.replays = 0
+        self.replayed_steps = 0
+
+    def __len__(self):
+        """Number of steps that are not acknowledged yet."""
+        return self.latest_seq - self.acked_seq
+
+    def record(self, seq: int, inputs: int, car: CarPhysics):
+        """
+        Remembers the input of a step and the state the car predicted with it.
+
+        :param seq: Sequence number the input was sent with
+        :param inputs: Input bitmask of the step
+        :param car: Car after the step
+        """
+        slot = seq % self.capacity
+        self.seqs[slot] = seq
+        self.inputs[slot] = inputs
+        self.states[slot] = car.get_physics_state()
+        self.latest_seq = seq
+        if seq - self.acked_seq > self.capacity:
+            # Unacknowledged steps were overwritten, the next correction can't be replayed exactly
+            self.acked_seq = seq - self.capacity
+
+    def reconcile(self, car: CarPhysics, correction: dict):
+        """
+        Applies a correction of the server to the predicted car.
+
+        :param car: The local car, reset and replayed if the prediction was wrong
+        :param correction: Correction message (state after the step ``seq``)
+        :return: Tuple (dx, dy, dangle) by which the car moved, (0, 0, 0) if the prediction was right
+        """
+        seq = correction["seq"]
+        if seq <= self.acked_seq or seq > self.latest_seq:
+            # Old or duplicated correction (the server sends one per tick, also without new inputs)
+            return 0, 0, 0
+        self.corrections += 1
+        slot = seq % self.capacity
+        predicted = self.states[slot] if self.seqs[slot] == seq else None
+        self.acked_seq = seq
+        if predicted is not None and self._matches(predicted, correction):
+            return 0, 0, 0
+
+        old_x, old_y, old_angle = car.x, car.y, car.angle
+        car.set_physics_state(correction)
+        self.replays += 1
+        for replay_seq in range(seq + 1, self.latest_seq + 1):
+            slot = replay_seq % self.capacity
+            car.step(self.inputs[slot])
+            self.states[slot] = car.get_physics_state()
+            self.replayed_steps += 1
+        return car.x - old_x, car.y - old_y, car.angle - old_angle
+
+    def _matches(self, predicted: dict, correction: dict) -> bool:
+        for field in PHYSICS_FIELDS:
+            if abs(predicted[field] - correction[field]) > STATE_EPSILON:
+                return False
+        return True
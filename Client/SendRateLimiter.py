@@ -0,0 +1,124 @@
+import math
+
+# States are sent at least this often even if nothing changed (new players, lost datagrams)
+KEEPALIVE_INTERVAL = 2.0
+
+# A state may be sent this fraction of the interval early (frames don't align exactly with the send rate)
+SEND_TIME_TOLERANCE = 0.25
+
+# Rate adaption (additive increase, multiplicative decrease)
+RATE_INCREASE_STEP = 2.0        # Hz per uncongested RTT sample
+RATE_DECREASE_FACTOR = 0.7
+# An RTT above min_rtt * factor + tolerance counts as congestion
+RTT_INFLATION_FACTOR = 2.0
+RTT_TOLERANCE = 0.02
+# The minimum RTT may slowly grow again (route changes)
+MIN_RTT_DRIFT = 0.001
+
+
+class SendRateLimiter:
+    """
+    Decides which player states the client actually sends.
+
+    States are sent at most at the current rate, independent of the frame
+    rate, and only if the car moved or turned more than an epsilon since the
+    last sent state (or the drifting/boosting flags changed). A parked car
+    only sends a keepalive every few seconds.
+
+    The current rate starts at the configured rate and adapts to the measured
+    RTT: it is lowered when the RTT rises clearly above the lowest RTT seen
+    (queues are building up somewhere) and slowly raised again otherwise. The
+    server can cap it further with the ``max_rate`` of its ``pong`` messages.
+    """
+
+    def __init__(self, rate: float = 60, min_rate: float = 5, position_epsilon: float = 0.5, angle_epsilon: float = 0.5):
+        """
+        :param rate: Highest send rate in Hz
+        :param min_rate: Lowest send rate in Hz while the connection is congested
+        :param position_epsilon: Position changes below this (world units) aren't sent
+        :param angle_epsilon: Angle changes below this (degrees) aren't sent
+        """
+        self.max_rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.rate = rate
+        self.position_epsilon = position_epsilon
+        self.angle_epsilon = angle_epsilon
+        self.server_max_rate = None
+        self.min_rtt = None
+        self.rtt = None
+
+        self.next_send_time = -math.inf
+        self.last_sent_time = -math.inf
+        self.last_sent_state = None
+
+        # Statistics
+        self.sent = 0
+        self.suppressed = 0
+
+    def should_send(self, now: float, state: dict) -> bool:
+        """
+        Returns True if the state should be sent now (and remembers it as sent).
+
+        :param now: time.monotonic()
+        :param state: Player state message
+        """
+        if now - self.last_sent_time < KEEPALIVE_INTERVAL and not self._changed(state):
+            self.suppressed += 1
+            return False
+        if not self.due(now):
+            return False
+        # Only states that were sent are compared against, otherwise slow drifts would never be sent
+        self.last_sent_state = state
+        return True
+
+    def due(self, now: float) -> bool:
+        """
+        Returns True if the current rate allows to send now (and counts it as sent).
+
+        Used directly for messages that have to be sent no matter whether they changed (inputs).
+
+        :param now: time.monotonic()
+        """
+        interval = 1 / self.rate
+        if now + interval * SEND_TIME_TOLERANCE < self.next_send_time:
+            return False
+        # Slightly early or late sends keep the schedule, after a pause it starts again from now
+        self.next_send_time = max(self.next_send_time, now - interval * SEND_TIME_TOLERANCE) + interval
+        self.last_sent_time = now
+        self.sent += 1
+        return True
+
+    def _changed(self, state: dict) -> bool:
+        last = self.last_sent_state
+        if last is None:
+            return True
+        return (
+            abs(state["x"] - last["x"]) > self.position_epsilon
+            or abs(state["y"] - last["y"]) > self.position_epsilon
+            or abs(state["angle"] - last["angle"]) > self.angle_epsilon
+            or state.get("is_drifting") != last.get("is_drifting")
+            or state.get("is_boosting") != last.get("is_boosting")
+        )
+
+    def add_rtt_sample(self, rtt: float):
+        """Adapts the rate to a new round trip time measurement (seconds)."""
+        self.rtt = rtt
+        if self.min_rtt is None:
+            self.min_rtt = rtt
+        else:
+            self.min_rtt = min(rtt, self.min_rtt + MIN_RTT_DRIFT)
+
+        if rtt > self.min_rtt * RTT_INFLATION_FACTOR + RTT_TOLERANCE:
+            self.rate = max(self.min_rate, self.rate * RATE_DECREASE_FACTOR)
+        else:
+            self.rate = min(self._ceiling(), self.rate + RATE_INCREASE_STEP)
+
+    def set_server_max_rate(self, max_rate):
+        """Applies the highest rate the server currently wants to receive (None = no limit)."""
+        self.server_max_rate = max_rate
+        self.rate = min(self.rate, self._ceiling())
+
+    def _ceiling(self) -> float:
+        if self.server_max_rate is None:
+            return self.max_rate
+        return max(self.min_rate, min(self.max_rate, self.server_max_rate))
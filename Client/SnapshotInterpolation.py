@@ -0,0 +1,149 @@
+import math
+import os
+import sys
+import threading
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from DeadReckoning import extrapolate
+
+# Snapshots kept per remote car
+DEFAULT_CAPACITY = 32
+
+# Rendering this far in the past leaves room for at least one more update at 10 Hz
+DEFAULT_INTERPOLATION_DELAY = 0.1
+
+# A snapshot that arrives this long after the previous one starts over (e.g. the player was out of range)
+MAX_SNAPSHOT_GAP = 1.0
+
+# After extrapolating, the difference to the real state fades out over this many seconds
+BLEND_TIME = 0.2
+# Larger differences aren't blended (e.g. the player was out of range for a while)
+MAX_BLEND_DISTANCE = 100
+
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+
+def lerp_angle(a, b, t):
+    """Interpolates between two angles in degrees along the shorter arc."""
+    difference = (b - a + 180) % 360 - 180
+    return a + difference * t
+
+
+class SnapshotBuffer:
+    """
+    Timestamped states of one remote car, sampled at a delayed render time.
+
+    States are stored with their arrival time in a small ring buffer. The
+    car is drawn ``delay`` seconds in the past, between the two states around
+    that time, so uneven arrival times don't show up as jitter. Between two
+    states the car moves along the extrapolation of the older one (see
+    DeadReckoning), corrected linearly towards the newer one. States are
+    added by the network thread and sampled by the render loop.
+
+    If no newer state arrived in time, the car is extrapolated from the newest
+    state for a limited time (see DeadReckoning). When the next state arrives,
+    the difference between the extrapolated and the real position is blended
+    out instead of making the car jump.
+    """
+
+    def __init__(self, delay: float = DEFAULT_INTERPOLATION_DELAY, capacity: int = DEFAULT_CAPACITY):
+        """
+        :param delay: Interpolation delay in seconds, should be longer than the interval between two updates
+        :param capacity: Number of states kept
+        """
+        self.delay = delay
+        self.snapshots = deque(maxlen=capacity)     # (time, state dict)
+        self.lock = threading.Lock()
+
+        # Only used by the render loop
+        self.extrapolated_from = None   # (arrival time, state) the last sample was extrapolated from
+        self.blend_offset = (0.0, 0.0)
+        self.blend_start = 0.0
+
+    def __len__(self):
+        return len(self.snapshots)
+
+    def add(self, time: float, state: dict):
+        """
+        Adds a received state.
+
+        :param time: Arrival time (time.monotonic())
+        :param state: State with x, y and angle and any other fields
+        """
+        with self.lock:
+            if self.snapshots and time - self.snapshots[-1][0] > MAX_SNAPSHOT_GAP:
+                self.snapshots.clear()
+            self.snapshots.append((time, state))
+
+    def clear(self):
+        with self.lock:
+            self.snapshots.clear()
+
+    def sample(self, now: float):
+        """
+        Returns the state at ``now - delay`` or None if no state was received.
+
+        Position and angle are interpolated, the other fields are taken from
+        the older of the two states. Before the first state it is returned as
+        it is, after the last state that one is extrapolated.
+        """
+        render_time = now - self.delay
+        state, extrapolated_from = self._sample(render_time)
+        if state is None:
+            self.extrapolated_from = None
+            return None
+
+        if self.extrapolated_from is not None and extrapolated_from is not self.extrapolated_from:
+            # Real data replaces the extrapolation, start from where the extrapolation would draw the car now
+            source_time, source = self.extrapolated_from
+            previous = extrapolate(source, render_time - source_time)
+            blend_x, blend_y = self._blend(now)
+            offset_x = previous["x"] + blend_x - state["x"]
+            offset_y = previous["y"] + blend_y - state["y"]
+            self.blend_offset = (offset_x, offset_y) if math.hypot(offset_x, offset_y) <= MAX_BLEND_DISTANCE else (0.0, 0.0)
+            self.blend_start = now
+        self.extrapolated_from = extrapolated_from
+
+        offset_x, offset_y = self._blend(now)
+        if offset_x or offset_y:
+            state = dict(state, x=state["x"] + offset_x, y=state["y"] + offset_y)
+        return state
+
+    def _blend(self, now: float):
+        """Returns the part of the blend offset that is left at now."""
+        remaining = 1 - (now - self.blend_start) / BLEND_TIME
+        if remaining <= 0:
+            return 0.0, 0.0
+        return self.blend_offset[0] * remaining, self.blend_offset[1] * remaining
+
+    def _sample(self, render_time: float):
+        """Returns the (raw) state at render_time and the snapshot (time, state) it was extrapolated from (or None)."""
+        with self.lock:
+            if not self.snapshots:
+                return None, None
+            newest_time, newest = self.snapshots[-1]
+            if render_time >= newest_time:
+                return extrapolate(newest, render_time - newest_time), self.snapshots[-1]
+            older_time, older = self.snapshots[0]
+            if render_time <= older_time:
+                return older, None
+            # Few snapshots, a linear search from the newest end is fastest
+            for index in range(len(self.snapshots) - 2, -1, -1):
+                older_time, older = self.snapshots[index]
+                if older_time <= render_time:
+                    newer_time, newer = self.snapshots[index + 1]
+                    break
+
+        span = newer_time - older_time
+        t = (render_time - older_time) / span if span > 0 else 1.0
+        # Follows the extrapolation of the older state (the server skips updates while it is close enough)
+        # and spreads the remaining difference to the newer state over the interval
+        state = extrapolate(older, render_time - older_time)
+        predicted = extrapolate(older, span)
+        state["x"] += (newer["x"] - predicted["x"]) * t
+        state["y"] += (newer["y"] - predicted["y"]) * t
+        state["angle"] = lerp_angle(older["angle"], newer["angle"], t)
+        return state, None
@@ -10,7 +10,7 @@ class MainMenu:
 
         self.master = ctk.CTk()
         self.master.title("Car Game - Main Menu")
-        self.master.geometry("400x400")
+        self.master.geometry("400x460")
 
         self.result = None
         self.selected_color = "#7800f0"  # Default Hexfarbe
@@ -27,6 +27,9 @@ class MainMenu:
         self.port_entry.insert(0, "5000")
         self.port_entry.pack(pady=10)
 
+        self.room_entry = ctk.CTkEntry(master=self.master, placeholder_text="Room (optional)")
+        self.room_entry.pack(pady=10)
+
         # Farbauswahl
         self.color_button = ctk.CTkButton(master=self.master, text="Choose Car Color", command=self.ask_color)
         self.color_button.pack(pady=10)
@@ -53,6 +56,7 @@ class MainMenu:
             "player_name": self.name_entry.get(),
             "server": self.server_entry.get(),
             "port": int(self.port_entry.get()),
+            "room": self.room_entry.get().strip() or None,
             "car_color": self.hex_to_rgb(self.selected_color),
             "fullscreen": self.fullscreen_checkbox.get()
         }
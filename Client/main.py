@@ -1,5 +1,6 @@
 import pygame
 import sys
+import time
 from CarGameClient import CarGameClient
 from ctkMainMenu import MainMenu
 import signal
@@ -9,6 +10,8 @@ from tkinter import messagebox
 # Game Objects
 from Speedometers import Speedometer, NitroGauge
 from GameObjects import Car, MultiplayerCar
+from PredictionBuffer import PredictionBuffer
+from CarPhysics import PHYSICS_RATE, MAX_SPEED, ACCELERATION, TURN_SPEED, DRIFT_TURN_SPEED, MAX_NITRO
 
 # Initialize Pygame
 pygame.init()
@@ -16,14 +19,9 @@ pygame.init()
 # Constants
 INITIAL_SCREEN_WIDTH = 800
 INITIAL_SCREEN_HEIGHT = 600
-FPS = 60
-
-# CAR TUNING - Easy to modify these values
-MAX_SPEED = 65          # Maximum speed of the car in m/s
-ACCELERATION = 0.3     # How fast the car accelerates
-TURN_SPEED = 5         # How responsive steering is (normal driving)
-DRIFT_TURN_SPEED = 2.5   # How responsive steering is (while drifting)
-MAX_NITRO = 100
+FPS = PHYSICS_RATE  # The car physics advance one step per frame
+NETWORK_SEND_RATE = 60  # Highest rate (Hz) the car state is sent to the server at
+INTERPOLATION_DELAY = 0.1  # Remote cars are drawn this many seconds in the past (more than one update interval)
 
 # Colors
 WHITE = (255, 255, 255)
@@ -33,9 +31,6 @@ BLUE = (0, 0, 255)
 GREEN = (0, 255, 0)
 GRAY = (128, 128, 128)
 
-points = 0
-received_highspeed_bonus = False
-
 class GameWindow:
     def __init__(self):
         self.width = INITIAL_SCREEN_WIDTH
@@ -52,8 +47,9 @@ class Camera:
         self.window = window
 
     def update(self, car):
-        self.x = car.x - self.window.width // 2
-        self.y = car.y - self.window.height // 2
+        x, y = car.get_display_position()
+        self.x = x - self.window.width // 2
+        self.y = y - self.window.height // 2
 
     def apply(self, x, y):
         return int(x - self.x), int(y - self.y)
@@ -93,7 +89,7 @@ def draw_ui(screen, car, window):
     controls_font = pygame.font.Font(None, 24)
 
     # Display Points
-    points_text = font.render(f"Points: {points:.0f}", True, BLACK)
+    points_text = font.render(f"Points: {car.points:.0f}", True, BLACK)
     screen.blit(points_text, (10, 0))
     
     # Display speed (UI elements stay on screen)
@@ -131,22 +127,6 @@ def draw_ui(screen, car, window):
         control_text = controls_font.render(text, True, BLACK)
         screen.blit(control_text, (10, 130 + i * 25))
 
-def calculate_points(car: Car):
-    global received_highspeed_bonus
-    global points
-    if car.get_speed_kmh() > 50: # This is a Bonus for high speed
-        if received_highspeed_bonus == False:
-            received_highspeed_bonus = True
-            points = points + 500
-    else:
-        if received_highspeed_bonus == True: received_highspeed_bonus = False # Reset
-
-    if car.nitro_active == True:
-        points = points + 2
-    
-    if car.is_drifting == True:
-        points = points + car.get_speed_kmh() / 10
-
 def close():
     os.kill(os.getpid(), signal.SIGTERM) # This is the last line that gets executed.
 
@@ -190,7 +170,7 @@ def main():
     skid_marks = []
     
     # NETWORK SETUP
-    client = CarGameClient(config["server"], config["port"], config["player_name"], config["car_color"], network_error_close)
+    client = CarGameClient(config["server"], config["port"], config["player_name"], config["car_color"], network_error_close, room=config.get("room"), send_rate=NETWORK_SEND_RATE)
     try:
         client.connect()
     except Exception as e:
@@ -198,13 +178,17 @@ def main():
         close()
         
 
+    # Keyed by the player's session ID, two players may have asked for the same name
     remote_players = {}
+    # Authoritative server: inputs and predicted states that the server didn't acknowledge yet
+    prediction = PredictionBuffer()
 
-    def on_player_update(name, data):
-        if name not in remote_players:
-            remote_players[name] = MultiplayerCar(data["x"], data["y"], name, data["car_color"])
+    def on_player_update(player_id, data):
+        if player_id not in remote_players:
+            remote_players[player_id] = MultiplayerCar(data["x"], data["y"], data["name"], data["car_color"], INTERPOLATION_DELAY)
 
-        remote_players[name].update_state(
+        remote_players[player_id].name = data["name"]
+        remote_players[player_id].update_state(
             x=data["x"],
             y=data["y"],
             angle=data["angle"],
@@ -216,19 +200,20 @@ def main():
             speed_kmh=data.get("speed_kmh", 0)
         )
 
-    def on_player_disconnect(name):
-        remote_players[name].update_state(
-            x=0,
-            y=0,
-            angle=0,
-            drifting=False,
-            visible=False,
-            car_color=None
-        )
-        print(f'[INFO] {name} disconnected, making invisible')
+    def on_player_disconnect(player_id):
+        mp_car = remote_players.pop(player_id, None)
+        if mp_car is not None:
+            print(f'[INFO] {mp_car.name} disconnected, removing')
+
+    def on_player_out_of_range(player_id):
+        # Hidden until the server sends updates for the player again
+        if player_id in remote_players:
+            remote_players[player_id].visible = False
 
     client.on_player_update = on_player_update
     client.on_player_disconnect = on_player_disconnect
+    client.on_player_out_of_range = on_player_out_of_range
+    client.send_viewport(game_window.width, game_window.height)
 
     # Game loop
     running = True
@@ -248,23 +233,33 @@ def main():
                 speedometer.y = game_window.height - 100
                 nitro_gauge.x = game_window.width - 260
                 nitro_gauge.y = game_window.height - 160
+                client.send_viewport(game_window.width, game_window.height)
                 print(f"Window resized to: {game_window.width}x{game_window.height}")
 
         # Get pressed keys
         keys = pygame.key.get_pressed()
         
         # Update car
+        correction = client.take_correction()
+        if correction:
+            # Rewinds to the server's state and replays the newer inputs if our prediction was off
+            car.apply_correction(*prediction.reconcile(car, correction))
+        # Checked before the step like on the server, the step that brings the car to rest is still sent
+        idle = car.is_at_rest()
         car.update(keys, skid_marks, 1 / FPS)
         speedometer.update_speed(car.get_speed_kmh())
         speedometer.update()
-        if car.nitro_active == False:
-            if car.current_nitro < MAX_NITRO:
-                car.current_nitro += 1
         nitro_gauge.update_nitro(car.current_nitro)
         nitro_gauge.update()
 
-        # Send local car state to server
-        client.send_player_state(car.x, car.y, car.angle, car.is_drifting, car.car_color, points, car.nitro_active, car.get_speed_kmh())
+        if client.authoritative:
+            # The server simulates the car from our inputs
+            seq = client.send_input(car.inputs, car.car_color, idle=idle)
+            if seq is not None:
+                prediction.record(seq, car.inputs, car)
+        else:
+            # Send local car state to server (the client decides whether it is actually sent this frame)
+            client.send_player_state(car.x, car.y, car.angle, car.is_drifting, car.car_color, car.points, car.nitro_active, car.get_speed_kmh())
         
         # Update camera to follow car
         camera.update(car)
@@ -288,12 +283,12 @@ def main():
         nitro_gauge.draw(screen)
 
         # Draw all remote multiplayer cars
-        for mp_car in remote_players.values():
+        now = time.monotonic()
+        for mp_car in list(remote_players.values()):
+            mp_car.interpolate(now)
             if mp_car.visible == True:
                 mp_car.draw(screen, camera)
         
-        calculate_points(car)
-
         # Draw UI elements
         draw_ui(screen, car, game_window)
         
@@ -0,0 +1,79 @@
+import json
+import socket
+import threading
+
+from AdminServer import DEFAULT_ADMIN_PORT
+
+
+class AdminError(Exception):
+    """The admin interface rejected a request."""
+
+
+class AdminClient:
+    """Client of the AdminServer, used by the admin CLI (admin.py) and the Tk UI."""
+
+    def __init__(self, host="127.0.0.1", port=DEFAULT_ADMIN_PORT, timeout=5.0):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        # The UI polls from a background thread and kicks from the UI thread
+        self.lock = threading.Lock()
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.reader = self.sock.makefile('rb')
+
+    def request(self, command: str, **args) -> dict:
+        """Sends one request and returns the answer, reconnects once if the connection was lost."""
+        data = json.dumps(dict(args, command=command)).encode('utf-8') + b'\n'
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.sock is None:
+                        self.connect()
+                    self.sock.sendall(data)
+                    line = self.reader.readline()
+                    if not line:
+                        raise ConnectionError("Admin interface closed the connection")
+                    break
+                except OSError:
+                    self.close()
+                    if attempt:
+                        raise
+        answer = json.loads(line)
+        if not answer.get("ok"):
+            raise AdminError(answer.get("error", "Unknown error"))
+        return answer
+
+    def players(self):
+        """Returns the latest state of every player and the number of states the server received so far."""
+        answer = self.request("players")
+        return answer["players"], answer["messages"]
+
+    def kick(self, name: str, reason: str) -> bool:
+        return self.request("kick", name=name, reason=reason)["kicked"]
+
+    def stats(self) -> dict:
+        """Returns {"server": server_stats(), "players": running player statistics}."""
+        answer = self.request("stats")
+        return {"server": answer["server"], "players": answer["players"]}
+
+    def server_stats(self) -> dict:
+        return self.stats()["server"]
+
+    def log(self, since: int = 0):
+        """Returns the log records (time, level, message) after position since and the new position."""
+        answer = self.request("log", since=since)
+        return [tuple(record) for record in answer["records"]], answer["position"]
+
+    def close(self):
+        if self.sock:
+            try:
+                self.reader.close()
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.reader = None
@@ -0,0 +1,130 @@
+import json
+import socketserver
+import threading
+import time
+
+DEFAULT_ADMIN_PORT = 5100
+# Largest request line accepted from an admin client
+MAX_REQUEST_SIZE = 64 * 1024
+
+
+class AdminServer:
+    """
+    Local admin interface of a running server (list, kick, stats, log).
+
+    Nothing runs per relayed state: the server's UI callback is pointed at
+    on_message, which only gets joins, leaves and player infos for the log.
+    The players and their statistics are read from the server when an admin
+    client asks for them. Admin clients (the CLI in admin.py or the Tk UI,
+    see AdminClient) connect to 127.0.0.1 and send one JSON request per line,
+    every request gets one JSON answer line:
+
+        {"command": "players"}
+        {"command": "kick", "name": "Player", "reason": "..."}
+        {"command": "stats"}
+        {"command": "log", "since": 0}
+    """
+
+    def __init__(self, server, server_log, host="127.0.0.1", port=DEFAULT_ADMIN_PORT):
+        """
+        :param server: CarGameServer (or a subclass / ShardedCarGameServer) to administrate
+        :param server_log: ServerLog the server logs into
+        """
+        self.server = server
+        self.server_log = server_log
+        self.lock = threading.Lock()
+        self.known_players = set()  # (room, session ID) of the players whose join was logged
+        self._rate = (time.monotonic(), 0, 0.0)    # (time, messages, messages per second)
+
+        self.commands = {
+            "players": self.players_command,
+            "kick": self.kick_command,
+            "stats": self.stats_command,
+            "log": self.log_command,
+        }
+        admin = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                for line in self.rfile:
+                    if len(line) > MAX_REQUEST_SIZE:
+                        break
+                    self.wfile.write(json.dumps(admin.handle_request(line), default=str).encode('utf-8') + b'\n')
+
+        self.tcp_server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self.tcp_server.daemon_threads = True
+        self.tcp_server.allow_reuse_address = True
+        self.tcp_server.server_bind()
+        self.tcp_server.server_activate()
+        self.port = self.tcp_server.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.tcp_server.serve_forever, daemon=True).start()
+        print(f"[INFO] Admin interface on {self.tcp_server.server_address[0]}:{self.port}")
+
+    def stop(self):
+        self.tcp_server.shutdown()
+        self.tcp_server.server_close()
+
+    def on_message(self, message: dict):
+        """UI callback of the server, called for joins, leaves and player infos (not for states)."""
+        event = message.get("event")
+        if event == "join":
+            self.server_log.log("INFO", f'Connection from {message.get("ip_addr", "Unknown")}')
+        elif event == "player_info":
+            key = (message.get("room"), message.get("id"))
+            with self.lock:
+                if key in self.known_players:
+                    return
+                self.known_players.add(key)
+            self.server_log.log("INFO", f"Player {message.get('name')} joined the Server")
+        elif event == "leave":
+            with self.lock:
+                self.known_players.discard((message.get("room"), message.get("id")))
+            self.server_log.log("INFO", f"{message.get('name')} left the Server.")
+
+    def handle_request(self, line: bytes) -> dict:
+        try:
+            request = json.loads(line)
+            handler = self.commands[request["command"]]
+        except (ValueError, KeyError, TypeError):
+            return {"ok": False, "error": f"Invalid request, commands: {', '.join(self.commands)}"}
+        try:
+            return dict(handler(request), ok=True)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+    def players_command(self, request: dict) -> dict:
+        return {"players": self.server.player_states(), "messages": self.server.server_stats()["messages"]}
+
+    def kick_command(self, request: dict) -> dict:
+        name = request.get("name")
+        if not name:
+            raise ValueError("kick needs a name")
+        kicked = self.server.kick_player_by_name(name, request.get("reason") or "No Reason specified.")
+        return {"kicked": bool(kicked)}
+
+    def stats_command(self, request: dict) -> dict:
+        # Computed from the latest states when asked, O(n) per request instead of work per relayed state
+        server_stats = self.server.server_stats()
+        states = self.server.player_states()
+        now = time.monotonic()
+        with self.lock:
+            last_time, last_messages, rate = self._rate
+            if now - last_time >= 1.0:
+                rate = (server_stats["messages"] - last_messages) / (now - last_time)
+                self._rate = (now, server_stats["messages"], rate)
+        speeds = [state.get("speed_kmh", 0) for state in states]
+        leader = max(states, key=lambda state: state.get("points", 0), default=None)
+        players = {
+            "count": len(states),
+            "average_speed": round(sum(speeds) / len(speeds), 1) if speeds else 0.0,
+            "max_speed": round(max(speeds), 1) if speeds else None,
+            "top": {"name": leader["name"], "points": leader.get("points", 0)} if leader else None,
+            "messages_per_second": round(rate, 1),
+        }
+        return {"server": server_stats, "players": players}
+
+    def log_command(self, request: dict) -> dict:
+        records, position = self.server_log.since(request.get("since", 0))
+        return {"records": records, "position": position}
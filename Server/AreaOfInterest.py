@@ -0,0 +1,144 @@
+import math
+import threading
+
+
+class SpatialGrid:
+    """Uniform grid (spatial hash) of positions on the infinite map."""
+
+    def __init__(self, cell_size: float):
+        self.cell_size = cell_size
+        self.cells = {}         # (cell x, cell y) -> set of keys
+        self.positions = {}     # key -> (x, y, cell)
+
+    def _cell(self, x, y):
+        return int(math.floor(x / self.cell_size)), int(math.floor(y / self.cell_size))
+
+    def update(self, key, x, y):
+        cell = self._cell(x, y)
+        previous = self.positions.get(key)
+        if previous is not None and previous[2] != cell:
+            self._remove_from_cell(key, previous[2])
+        if previous is None or previous[2] != cell:
+            self.cells.setdefault(cell, set()).add(key)
+        self.positions[key] = (x, y, cell)
+
+    def remove(self, key):
+        previous = self.positions.pop(key, None)
+        if previous is not None:
+            self._remove_from_cell(key, previous[2])
+
+    def _remove_from_cell(self, key, cell):
+        keys = self.cells.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    def query(self, x, y, radius) -> list:
+        """Returns all keys within radius around (x, y)."""
+        min_cx, min_cy = self._cell(x - radius, y - radius)
+        max_cx, max_cy = self._cell(x + radius, y + radius)
+        radius_sq = radius * radius
+        result = []
+        for cx in range(min_cx, max_cx + 1):
+            for cy in range(min_cy, max_cy + 1):
+                for key in self.cells.get((cx, cy), ()):
+                    px, py, _ = self.positions[key]
+                    if (px - x) ** 2 + (py - y) ** 2 <= radius_sq:
+                        result.append(key)
+        return result
+
+
+class AreaOfInterest:
+    """
+    Decides which players a client gets updates for.
+
+    Clients report their window size with a ``viewport`` event. A client only
+    receives players within half its window diagonal plus a margin around its
+    own car. Clients that never reported a viewport (or haven't sent a
+    position yet) receive every player, like without area of interest.
+    """
+
+    def __init__(self, margin: float, cell_size: float = 1024):
+        self.margin = margin
+        self.grid = SpatialGrid(cell_size)
+        self.lock = threading.Lock()
+
+    def set_viewport(self, client, width, height):
+        client.interest_radius = math.hypot(width, height) / 2 + self.margin
+
+    def update_position(self, client, x, y):
+        with self.lock:
+            self.grid.update(client, x, y)
+
+    def remove(self, client):
+        with self.lock:
+            self.grid.remove(client)
+            for watcher in client.watchers:
+                watcher.watching.discard(client)
+            for other in client.watching:
+                other.watchers.discard(client)
+            client.watchers.clear()
+            client.watching.clear()
+
+    def is_filtered(self, client) -> bool:
+        return client.interest_radius is not None and client in self.grid.positions
+
+    def _in_range(self, client, x, y) -> bool:
+        cx, cy, _ = self.grid.positions[client]
+        return (cx - x) ** 2 + (cy - y) ** 2 <= client.interest_radius ** 2
+
+    def visible_clients(self, client) -> list:
+        """Returns the other clients that are in the area of interest of client (tick mode)."""
+        with self.lock:
+            position = self.grid.positions.get(client)
+            if position is None:
+                # Removed in the meantime
+                return []
+            x, y, _ = position
+            return [other for other in self.grid.query(x, y, client.interest_radius) if other is not client]
+
+    def update_visible(self, client, visible_clients) -> list:
+        """
+        Stores which players a client currently sees.
+
+        :return: Clients that were visible before but aren't anymore
+        """
+        with self.lock:
+            visible = set(visible_clients)
+            left = [other for other in client.watching if other not in visible]
+            for other in left:
+                other.watchers.discard(client)
+            for other in visible:
+                other.watchers.add(client)
+            client.watching = visible
+            return left
+
+    def relay_recipients(self, sender, clients):
+        """
+        Splits the clients for a relayed state of sender (relay mode).
+
+        Relaying is O(N) per message anyway, so this only checks the distance
+        to every client instead of querying the grid.
+
+        :return: Tuple (recipients, lost) where lost are clients that saw the
+                 sender before but are now out of range
+        """
+        with self.lock:
+            if sender not in self.grid.positions:
+                return [c for c in clients if c is not sender], []
+            x, y, _ = self.grid.positions[sender]
+            recipients = []
+            lost = []
+            for client in clients:
+                if client is sender:
+                    continue
+                if not self.is_filtered(client) or self._in_range(client, x, y):
+                    recipients.append(client)
+                    sender.watchers.add(client)
+                    client.watching.add(sender)
+                elif client in sender.watchers:
+                    sender.watchers.discard(client)
+                    client.watching.discard(sender)
+                    lost.append(client)
+            return recipients, lost
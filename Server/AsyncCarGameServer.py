@@ -0,0 +1,181 @@
+import asyncio
+import socket
+import threading
+import time
+
+from CarGameServer import CarGameServer, ClientConnection, WRITE_TIMEOUT
+
+
+class AsyncClientHandler(ClientConnection):
+    """Handles a single client connection on the server's event loop."""
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, server):
+        self.reader = reader
+        self.writer = writer
+        self.setup_connection(writer.get_extra_info('peername'), server)
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.wakeup = asyncio.Event()
+        self.queue.on_put = self._wake_writer
+
+    async def run(self):
+        self.server.forward_to_ui({"event": "join", "ip_addr": self.addr[0]})
+        writer_task = self.server.loop.create_task(self.write_loop())
+        try:
+            while self.running:
+                data = await self.reader.read(4096)
+                if not data:
+                    break
+                self.server.receive_data(self, data)
+        except (ConnectionResetError, ConnectionAbortedError):
+            pass
+        finally:
+            self.stop()
+        await writer_task
+
+    def _wake_writer(self):
+        if self.server.in_loop_thread():
+            self.wakeup.set()
+        else:
+            # Queued from another thread (e.g. a kick from the UI or the UDP channel)
+            self.server.loop.call_soon_threadsafe(self.wakeup.set)
+
+    async def write_loop(self):
+        """Sends everything queued for this client, one write per batch."""
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                batch = self.queue.drain()
+                if batch:
+                    data = b"".join(batch)
+                    self.writer.write(data)
+                    self.queue.sent_bytes += len(data)
+                    self.server.metrics.bytes_sent.inc(len(data))
+                    # While we wait here, new states for this client are coalesced in the queue
+                    await asyncio.wait_for(self.writer.drain(), WRITE_TIMEOUT)
+                if self.queue.closed and not self.queue.depth:
+                    break
+        except (ConnectionError, OSError, asyncio.TimeoutError):
+            pass
+        finally:
+            self.writer_finished()
+            self.writer.close()
+
+    def stop(self):
+        if not self.server.in_loop_thread():
+            self.server.loop.call_soon_threadsafe(self.stop)
+            return
+        if self.running:
+            print(f"[INFO] Client disconnected: {self.addr}")
+            self.server.forward_to_ui({"event": "leave", "id": self.player_id, "name": self.name})
+            self.running = False
+            # The writer flushes what is still queued (e.g. a kick message) and closes the connection
+            self.queue.close()
+            self.server.remove_client(self)
+            self.server.broadcast({"event": "disconnect", "id": self.player_id, "name": f"{self.name}"}, exclude=self)
+
+
+class AsyncCarGameServer(CarGameServer):
+    """
+    asyncio based variant of the CarGameServer.
+
+    All client connections are served by a single event loop instead of one
+    thread per client. The newline-JSON protocol as well as the broadcast,
+    kick and UI callback API are the same as in the threaded server.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loop = None
+        self.loop_thread_id = None
+        self._asyncio_server = None
+
+    def in_loop_thread(self) -> bool:
+        return threading.get_ident() == self.loop_thread_id
+
+    def start(self):
+        """Starts the server and runs the event loop until the server is stopped."""
+        try:
+            asyncio.run(self._serve())
+        except KeyboardInterrupt:
+            print("[INFO] Server shutting down...")
+        finally:
+            self._close_clients()
+            if self.recorder:
+                # The loop is gone, stop() can't run anymore
+                self.recorder.close()
+
+    async def _serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self._asyncio_server = await asyncio.start_server(self._on_connect, self.host, self.port)
+        self.server_socket = self._asyncio_server.sockets[0]
+        self.running = True
+        print(f"[INFO] Server started on {self.host}:{self.port} (asyncio)")
+        # The UDP channel runs in its own thread and hands states to the loop via send()
+        self.start_udp_channel()
+        self.start_recorder()
+        if self.tick_rate:
+            self.loop.create_task(self._async_tick_loop())
+        try:
+            async with self._asyncio_server:
+                await self._asyncio_server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    async def _async_tick_loop(self):
+        interval = 1 / self.loop_rate
+        next_tick = time.perf_counter()
+        while self.running:
+            try:
+                self.advance()
+            except Exception as e:
+                # One failed tick must not stop the snapshots for good
+                self.metrics.tick_errors.inc()
+                print(f"[ERROR] Tick {self.tick_count} failed: {e!r}")
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay <= 0:
+                # Tick took too long, don't try to catch up
+                next_tick = time.perf_counter()
+            await asyncio.sleep(max(0.0, delay))
+
+    async def _on_connect(self, reader, writer):
+        handler = AsyncClientHandler(reader, writer, self)
+        print(f"[INFO] New connection from {handler.addr}")
+        with self.lock:
+            self.clients.append(handler)
+        await handler.run()
+
+    def _close_clients(self):
+        with self.lock:
+            clients = self.clients[:]
+            self.clients.clear()
+        for client in clients:
+            client.running = False
+            client.queue.close()
+            client.writer.close()
+
+    def stop(self):
+        """Stops the server and all clients."""
+        if self.loop is None or self.loop.is_closed():
+            return
+        if not self.in_loop_thread():
+            self.loop.call_soon_threadsafe(self.stop)
+            return
+        self.running = False
+        self._close_clients()
+        if self.udp_channel:
+            self.udp_channel.close()
+        if self.recorder:
+            self.recorder.close()
+        if self._asyncio_server:
+            self._asyncio_server.close()
+            print("[INFO] Server socket closed")
+
+
+if __name__ == "__main__":
+    server = AsyncCarGameServer(host="127.0.0.1", port=5000)
+    server.start()
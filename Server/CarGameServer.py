@@ -1,72 +1,219 @@
+import os
+import sys
 import socket
+import struct
 import threading
-import json
+import itertools
+import time
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from Protocol import (EncodeCache, JsonCodec, ProtocolError, PROTOCOL_BINARY, choose_protocol, create_codec, is_unreliable,
+                      validate_car_color, validate_state)
+from UdpStateChannel import UdpStateChannel
+from DeltaCompression import ClientBaselines
+from AreaOfInterest import AreaOfInterest
+from OutboundQueue import OutboundQueue, POLICY_DROP, coalesce_key
+from CarPhysics import CarPhysics, INPUT_MASK, PHYSICS_RATE
+from DeadReckoningFilter import DeadReckoningFilter
+from Metrics import ServerMetrics
+from PlayerRegistry import PlayerRegistry
+from SessionRecorder import SessionRecorder
+
+# A client that doesn't accept any data for this long is disconnected
+WRITE_TIMEOUT = 5.0
+
+# Send rate limit for clients (Hz), sent in every pong (see send_rate_hint)
+DEFAULT_MAX_SEND_RATE = 60
+MIN_SEND_RATE_HINT = 5
+SEND_RATE_HINT_INTERVAL = 2.0
+
+# Server-side simulation: snapshot rate if no tick rate is given
+DEFAULT_AUTHORITATIVE_TICK_RATE = 30
+# Inputs accepted per input message and buffered per client (older ones are dropped)
+MAX_INPUTS_PER_MESSAGE = 32
+MAX_INPUT_BACKLOG = 30
+# With more buffered inputs a client gets two steps per physics step until it caught up, but only
+# as many extra steps as its car waited for inputs before, the rest of the backlog is dropped
+INPUT_BUFFER_STEPS = 4
 
 class LogLevel:
     INFO = 'INFO'
     WARN = 'WARN'
     ERROR = 'ERROR'
 
-class ClientHandler(threading.Thread):
-    """Handles a single client connection."""
+class ClientConnection:
+    """Per-client state shared by the threaded and the asyncio client handler."""
 
-    def __init__(self, conn, addr, server):
-        super().__init__(daemon=True)
-        self.conn = conn
+    def setup_connection(self, addr, server):
         self.addr = addr
         self.server: CarGameServer = server
         self.running = True
+        # Unique name given by the registry and the name the client asked for
         self.name = None
+        self.requested_name = None
+        self.car_color = None
+        self.player_id = server.players.register(self)
+        self.announced_info = None
+        # Latest state of the player, only read when the admin interface asks for it
+        self.last_state = None
+        # Every client starts with newline-JSON until it negotiates another protocol
+        self.codec = JsonCodec()
+
+        # Encoded messages waiting for the writer of this client
+        self.queue = OutboundQueue(server.queue_size, server.queue_policy)
+        self.send_lock = threading.Lock()
+
+        # Optional UDP state channel (see UdpStateChannel)
+        self.udp_token = None
+        self.udp_addr = None
+        self.udp_recv_seq = 0
+        self.udp_send_seq = itertools.count(1)
+
+        # Delta compressed snapshots (see DeltaCompression), None = full snapshots
+        self.baselines = None
+
+        # Area of interest (see AreaOfInterest), None = client sees every player
+        self.interest_radius = None
+        self.watching = set()   # clients this client currently gets updates for
+        self.watchers = set()   # clients that currently get updates for this client
+
+        # Server-side simulation (see CarPhysics), None = the client sends its own state
+        self.car = None
+        self.inputs = deque()           # (seq, bitmask) received but not simulated yet
+        self.input_lock = threading.Lock()
+        self.received_input_seq = 0
+        self.input_seq = 0              # last simulated input, sent back in corrections
+        self.missed_steps = 0           # physics steps the car waited for inputs, may be caught up later
+
+        # Traffic counters for the metrics (TCP sent bytes are counted by the queue)
+        self.received_bytes = 0
+        self.udp_sent_bytes = 0
+
+    def send(self, message_dict, cache: EncodeCache = None):
+        """
+        Sends a message, states go over UDP if the client has a working UDP channel.
+
+        :param cache: Encoded message shared by all recipients of a fan-out (encodes only once per protocol)
+        """
+        try:
+            if self.udp_addr is not None and is_unreliable(message_dict):
+                if self.server.udp_channel.send(self, message_dict, cache):
+                    return
+            self.send_reliable(message_dict, cache)
+        except (ProtocolError, struct.error, KeyError, TypeError, ValueError, OverflowError) as e:
+            # Encoding runs in the thread of the sender or the tick, a bad message only gets lost for this client
+            self.server.metrics.encode_errors.inc()
+            print(f"[ERROR] Unable to encode {message_dict.get('event', 'state')} for {self.addr}: {e!r}")
+
+    def send_reliable(self, message_dict, cache: EncodeCache = None):
+        """Queues a message for the writer of this client, never blocks on the network."""
+        with self.send_lock:
+            if self.running:
+                data = cache.encode(self.codec) if cache else self.codec.encode(message_dict)
+                self.queue.put(data, coalesce_key(message_dict))
+                self.server.metrics.messages_sent.inc()
+
+    def switch_protocol(self, protocol: str, welcome: dict):
+        """Queues the welcome message with the current codec and switches to the negotiated one."""
+        with self.send_lock:
+            self.queue.put(self.codec.encode(welcome))
+            codec = create_codec(protocol)
+            codec.feed(self.codec.buffer.pending())
+            self.codec = codec
+
+    def writer_finished(self):
+        if self.queue.overflowed:
+            print(f"[WARN] {self.addr} fell too far behind ({self.queue.max_size} queued messages), disconnecting")
+        self.stop()
+
+
+class ClientHandler(ClientConnection, threading.Thread):
+    """Handles a single client connection."""
+
+    def __init__(self, conn, addr, server):
+        threading.Thread.__init__(self, daemon=True)
+        self.conn = conn
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        # Also bounds how long the writer may block on a client that stopped reading
+        self.conn.settimeout(WRITE_TIMEOUT)
+        self.setup_connection(addr, server)
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
 
     def run(self):
-        buffer = ""
-        self.server.forward_to_ui({"event": "join", "ip_addr": {self.addr[0]}})
+        self.server.forward_to_ui({"event": "join", "ip_addr": self.addr[0]})
+        self.writer.start()
         try:
+            if len(self.codec.buffer):
+                # Data that was read before the connection was handed to this handler
+                self.server.handle_frames(self)
             while self.running:
-                data = self.conn.recv(1024)
-                if not data:
+                try:
+                    received = self.codec.recv_into(self.conn)
+                except socket.timeout:
+                    continue
+                if not received:
                     break
-
-                buffer += data.decode('utf-8')
-
-                while '\n' in buffer:
-                    line, buffer = buffer.split('\n', 1)
-                    if not line.strip():
-                        continue
-
-                    try:
-                        message = json.loads(line)
-                        self.name = message.get("name", "Unknown")
-                        self.server.broadcast(message, exclude=self)
-                        self.server.forward_to_ui(message)
-                    except json.JSONDecodeError:
-                        print(f"[WARN] Invalid data from {self.addr}: {line}")
-        except (ConnectionResetError, ConnectionAbortedError):
+                self.received_bytes += received
+                self.server.metrics.bytes_received.inc(received)
+                self.server.handle_frames(self)
+        except OSError:
             pass
         finally:
             self.stop()
 
-    def send(self, message_dict):
+    def write_loop(self):
+        """Sends everything queued for this client, one write per batch."""
         try:
-            data = json.dumps(message_dict) + '\n'
-            self.conn.sendall(data.encode('utf-8'))
-        except Exception:
-            self.stop()
+            while True:
+                batch = self.queue.get()
+                if not batch:
+                    break
+                data = b"".join(batch)
+                self.conn.sendall(data)
+                self.queue.sent_bytes += len(data)
+                self.server.metrics.bytes_sent.inc(len(data))
+        except OSError:
+            pass
+        finally:
+            self.writer_finished()
+            self.conn.close()
 
     def stop(self):
         if self.running:
             print(f"[INFO] Client disconnected: {self.addr}")
-            self.server.forward_to_ui({"event": "leave", "name": self.name})
+            self.server.forward_to_ui({"event": "leave", "id": self.player_id, "name": self.name})
             self.running = False
-            self.conn.close()
+            # The writer flushes what is still queued (e.g. a kick message) and closes the socket
+            self.queue.close()
+            try:
+                self.conn.shutdown(socket.SHUT_RD)
+            except OSError:
+                pass
             self.server.remove_client(self)
-            self.server.broadcast({"event": "disconnect", "name": f"{self.name}"}, exclude=self)
+            self.server.broadcast({"event": "disconnect", "id": self.player_id, "name": f"{self.name}"}, exclude=self)
 
 
 class CarGameServer:
-    """TCP server for multiplayer car game."""
+    """
+    TCP server for multiplayer car game.
+
+    Without a tick rate every incoming state is relayed to all other clients
+    right away. With a tick rate the server only remembers the latest state per
+    player and sends every client one combined world snapshot per tick.
+
+    In authoritative mode clients that support it only send their inputs and
+    the server simulates their cars with fixed physics steps, the snapshots
+    contain the simulated states.
+    """
 
-    def __init__(self, host="0.0.0.0", port=5000, ui_callback=None, ui_logbox_callback=None):
+    def __init__(self, host="0.0.0.0", port=5000, ui_callback=None, ui_logbox_callback=None, tick_rate=None, udp_port=None, aoi_margin=None,
+                 queue_size=256, queue_policy=POLICY_DROP, max_send_rate=None, authoritative=False, dead_reckoning=None, record=None):
+        """
+        :param authoritative: Simulate the cars of clients that send inputs (implies a tick rate)
+        :param dead_reckoning: Skip player updates that clients can extrapolate within this many world units (tick mode only)
+        :param record: Record the relayed states and events into this session file (see SessionRecorder)
+        """
         self.host = host
         self.port = port
         self.server_socket = None
@@ -74,52 +221,528 @@ class CarGameServer:
         self.lock = threading.Lock()
         self.ui_callback = ui_callback  # <--- neu
         self.ui_logbox_callback = ui_logbox_callback
+        self.running = False
+
+        # Per-client outbound queues (see OutboundQueue)
+        self.queue_size = queue_size
+        self.queue_policy = queue_policy
+
+        # Server-side simulation, one physics step per loop iteration and a tick every steps_per_tick steps
+        self.authoritative = authoritative
+        if authoritative:
+            tick_rate = tick_rate or DEFAULT_AUTHORITATIVE_TICK_RATE
+            self.steps_per_tick = max(1, round(PHYSICS_RATE / tick_rate))
+            tick_rate = PHYSICS_RATE / self.steps_per_tick
+            self.loop_rate = PHYSICS_RATE
+        else:
+            self.loop_rate = tick_rate
+        self.step_count = 0
+
+        # Snapshot aggregation (None = relay every message immediately)
+        self.tick_rate = tick_rate
+        self.tick_count = 0
+        self.latest_states = {}
+
+        # Session IDs and unique names of the connected players (see PlayerRegistry)
+        self.players = PlayerRegistry()
+
+        # Optional UDP channel for player states (None = TCP only)
+        self.udp_port = udp_port
+        self.udp_channel = None
+
+        # Optional area of interest filtering (None = every client gets every player)
+        self.aoi = AreaOfInterest(aoi_margin) if aoi_margin is not None else None
+
+        # Optional dead reckoning filter for snapshots (None = every player in every tick)
+        self.dead_reckoning = DeadReckoningFilter(dead_reckoning) if dead_reckoning is not None and tick_rate else None
+
+        # Highest state rate clients should send at. In tick mode more states than ticks are useless.
+        self.max_send_rate = max_send_rate or DEFAULT_MAX_SEND_RATE
+        if tick_rate:
+            self.max_send_rate = min(self.max_send_rate, tick_rate)
+        self.send_rate = self.max_send_rate
+        self._send_rate_checked = 0
+        self._send_rate_dropped = 0
+
+        # Counters and histograms for capacity planning (see Metrics)
+        self.metrics = ServerMetrics()
+
+        # Optional session recording (None = nothing is recorded)
+        self.record_path = record
+        self.recorder = None
 
     def start(self):
         """Starts the server and accepts new clients."""
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen()
+        # stop() clears the attribute, the loop ends with the OSError of the closed socket
+        server_socket = self.server_socket
         print(f"[INFO] Server started on {self.host}:{self.port}")
+        self.start_services()
 
         try:
             while True:
-                conn, addr = self.server_socket.accept()
-                print(f"[INFO] New connection from {addr}")
-                handler = ClientHandler(conn, addr, self)
-                with self.lock:
-                    self.clients.append(handler)
-                handler.start()
+                conn, addr = server_socket.accept()
+                self.add_connection(conn, addr)
         except KeyboardInterrupt:
             print("[INFO] Server shutting down...")
+        except OSError:
+            # Server socket closed by stop(), other errors end the server like before
+            if self.running:
+                raise
         finally:
             self.stop()
 
-    def broadcast(self, message: bytes, exclude=None):
-        """Sends a message to all clients except the excluded one."""
+    def start_services(self):
+        """Starts everything except accepting connections (UDP channel and tick thread)."""
+        self.running = True
+        self.start_udp_channel()
+        self.start_recorder()
+        if self.tick_rate:
+            threading.Thread(target=self._tick_loop, daemon=True).start()
+
+    def start_recorder(self):
+        if self.record_path:
+            self.recorder = SessionRecorder(self.record_path)
+            self.recorder.start()
+            print(f"[INFO] Recording the session to {self.record_path}")
+
+    def add_connection(self, conn, addr, initial_data: bytes = b""):
+        """
+        Starts a handler for an accepted connection.
+
+        :param initial_data: Bytes that were already read from the connection (e.g. by the acceptor of the sharded server)
+        """
+        print(f"[INFO] New connection from {addr}")
+        handler = ClientHandler(conn, addr, self)
+        if initial_data:
+            handler.codec.feed(initial_data)
+            handler.received_bytes += len(initial_data)
+            self.metrics.bytes_received.inc(len(initial_data))
+        with self.lock:
+            self.clients.append(handler)
+        handler.start()
+
+    def start_udp_channel(self):
+        if self.udp_port is not None:
+            self.udp_channel = UdpStateChannel(self.host, self.udp_port, self)
+            self.udp_channel.start()
+            print(f"[INFO] UDP state channel on {self.host}:{self.udp_channel.port}")
+
+    def receive_data(self, client, data: bytes):
+        """Decodes all complete frames received from a client and handles them."""
+        client.codec.feed(data)
+        client.received_bytes += len(data)
+        self.metrics.bytes_received.inc(len(data))
+        self.handle_frames(client)
+
+    def handle_frames(self, client):
+        """Decodes and handles all complete frames in the receive buffer of a client."""
+        while client.running:
+            frame = client.codec.next_frame()
+            if frame is None:
+                break
+            try:
+                message = client.codec.decode(frame)
+            except ProtocolError as e:
+                self.metrics.decode_errors.inc()
+                print(f"[WARN] Invalid data from {client.addr}: {e}")
+                continue
+            self.metrics.messages_received.inc()
+            self.handle_message(client, message)
+
+    def handle_message(self, client, message: dict):
+        """Processes a decoded message from a client (shared by all server modes)."""
+        if "event" in message:
+            self.handle_event(client, message)
+            return
+
+        if client.car is not None:
+            # The server simulates this car, states of the client aren't trusted
+            return
+        try:
+            # Checked before the state is stored or relayed, encoding it for the other clients must not fail
+            validate_state(message)
+        except ProtocolError as e:
+            self.metrics.decode_errors.inc()
+            print(f"[WARN] Invalid state from {client.addr}: {e}")
+            return
+        if message.get("name") is not None:
+            # Clients without handshake only send their name and color in their states
+            self.update_player_info(client, message["name"], message.get("car_color"))
+        # Relayed with the session ID and the unique name of the player
+        message["id"] = client.player_id
+        message["name"] = client.name
+        if client.car_color is not None:
+            message["car_color"] = client.car_color
+        if self.aoi and "x" in message and "y" in message:
+            self.aoi.update_position(client, message["x"], message["y"])
+
+        client.last_state = message
+        if self.tick_rate:
+            with self.lock:
+                self.latest_states[client] = message
+        elif self.aoi:
+            self.relay_in_interest(client, message)
+        else:
+            self.broadcast(message, exclude=client)
+
+    def relay_in_interest(self, sender, message: dict):
+        """Relays a state only to the clients that have the sender in their area of interest."""
+        with self.lock:
+            clients = [client for client in self.clients if client.running]
+        start = time.perf_counter()
+        recipients, lost = self.aoi.relay_recipients(sender, clients)
+        cache = EncodeCache(message)
+        for client in recipients:
+            client.send(message, cache)
+        for client in lost:
+            self.send_out_of_range(client, sender)
+        self.metrics.broadcast_seconds.observe(time.perf_counter() - start)
+        if self.recorder:
+            self.recorder.record(message, cache)
+
+    def send_out_of_range(self, client, other):
+        """Tells a client that it won't get updates for another player until it is close again."""
+        if client.baselines:
+            client.baselines.remove_player(other.player_id)
+        client.send({"event": "out_of_range", "id": other.player_id, "name": other.name})
+
+    def handle_event(self, client, message: dict):
+        """Processes an event sent by a client."""
+        event = message.get("event")
+        if event == "hello":
+            protocol = choose_protocol(message.get("protocols", []))
+            welcome = {"event": "welcome", "protocol": protocol, "id": client.player_id}
+            if message.get("udp") and self.udp_channel and protocol == PROTOCOL_BINARY:
+                welcome["udp_port"] = self.udp_channel.port
+                welcome["udp_token"] = self.udp_channel.register(client)
+            if message.get("delta") and self.tick_rate:
+                client.baselines = ClientBaselines()
+                welcome["delta"] = True
+            if message.get("inputs") and self.authoritative:
+                client.car = CarPhysics()
+                welcome["authoritative"] = True
+            client.switch_protocol(protocol, welcome)
+            print(f"[INFO] {client.addr} negotiated protocol {protocol}")
+            # Tell the new client who is already playing
+            with self.lock:
+                others = [c for c in self.clients if c != client and c.announced_info]
+            for other in others:
+                client.send(self._player_info(other))
+            self.update_player_info(client, message.get("name"), message.get("car_color"))
+        elif event == "player_info":
+            self.update_player_info(client, message.get("name"), message.get("car_color"))
+        elif event == "input":
+            self.receive_inputs(client, message)
+        elif event == "ack":
+            if client.baselines:
+                client.baselines.ack(message.get("tick", 0))
+        elif event == "resync":
+            if client.baselines:
+                client.baselines.resync()
+        elif event == "ping":
+            # Answered through the outbound queue, so the RTT also shows how far the client's queue is behind
+            client.send_reliable({"event": "pong", "time": message.get("time"), "max_rate": self.send_rate_hint()})
+        elif event == "viewport":
+            if self.aoi:
+                self.aoi.set_viewport(client, message.get("width", 0), message.get("height", 0))
+        else:
+            print(f"[WARN] Unknown event from {client.addr}: {event}")
+
+    def receive_inputs(self, client, message: dict):
+        """Buffers the inputs of a client for the simulation, inputs that were already received are skipped."""
+        seq = message.get("seq")
+        inputs = message.get("inputs")
+        if client.car is None or not isinstance(seq, int) or not isinstance(inputs, list):
+            return
+        with client.input_lock:
+            for input_seq, bits in enumerate(inputs[:MAX_INPUTS_PER_MESSAGE], seq):
+                if input_seq <= client.received_input_seq or not isinstance(bits, int):
+                    continue
+                client.inputs.append((input_seq, bits & INPUT_MASK))
+                client.received_input_seq = input_seq
+            while len(client.inputs) > MAX_INPUT_BACKLOG:
+                # Client sends faster than real time, the correction puts it back on track
+                client.inputs.popleft()
+
+    def simulate(self):
+        """
+        Advances every simulated car by one physics step.
+
+        Every input of a client is simulated in exactly one step, in order, so
+        the server gets the same result as the client. If no input arrived in
+        time the car waits for it, unless it stands still: the client doesn't
+        send inputs while its car is parked.
+
+        Late inputs are caught up with two steps per physics step, but never
+        more steps than the car waited: a client can't drive faster than real
+        time by sending its inputs faster. Inputs beyond that are dropped, the
+        correction puts the client back on track.
+        """
+        with self.lock:
+            clients = [client for client in self.clients if client.running and client.car is not None]
+        for client in clients:
+            car = client.car
+            with client.input_lock:
+                steps = 1
+                if len(client.inputs) > INPUT_BUFFER_STEPS:
+                    if client.missed_steps:
+                        client.missed_steps -= 1
+                        steps = 2
+                    else:
+                        while len(client.inputs) > INPUT_BUFFER_STEPS:
+                            client.inputs.popleft()
+                inputs = [client.inputs.popleft() for _ in range(min(steps, len(client.inputs)))]
+            if inputs:
+                for seq, bits in inputs:
+                    car.step(bits)
+                client.input_seq = seq
+            elif car.is_at_rest():
+                car.step(0)
+            else:
+                client.missed_steps = min(MAX_INPUT_BACKLOG, client.missed_steps + 1)
+                continue
+
+            if client.name is None:
+                continue
+            state = car.to_state()
+            state.update(id=client.player_id, name=client.name, car_color=client.car_color)
+            if self.aoi:
+                self.aoi.update_position(client, state["x"], state["y"])
+            client.last_state = state
+            with self.lock:
+                self.latest_states[client] = state
+
+    def send_corrections(self):
+        """Sends every simulated client the authoritative state of its own car and the last simulated input."""
+        with self.lock:
+            clients = [client for client in self.clients if client.running and client.car is not None]
+        for client in clients:
+            correction = {"event": "correction", "seq": client.input_seq}
+            correction.update(client.car.get_physics_state())
+            client.send(correction)
+
+    def update_player_info(self, client, name, car_color):
+        """
+        Announces a player's name and car color to all clients when they changed.
+
+        :param name: Name the client asked for, the player gets a unique name from the registry
+        """
+        if name is None or car_color is None:
+            return
+        try:
+            if not isinstance(name, str):
+                raise ProtocolError("Invalid name")
+            car_color = validate_car_color(car_color)
+        except ProtocolError as e:
+            self.metrics.decode_errors.inc()
+            print(f"[WARN] Invalid player info from {client.addr}: {e}")
+            return
+        if name != client.requested_name:
+            client.requested_name = name
+            client.name = self.players.set_name(client, name)
+        client.car_color = list(car_color)
+        info = (client.name, client.car_color)
+        if info == client.announced_info:
+            return
+        client.announced_info = info
+        player_info = self._player_info(client)
+        self.broadcast(player_info, exclude=client)
+        self.forward_to_ui(player_info)
+
+    def send_rate_hint(self) -> float:
+        """
+        Returns the state rate (Hz) clients should currently send at most.
+
+        Every state is relayed to the other clients, so when outbound queues
+        start dropping messages all clients are asked to halve their rate.
+        Without drops the rate recovers step by step up to max_send_rate.
+        """
+        now = time.monotonic()
+        with self.lock:
+            if now - self._send_rate_checked >= SEND_RATE_HINT_INTERVAL:
+                self._send_rate_checked = now
+                dropped = sum(client.queue.dropped for client in self.clients)
+                if dropped > self._send_rate_dropped:
+                    self.send_rate = max(MIN_SEND_RATE_HINT, self.send_rate / 2)
+                else:
+                    self.send_rate = min(self.max_send_rate, self.send_rate * 1.25)
+                self._send_rate_dropped = dropped
+            return self.send_rate
+
+    def _player_info(self, client) -> dict:
+        return {"event": "player_info", "id": client.player_id, "name": client.name, "car_color": client.car_color}
+
+    def tick(self):
+        """
+        Sends one snapshot with the latest state of every player to all clients.
+
+        Clients that negotiated delta compression get a delta against their
+        last acknowledged baseline instead (or nothing if nothing changed).
+        With area of interest, clients only get the players close to them.
+        With dead reckoning, players whose movement the clients can
+        extrapolate are left out until the error gets too large.
+        """
+        with self.lock:
+            states = dict(self.latest_states)
+            clients = [client for client in self.clients if client.running]
+        if not states:
+            return
+        self.tick_count += 1
+        updated = None
+        if self.dead_reckoning:
+            updated = self.dead_reckoning.select(states, time.monotonic())
+        # Players left out keep their state in the delta baselines
+        players = [state for other, state in states.items() if updated is None or other in updated]
+        snapshot = {"event": "snapshot", "tick": self.tick_count, "players": players}
+        # Clients that see every player share the encoded snapshot
+        snapshot_cache = EncodeCache(snapshot)
+        for client in clients:
+            client_players = players
+            client_snapshot = snapshot
+            client_cache = snapshot_cache
+            if self.aoi and self.aoi.is_filtered(client):
+                visible = self.aoi.visible_clients(client)
+                for other in self.aoi.update_visible(client, visible):
+                    self.send_out_of_range(client, other)
+                client_players = [states[other] for other in visible if other in states and (updated is None or other in updated)]
+                client_snapshot = {"event": "snapshot", "tick": self.tick_count, "players": client_players}
+                client_cache = None
+            elif self.aoi:
+                # Remember what the client saw before its viewport or position is known
+                self.aoi.update_visible(client, [other for other in states if other is not client])
+
+            if client.baselines is None:
+                if client_players:
+                    client.send(client_snapshot, client_cache)
+                continue
+            delta = client.baselines.build_delta(self.tick_count, client_players)
+            if delta is not None:
+                client.send(delta)
+
+        if self.recorder:
+            # The recording always gets the whole world, not what dead reckoning left out
+            if updated is None:
+                self.recorder.record(snapshot, snapshot_cache)
+            else:
+                self.recorder.record({"event": "snapshot", "tick": self.tick_count, "players": list(states.values())})
+
+    def advance(self):
+        """One iteration of the tick loop: a physics step in authoritative mode and a snapshot tick when one is due."""
+        start = time.perf_counter()
+        if not self.authoritative:
+            self.tick()
+        else:
+            self.simulate()
+            self.step_count += 1
+            if self.step_count % self.steps_per_tick == 0:
+                self.tick()
+                self.send_corrections()
+        self.metrics.tick_seconds.observe(time.perf_counter() - start)
+
+    def _tick_loop(self):
+        interval = 1 / self.loop_rate
+        next_tick = time.perf_counter()
+        while self.running:
+            try:
+                self.advance()
+            except Exception as e:
+                # One failed tick must not stop the snapshots for good
+                self.metrics.tick_errors.inc()
+                print(f"[ERROR] Tick {self.tick_count} failed: {e!r}")
+            next_tick += interval
+            delay = next_tick - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # Tick took too long, don't try to catch up
+                next_tick = time.perf_counter()
+
+    def broadcast(self, message: dict, exclude=None):
+        """Sends a message to all clients except the excluded one, encoding it only once per protocol."""
+        start = time.perf_counter()
+        with self.lock:
+            clients = self.clients[:]
+        cache = EncodeCache(message)
+        for client in clients:
+            if client != exclude and client.running:
+                client.send(message, cache)
+        self.metrics.broadcast_seconds.observe(time.perf_counter() - start)
+        if self.recorder:
+            self.recorder.record(message, cache)
+
+    def queue_stats(self) -> dict:
+        """Returns the outbound queue metrics (depth, drops, ...) per client."""
+        with self.lock:
+            clients = self.clients[:]
+        return {f"{client.name} ({client.player_id})": client.queue.stats() for client in clients}
+
+    def server_stats(self) -> dict:
+        """Returns summary values for the admin UI."""
+        with self.lock:
+            clients = self.clients[:]
+        return {
+            "players": len(clients),
+            "queued": sum(client.queue.depth for client in clients),
+            "dropped": sum(client.queue.dropped for client in clients),
+            "messages": self.metrics.messages_received.value
+        }
+
+    def player_states(self) -> list:
+        """Returns the latest state of every player (for the admin interface, nothing is collected per message)."""
         with self.lock:
-            for client in self.clients[:]:
-                if client != exclude and client.running:
-                    client.send(message)
+            clients = self.clients[:]
+        return [client.last_state for client in clients if client.running and client.last_state is not None]
+
+    def collect_metrics(self) -> list:
+        """Returns the metric families of this server (see Metrics)."""
+        return self.metrics.collect(self)
 
     def remove_client(self, client):
         """Removes a client from the list."""
         with self.lock:
             if client in self.clients:
                 self.clients.remove(client)
+            self.latest_states.pop(client, None)
+            others = self.clients[:]
+        self.players.unregister(client)
+        for other in others:
+            if other.baselines:
+                other.baselines.remove_player(client.player_id)
+        if self.udp_channel:
+            self.udp_channel.unregister(client)
+        if self.aoi:
+            self.aoi.remove(client)
 
     def stop(self):
         """Stops the server and all clients."""
+        self.running = False
+        with self.lock:
+            clients = self.clients[:]
+        # ClientHandler.stop() calls remove_client(), so don't hold the lock here
+        for client in clients:
+            client.stop()
         with self.lock:
-            for client in self.clients:
-                client.stop()
             self.clients.clear()
-        if self.server_socket:
-            self.server_socket.close()
+        if self.udp_channel:
+            self.udp_channel.close()
+        if self.recorder:
+            self.recorder.close()
+        # The accept loop calls stop() as well when stop() ran in another thread, only one of them closes the socket
+        server_socket, self.server_socket = self.server_socket, None
+        if server_socket:
+            try:
+                # Wakes up accept() in start(), closing alone doesn't when stop() runs in another thread
+                server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server_socket.close()
             print("[INFO] Server socket closed")
 
     def forward_to_ui(self, message: dict):
-        """Optional: Forward message to UI"""
+        """Optional: Forward joins, leaves and player infos to the UI (states are fetched with player_states)"""
         if self.ui_callback:
             self.ui_callback(message)
 
@@ -127,19 +750,18 @@ class CarGameServer:
         """Kicks a Player from the Server"""
         print(f'Kicking {player_name}')
         try:
-            for client in self.clients:
-                print(f'Client: {client} - Clients: {self.clients}')
-                client: ClientHandler
-                if client.name == player_name:
-                    # Client found, execute a kick
-                    client.send({"event": "kicked", "reason": reason})
-                    self.remove_client(client)
-                    client.stop()
-                    self.ui_logbox_callback(LogLevel.INFO, f'Kicked {player_name} from the Server!')
-                    return
+            client = self.players.find(player_name)
+            if client is not None:
+                # Client found, execute a kick
+                client.send({"event": "kicked", "reason": reason})
+                self.remove_client(client)
+                client.stop()
+                self.ui_logbox_callback(LogLevel.INFO, f'Kicked {player_name} from the Server!')
+                return True
             self.ui_logbox_callback(LogLevel.WARN, f'Unable to find {player_name}: Did the Player already disconnect?')
         except Exception as e:
             self.ui_logbox_callback(LogLevel.ERROR, f'Unable to kick {player_name}: {e}')
+        return False
 
 
 
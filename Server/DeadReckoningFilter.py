@@ -0,0 +1,63 @@
+from DeadReckoning import MAX_EXTRAPOLATION_TIME, extrapolate, prediction_error
+
+# Angle difference (degrees) clients may draw wrong, the extrapolation keeps the angle
+DEFAULT_ANGLE_TOLERANCE = 5.0
+# Every moving player is sent at least this often, before the clients stop extrapolating
+MAX_SKIP_TIME = min(0.25, MAX_EXTRAPOLATION_TIME)
+# Players whose state didn't change at all are sent this often (for clients that just joined)
+KEEPALIVE_TIME = 1.0
+
+
+class DeadReckoningFilter:
+    """
+    Decides per tick which player states are worth sending.
+
+    The server remembers the last state it published per player. As long as
+    extrapolating that state (the same model the clients use, see
+    DeadReckoning) is within the tolerance of the player's current state and
+    the drifting/boosting flags didn't change, the player is left out of the
+    snapshots and deltas of this tick.
+    """
+
+    def __init__(self, tolerance: float, angle_tolerance: float = DEFAULT_ANGLE_TOLERANCE):
+        """
+        :param tolerance: Position error (world units) the clients' extrapolation may have
+        :param angle_tolerance: Angle error (degrees) the clients' extrapolation may have
+        """
+        self.tolerance = tolerance
+        self.angle_tolerance = angle_tolerance
+        self.published = {}     # client -> (state, time)
+
+        # Statistics
+        self.sent = 0
+        self.skipped = 0
+
+    def select(self, states: dict, now: float) -> set:
+        """
+        Returns the clients whose state is sent this tick.
+
+        :param states: client -> latest state
+        :param now: time.monotonic() of the tick
+        """
+        updated = set()
+        for client, state in states.items():
+            published = self.published.get(client)
+            if published is not None and not self._needs_update(published[0], published[1], state, now):
+                self.skipped += 1
+                continue
+            self.published[client] = (state, now)
+            updated.add(client)
+            self.sent += 1
+        for client in [client for client in self.published if client not in states]:
+            del self.published[client]
+        return updated
+
+    def _needs_update(self, published: dict, published_time: float, state: dict, now: float) -> bool:
+        if state is published or state == published:
+            return now - published_time >= KEEPALIVE_TIME
+        if now - published_time >= MAX_SKIP_TIME:
+            return True
+        if state.get("is_drifting") != published.get("is_drifting") or state.get("is_boosting") != published.get("is_boosting"):
+            return True
+        distance, angle = prediction_error(extrapolate(published, now - published_time), state)
+        return distance > self.tolerance or angle > self.angle_tolerance
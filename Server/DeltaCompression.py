@@ -0,0 +1,69 @@
+import threading
+
+from Protocol import diff_state
+
+# How many sent-but-unacknowledged worlds are kept per client
+MAX_BASELINE_HISTORY = 64
+
+
+class ClientBaselines:
+    """
+    Tracks which world states were sent to one client and which of them it acknowledged.
+
+    Every delta is built against the newest world the client acknowledged, so
+    lost or coalesced deltas don't matter: the next one still refers to a
+    baseline the client has. Without an acknowledged baseline (new client or
+    after a resync) the full state is sent.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = {}          # tick -> {player id: state}
+        self.acked_tick = 0
+
+    def build_delta(self, tick: int, players: list):
+        """
+        Builds the delta message for a tick.
+
+        :param tick: Server tick of the snapshot
+        :param players: Latest state dicts of the players this client should see
+        :return: Delta message or None if nothing changed since the baseline
+        """
+        with self.lock:
+            base = self.sent.get(self.acked_tick, {}) if self.acked_tick else {}
+            world = dict(base)
+            changes = []
+            for state in players:
+                player_id = state["id"]
+                previous = base.get(player_id)
+                if previous is not state and previous != state:
+                    changes.append(diff_state(previous, state))
+                world[player_id] = state
+            if not changes:
+                return None
+
+            self.sent[tick] = world
+            if len(self.sent) > MAX_BASELINE_HISTORY:
+                # Oldest entry first, dicts keep insertion order
+                del self.sent[next(iter(self.sent))]
+            return {"event": "delta", "tick": tick, "base": self.acked_tick, "players": changes}
+
+    def ack(self, tick: int):
+        """Marks a tick as received by the client, older baselines aren't needed anymore."""
+        with self.lock:
+            if tick <= self.acked_tick or tick not in self.sent:
+                return
+            self.acked_tick = tick
+            for old_tick in [t for t in self.sent if t < tick]:
+                del self.sent[old_tick]
+
+    def resync(self):
+        """Forgets all baselines, the next delta contains the full state."""
+        with self.lock:
+            self.sent.clear()
+            self.acked_tick = 0
+
+    def remove_player(self, player_id: int):
+        with self.lock:
+            for world in self.sent.values():
+                world.pop(player_id, None)
@@ -0,0 +1,219 @@
+"""
+Server metrics in the Prometheus text format.
+
+Counters and histograms are updated where the events happen, per-client
+values (bytes, queue depth, drops) are read from the clients when the
+metrics are collected. MetricsHttpServer serves the collected metrics at
+``/metrics`` for Prometheus (or curl).
+"""
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, from well below a millisecond up to a slow tick
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+class MetricFamily:
+    """Collected samples of one metric, ready to be rendered."""
+
+    def __init__(self, name: str, metric_type: str, help_text: str):
+        self.name = name
+        self.type = metric_type
+        self.help = help_text
+        self.samples = []   # (sample name, labels dict, value)
+
+    def add(self, value, labels: dict = None, suffix: str = ""):
+        self.samples.append((self.name + suffix, labels or {}, value))
+
+
+class Counter:
+    """Monotonically increasing value, updated from any thread."""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def collect(self) -> MetricFamily:
+        family = MetricFamily(self.name, "counter", self.help)
+        family.add(self.value)
+        return family
+
+
+class Histogram:
+    """Distribution of observed values (e.g. durations in seconds) in cumulative buckets."""
+
+    def __init__(self, name: str, help_text: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)     # last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def collect(self) -> MetricFamily:
+        family = MetricFamily(self.name, "histogram", self.help)
+        with self.lock:
+            counts = self.counts[:]
+            total, count = self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ["+Inf"], counts):
+            cumulative += bucket_count
+            family.add(cumulative, {"le": str(bound)}, "_bucket")
+        family.add(total, suffix="_sum")
+        family.add(count, suffix="_count")
+        return family
+
+
+class ServerMetrics:
+    """Counters and histograms of one CarGameServer (one room of the sharded server)."""
+
+    def __init__(self):
+        self.messages_received = Counter("cargame_messages_received_total", "Messages decoded from clients (TCP and UDP)")
+        self.messages_sent = Counter("cargame_messages_sent_total", "Messages queued for or sent to clients (TCP and UDP)")
+        self.bytes_received = Counter("cargame_received_bytes_total", "Bytes received from clients (TCP and UDP)")
+        self.bytes_sent = Counter("cargame_sent_bytes_total", "Bytes written to clients (TCP and UDP)")
+        self.decode_errors = Counter("cargame_decode_errors_total", "Received frames or datagrams that couldn't be decoded")
+        self.encode_errors = Counter("cargame_encode_errors_total", "Messages that couldn't be encoded for a client and weren't sent")
+        self.tick_errors = Counter("cargame_tick_errors_total", "Ticks that failed with an exception")
+        self.broadcast_seconds = Histogram("cargame_broadcast_seconds", "Time to encode and queue one message for all its recipients")
+        self.tick_seconds = Histogram("cargame_tick_seconds", "Duration of one tick (physics step and snapshot fan-out)")
+
+    def collect(self, server) -> list:
+        """Returns the metric families of the server, including the current per-client values."""
+        families = [
+            self.messages_received.collect(),
+            self.messages_sent.collect(),
+            self.bytes_received.collect(),
+            self.bytes_sent.collect(),
+            self.decode_errors.collect(),
+            self.encode_errors.collect(),
+            self.tick_errors.collect(),
+            self.broadcast_seconds.collect(),
+            self.tick_seconds.collect(),
+        ]
+        with server.lock:
+            clients = server.clients[:]
+
+        players = MetricFamily("cargame_players", "gauge", "Connected clients")
+        players.add(len(clients))
+        queued = MetricFamily("cargame_queued_messages", "gauge", "Messages waiting in the outbound queues of all clients")
+        queued.add(sum(client.queue.depth for client in clients))
+        client_sent = MetricFamily("cargame_client_sent_bytes_total", "counter", "Bytes written to a client (TCP and UDP)")
+        client_received = MetricFamily("cargame_client_received_bytes_total", "counter", "Bytes received from a client (TCP and UDP)")
+        client_depth = MetricFamily("cargame_client_queue_depth", "gauge", "Messages waiting in the outbound queue of a client")
+        client_dropped = MetricFamily("cargame_client_dropped_total", "counter", "Messages dropped from the outbound queue of a client")
+        for client in clients:
+            labels = {"player": str(client.name), "id": str(client.player_id)}
+            client_sent.add(client.queue.sent_bytes + client.udp_sent_bytes, labels)
+            client_received.add(client.received_bytes, labels)
+            client_depth.add(client.queue.depth, labels)
+            client_dropped.add(client.queue.dropped, labels)
+        families += [players, queued, client_sent, client_received, client_depth, client_dropped]
+
+        if server.dead_reckoning:
+            skipped = MetricFamily("cargame_dead_reckoning_skipped_total", "counter", "Player updates left out because clients can extrapolate them")
+            skipped.add(server.dead_reckoning.skipped)
+            families.append(skipped)
+        if server.recorder:
+            recorded = MetricFamily("cargame_recorded_messages_total", "counter", "Messages written to the session recording")
+            recorded.add(server.recorder.recorded)
+            recording_dropped = MetricFamily("cargame_recording_dropped_total", "counter", "Messages the session recording couldn't keep up with")
+            recording_dropped.add(server.recorder.dropped)
+            families += [recorded, recording_dropped]
+        return families
+
+
+def merge_families(labelled: list) -> list:
+    """
+    Merges the families of several servers into one list.
+
+    :param labelled: List of (extra labels, families), e.g. ({"room": "lobby"}, families)
+    """
+    merged = {}
+    for extra_labels, families in labelled:
+        for family in families:
+            target = merged.get(family.name)
+            if target is None:
+                target = merged[family.name] = MetricFamily(family.name, family.type, family.help)
+            for name, labels, value in family.samples:
+                target.samples.append((name, {**extra_labels, **labels}, value))
+    return list(merged.values())
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def render(families: list) -> str:
+    """Renders metric families in the Prometheus text exposition format."""
+    lines = []
+    for family in families:
+        lines.append(f"# HELP {family.name} {family.help}")
+        lines.append(f"# TYPE {family.name} {family.type}")
+        for name, labels, value in family.samples:
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}")
+            else:
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHttpServer:
+    """Serves ``/metrics`` over HTTP in a background thread."""
+
+    def __init__(self, host: str, port: int, collect):
+        """
+        :param collect: Function returning the metric families (e.g. CarGameServer.collect_metrics)
+        """
+        self.collect = collect
+        metrics_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                try:
+                    body = render(metrics_server.collect()).encode('utf-8')
+                except Exception as e:
+                    self.send_error(500, str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # Scrapes every few seconds would flood the console
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self.port = self.httpd.server_address[1]
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        print(f"[INFO] Metrics on http://{self.httpd.server_address[0]}:{self.port}/metrics")
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
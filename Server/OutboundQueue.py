@@ -0,0 +1,144 @@
+import threading
+from collections import OrderedDict
+
+POLICY_DROP = "drop"
+POLICY_DISCONNECT = "disconnect"
+
+
+def coalesce_key(message: dict):
+    """
+    Returns the key under which a message replaces older queued messages.
+
+    Only the latest state per player and the latest snapshot/delta matter, so
+    those are coalesced. Events are never coalesced (None).
+    """
+    event = message.get("event")
+    if event is None:
+        return ("state", message.get("id"))
+    if event in ("snapshot", "delta"):
+        # Deltas always refer to an acknowledged baseline, so skipping one is fine
+        return ("snapshot",)
+    if event == "correction":
+        # Every correction contains the complete state of the client's car
+        return ("correction",)
+    return None
+
+
+class OutboundQueue:
+    """
+    Bounded queue of encoded messages for one client, drained by its writer.
+
+    States are coalesced per player, so a slow client gets the latest state
+    instead of a growing backlog. If the queue still grows beyond max_size
+    the policy decides: ``drop`` discards the oldest state (or a new state
+    if only events are queued), ``disconnect`` closes the queue and marks it
+    as overflowed so the writer disconnects the client. Events are never
+    dropped, a queue full of events overflows with both policies.
+    """
+
+    def __init__(self, max_size: int = 256, policy: str = POLICY_DROP, on_put=None):
+        self.max_size = max_size
+        self.policy = policy
+        self.on_put = on_put
+        self.condition = threading.Condition()
+        self.entries = OrderedDict()
+        self._event_ids = 0
+        self.closed = False
+        self.overflowed = False
+
+        # Metrics
+        self.max_depth = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.sent_bytes = 0
+
+    @property
+    def depth(self) -> int:
+        return len(self.entries)
+
+    def put(self, data: bytes, key=None) -> bool:
+        """
+        Queues encoded data for sending.
+
+        :param key: Coalesce key, queued data with the same key is replaced
+        :return: False if the message was dropped or the queue is closed
+        """
+        with self.condition:
+            if self.closed:
+                return False
+            if key is None:
+                self._event_ids += 1
+                key = ("event", self._event_ids)
+            elif key in self.entries:
+                # Replace the older entry, the new one goes to the end to keep the order to events
+                del self.entries[key]
+                self.coalesced += 1
+
+            if len(self.entries) >= self.max_size:
+                if self.policy == POLICY_DROP and self._drop_oldest_state():
+                    pass
+                elif self.policy == POLICY_DROP and key[0] != "event":
+                    # Only events queued, the next state replaces this one anyway
+                    self.dropped += 1
+                    return False
+                else:
+                    # Events are never dropped (e.g. without a player_info the client ignores that player for good)
+                    self.overflowed = True
+                    self.closed = True
+                    self.condition.notify_all()
+                    self._notify()
+                    return False
+
+            self.entries[key] = data
+            self.max_depth = max(self.max_depth, len(self.entries))
+            self.condition.notify()
+        self._notify()
+        return True
+
+    def _drop_oldest_state(self) -> bool:
+        for key in self.entries:
+            if key[0] != "event":
+                del self.entries[key]
+                self.dropped += 1
+                return True
+        return False
+
+    def drain(self) -> list:
+        """Returns and removes everything that is queued (without waiting)."""
+        with self.condition:
+            batch = list(self.entries.values())
+            self.entries.clear()
+            return batch
+
+    def get(self) -> list:
+        """
+        Waits until data is queued and returns all of it.
+
+        :return: List of encoded messages, empty if the queue was closed and is empty
+        """
+        with self.condition:
+            while not self.entries and not self.closed:
+                self.condition.wait()
+            batch = list(self.entries.values())
+            self.entries.clear()
+            return batch
+
+    def close(self):
+        """Closes the queue, already queued data can still be drained."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self._notify()
+
+    def _notify(self):
+        if self.on_put:
+            self.on_put()
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "sent_bytes": self.sent_bytes
+        }
@@ -0,0 +1,72 @@
+import threading
+
+# bin1 sends player IDs as u16
+MAX_PLAYER_ID = 0xFFFF
+
+
+class PlayerRegistry:
+    """
+    Session IDs and names of the connected players of one server (or room).
+
+    Every connection gets a compact integer session ID when it is accepted,
+    clients are found by ID or by name with a dict lookup. Names are unique:
+    a player who asks for a name that is already taken gets "Name (2)",
+    "Name (3)", ... instead.
+
+    IDs count up and only wrap around after MAX_PLAYER_ID connections, so an
+    ID isn't handed out again right after its player left (other clients may
+    still get a late state or the disconnect event of the old player).
+    """
+
+    def __init__(self):
+        self.by_id = {}     # session ID -> client
+        self.by_name = {}   # name -> client
+        self.lock = threading.Lock()
+        self._next_id = 1
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def register(self, client) -> int:
+        """Assigns a session ID to a new client and returns it."""
+        with self.lock:
+            if len(self.by_id) >= MAX_PLAYER_ID:
+                raise RuntimeError("No free player IDs")
+            player_id = self._next_id
+            while player_id in self.by_id:
+                player_id = player_id % MAX_PLAYER_ID + 1
+            self._next_id = player_id % MAX_PLAYER_ID + 1
+            self.by_id[player_id] = client
+        return player_id
+
+    def unregister(self, client):
+        with self.lock:
+            if self.by_id.get(client.player_id) is client:
+                del self.by_id[client.player_id]
+            if client.name is not None and self.by_name.get(client.name) is client:
+                del self.by_name[client.name]
+
+    def set_name(self, client, name: str) -> str:
+        """
+        Registers the name a client asked for and returns the unique name it gets.
+
+        :param name: Name sent by the client, a client keeps its name if it asks for it again
+        """
+        with self.lock:
+            if client.name is not None and self.by_name.get(client.name) is client:
+                del self.by_name[client.name]
+            unique = name
+            number = 2
+            while self.by_name.get(unique, client) is not client:
+                unique = f"{name} ({number})"
+                number += 1
+            self.by_name[unique] = client
+        return unique
+
+    def get(self, player_id: int):
+        """Returns the client with this session ID or None."""
+        return self.by_id.get(player_id)
+
+    def find(self, name: str):
+        """Returns the client with this name or None."""
+        return self.by_name.get(name)
@@ -0,0 +1,76 @@
+import heapq
+
+
+class RunningMax:
+    """
+    Maximum of one value per key, for values that go up and down.
+
+    Every change pushes an entry onto a max-heap; entries that no longer
+    match the current value of their key are skipped when the maximum is read.
+    The heap is rebuilt once it holds too many such stale entries, so a change
+    costs O(log n) and the memory stays O(n).
+    """
+
+    def __init__(self):
+        self.values = {}
+        self.heap = []      # (-value, key)
+
+    def set(self, key, value):
+        if self.values.get(key) == value:
+            return
+        self.values[key] = value
+        heapq.heappush(self.heap, (-value, key))
+        if len(self.heap) > 2 * len(self.values) + 16:
+            self.heap = [(-v, k) for k, v in self.values.items()]
+            heapq.heapify(self.heap)
+
+    def remove(self, key):
+        self.values.pop(key, None)
+
+    def max(self):
+        """Returns (key, value) with the highest value or None."""
+        while self.heap:
+            value, key = self.heap[0]
+            if self.values.get(key) == -value:
+                return key, -value
+            heapq.heappop(self.heap)
+        return None
+
+
+class PlayerAggregates:
+    """
+    Running statistics over the latest state of every player.
+
+    Count and speed sum are adjusted by the difference to the player's
+    previous state, so a state update costs O(1) for the average and O(log n)
+    for the maxima (see RunningMax), independent of the number of players.
+    """
+
+    def __init__(self):
+        self.speeds = {}    # name -> speed_kmh
+        self.speed_sum = 0.0
+        self.max_speed = RunningMax()
+        self.top_points = RunningMax()
+
+    @property
+    def count(self) -> int:
+        return len(self.speeds)
+
+    def update(self, name, speed_kmh: float, points: float):
+        self.speed_sum += speed_kmh - self.speeds.get(name, 0.0)
+        self.speeds[name] = speed_kmh
+        self.max_speed.set(name, speed_kmh)
+        self.top_points.set(name, points)
+
+    def remove(self, name):
+        if name not in self.speeds:
+            return
+        self.speed_sum -= self.speeds.pop(name)
+        if not self.speeds:
+            # No rounding errors left over from earlier players
+            self.speed_sum = 0.0
+        self.max_speed.remove(name)
+        self.top_points.remove(name)
+
+    def average_speed(self) -> float:
+        return self.speed_sum / len(self.speeds) if self.speeds else 0.0
@@ -1,27 +1,118 @@
+import threading
+import time
+from collections import deque
 import tkinter as tk
 from tkinter import ttk
 from tkinter.scrolledtext import ScrolledText
 from datetime import datetime
 
+from PlayerStats import PlayerAggregates
+from ServerLog import ServerLog
+
 class LogLevel:
     INFO = 'INFO'
     WARN = 'WARN'
     ERROR = 'ERROR'
 
 
+# Abfrageintervall der Serverstatistik
+SERVER_STATS_INTERVAL_MS = 2000
+
+# Aktualisierungsintervall der Spieler-Tabelle (10 Hz reichen zum Ablesen)
+PLAYER_REFRESH_INTERVAL_MS = 100
+
+# Verlaufsdiagramme: ein Wert pro Sekunde, die letzten zwei Minuten
+SPARKLINE_INTERVAL_MS = 1000
+SPARKLINE_POINTS = 120
+
+# Neue Logzeilen werden gesammelt in diesem Intervall angezeigt, ältere Zeilen als LOG_VIEW_LINES entfernt
+LOG_FLUSH_INTERVAL_MS = 200
+LOG_VIEW_LINES = 1000
+LOG_COLORS = {"INFO": "white", "WARN": "yellow", "ERROR": "red"}
+
+# Wartezeit, bis eine nicht erreichbare Admin-Schnittstelle erneut abgefragt wird
+ADMIN_RETRY_INTERVAL = 2.0
+
+
+class Sparkline(tk.Canvas):
+    """
+    Kleines Verlaufsdiagramm der letzten Werte einer Kennzahl.
+
+    Pro Wert wird nur die Koordinatenliste der vorhandenen Linie ersetzt,
+    es werden keine Canvas-Objekte angelegt.
+    """
+
+    def __init__(self, master, label: str, color: str, width=240, height=36, points=SPARKLINE_POINTS):
+        super().__init__(master, width=width, height=height, bg="black", highlightthickness=0)
+        self.label = label
+        self.values = deque(maxlen=points)
+        self.line = self.create_line(0, height, 0, height, fill=color)
+        self.text = self.create_text(4, 2, anchor="nw", fill=color, text=label)
+
+    def add(self, value: float):
+        """
+        Hängt einen Wert an und zeichnet die Linie neu (skaliert auf das Maximum).
+
+        :param value: Neuer Wert
+        """
+        self.values.append(value)
+        width, height = int(self["width"]), int(self["height"])
+        top = max(self.values) or 1
+        step = width / max(1, self.values.maxlen - 1)
+        coords = []
+        for index, v in enumerate(self.values):
+            coords += (index * step, height - 1 - v / top * (height - 14))
+        if len(coords) == 2:
+            coords += coords
+        self.coords(self.line, *coords)
+        self.itemconfig(self.text, text=f"{self.label}: {value:.0f}")
+
+
 class CarGameServerUI(tk.Tk):
     """
     Graphische Benutzeroberfläche zur Anzeige und Verwaltung verbundener Spieler.
     """
 
-    def __init__(self, kick_player_function=None):
+    def __init__(self, kick_player_function=None, server_log: ServerLog = None):
+        """
+        :param server_log: Gemeinsames Log (z.B. mit Logdatei), sonst wird ein eigenes angelegt
+        """
         super().__init__()
+        self.server_log = server_log or ServerLog()
         self.title("Car Game Server UI")
         self.geometry("1000x600")
         self.players = {}
+        # Spielername -> Item-ID im Treeview und zuletzt angezeigte Zeile
+        self.player_items = {}
+        self.player_rows = {}
+        # Von den Netzwerk-Threads gefüllt, vom UI-Thread abgearbeitet (siehe drain_player_updates)
+        self._pending_lock = threading.Lock()
+        self._pending_states = {}       # Spielername -> neuester Zustand
+        self._pending_events = deque()  # join/leave in Eingangsreihenfolge
+        # Laufende Kennzahlen, pro Änderung aktualisiert statt pro Anzeige neu berechnet
+        self.aggregates = PlayerAggregates()
+        self._message_count = 0
+        self._message_rate = 0.0
+        self._rate_count = 0
+        self._rate_time = time.monotonic()
         self._build_ui()
         self.player_kick_by_name_function = None
         self.kick_player_function = kick_player_function
+        # Spieler, deren Kick gerade in einem Hintergrund-Thread läuft
+        self._kicking = set()
+        # Liefert Serverwerte (Räume, Spieler, Warteschlangen) für die Statistik, wird regelmäßig abgefragt
+        self.server_stats_function = None
+        # Liefert die Gesamtzahl empfangener Zustände (Admin-Schnittstelle), sonst werden die Aufrufe von update_player gezählt
+        self.message_total_function = None
+        # Beitritte und Abgänge protokolliert bei Anbindung an die Admin-Schnittstelle schon der Server
+        self.log_player_changes = True
+        self.server_stats = {}
+        self._fetched_server_stats = None
+        self._fetching_server_stats = False
+        self.after(SERVER_STATS_INTERVAL_MS, self.poll_server_stats)
+        self.after(PLAYER_REFRESH_INTERVAL_MS, self.drain_player_updates)
+        self.after(SPARKLINE_INTERVAL_MS, self.sample_sparklines)
+        self.after(LOG_FLUSH_INTERVAL_MS, self.flush_log)
 
     def _build_ui(self):
         # Spieler-Tabelle
@@ -41,15 +132,59 @@ class CarGameServerUI(tk.Tk):
         kick_btn = ttk.Button(self, text="Kick Selected Player", command=self.kick_selected_player)
         kick_btn.pack(pady=5)
 
-        # Statistikbereich
-        self.stats_label = tk.Label(self, text="Stats: ", anchor="w", justify="left")
-        self.stats_label.pack(fill=tk.X, padx=10)
+        # Statistikbereich mit Verlauf von Nachrichtenrate und Spielerzahl
+        stats_frame = tk.Frame(self)
+        stats_frame.pack(fill=tk.X, padx=10)
+        self.stats_label = tk.Label(stats_frame, text="Stats: ", anchor="w", justify="left")
+        self.stats_label.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        self.players_sparkline = Sparkline(stats_frame, "Players", "deepskyblue")
+        self.players_sparkline.pack(side=tk.RIGHT, padx=(5, 0))
+        self.rate_sparkline = Sparkline(stats_frame, "Messages/s", "lime")
+        self.rate_sparkline.pack(side=tk.RIGHT)
 
         # Logbox
         self.log_box = ScrolledText(self, height=10, state="disabled", bg="black", fg="white")
         self.log_box.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        for level, color in LOG_COLORS.items():
+            self.log_box.tag_config(level, foreground=color)
 
     def update_player(self, player_data: dict):
+        """
+        Nimmt eine Nachricht vom Server entgegen, darf aus jedem Thread aufgerufen werden.
+
+        Zustände werden pro Spieler zusammengefasst, nur der neueste wird bei
+        der nächsten Aktualisierung (drain_player_updates) angezeigt. Tk wird
+        hier nicht verwendet.
+
+        :param player_data: dict mit allen Feldern vom Client
+        """
+        event = player_data.get("event", None)
+        with self._pending_lock:
+            self._message_count += 1
+            if event is None:
+                self._pending_states[player_data["name"]] = player_data
+                return
+            if event == "leave":
+                # Ältere Zustände des Spielers sind überholt
+                self._pending_states.pop(player_data.get("name", None), None)
+            self._pending_events.append(player_data)
+
+    def drain_player_updates(self):
+        """
+        Überträgt die seit dem letzten Aufruf eingegangenen Nachrichten in die Tabelle (im UI-Thread).
+        """
+        with self._pending_lock:
+            events, self._pending_events = self._pending_events, deque()
+            states, self._pending_states = self._pending_states, {}
+        for player_data in events:
+            self._apply_player_update(player_data)
+        for player_data in states.values():
+            self._apply_player_update(player_data)
+        if events or states:
+            self.update_stats()
+        self.after(PLAYER_REFRESH_INTERVAL_MS, self.drain_player_updates)
+
+    def _apply_player_update(self, player_data: dict):
         """
         Aktualisiert oder fügt einen Spieler in der Tabelle hinzu.
 
@@ -61,28 +196,25 @@ class CarGameServerUI(tk.Tk):
             return
         elif player_data.get("event", None) == "leave":
             # A Player left the Server
-            self.log(LogLevel.INFO, f'{player_data.get("name", "Unknown Player (no name key)")} left the Server.')
+            if self.log_player_changes:
+                self.log(LogLevel.INFO, f'{player_data.get("name", "Unknown Player (no name key)")} left the Server.')
             self.remove_player(player_data.get("name", None))
             return
 
         name = player_data["name"]
         self.players[name] = player_data
+        self.aggregates.update(name, player_data.get("speed_kmh", 0), player_data.get("points", 0))
 
-        # Gibt es den Spieler bereits?
-        existing_items = self.player_tree.get_children()
-        found = False
-        for item in existing_items:
-            values = self.player_tree.item(item, 'values')
-            if values and values[0] == name:
-                self.player_tree.item(item, values=self._player_to_row(player_data))
-                found = True
-                break
-
-        if not found:
-            self.player_tree.insert('', tk.END, values=self._player_to_row(player_data))
-            self.log(LogLevel.INFO, f'Player {name} joined the Server')
-
-        self.update_stats()
+        row = self._player_to_row(player_data)
+        item = self.player_items.get(name)
+        if item is None:
+            self.player_items[name] = self.player_tree.insert('', tk.END, values=row)
+            if self.log_player_changes:
+                self.log(LogLevel.INFO, f'Player {name} joined the Server')
+        elif row != self.player_rows.get(name):
+            # Unveränderte Zeilen (z.B. stehende Spieler) kosten keinen Tk-Aufruf
+            self.player_tree.item(item, values=row)
+        self.player_rows[name] = row
 
     def remove_player(self, name):
         """
@@ -91,51 +223,191 @@ class CarGameServerUI(tk.Tk):
         :param name: Spielername
         """
         self.players.pop(name, None)
-        for item in self.player_tree.get_children():
-            values = self.player_tree.item(item, 'values')
-            if values and values[0] == name:
-                self.player_tree.delete(item)
-                break
+        self.aggregates.remove(name)
+        self.player_rows.pop(name, None)
+        item = self.player_items.pop(name, None)
+        if item is not None:
+            self.player_tree.delete(item)
         self.update_stats()
-        self.log(LogLevel.INFO, f"Player '{name}' removed (from UI Table)")
+        if self.log_player_changes:
+            self.log(LogLevel.INFO, f"Player '{name}' removed (from UI Table)")
 
     def kick_selected_player(self):
         """
-        Entfernt den aktuell ausgewählten Spieler aus der UI.
+        Kickt den aktuell ausgewählten Spieler, das Ergebnis wird über after() im UI-Thread angezeigt.
         """
         selected = self.player_tree.selection()
         if not selected:
             return
 
         item = selected[0]
-        name = self.player_tree.item(item)['values'][0]
-        self.kick_player_function(name, "No Reason specified.")
-        self.remove_player(name)
-        self.log(LogLevel.WARN, f"Player '{name}' kicked")
+        # Die Werte im Treeview sind umgewandelt (z.B. Zahlen), daher über den Index
+        name = next((player for player, player_item in self.player_items.items() if player_item == item), None)
+        if name is None or name in self._kicking:
+            return
+        # Der Kick geht über die Admin-Schnittstelle bzw. an die Worker und kann dauern, daher nicht im UI-Thread
+        self._kicking.add(name)
+        threading.Thread(target=self._kick_player, args=(name,), daemon=True).start()
+
+    def _kick_player(self, name):
+        try:
+            result = self.kick_player_function(name, "No Reason specified.")
+        except Exception as e:
+            result = e
+        self.after(0, self._kick_finished, name, result)
+
+    def _kick_finished(self, name, result):
+        """
+        Zeigt das Ergebnis eines Kicks an (im UI-Thread).
+
+        :param name: Spielername
+        :param result: Rückgabe der Kick-Funktion oder die aufgetretene Exception
+        """
+        self._kicking.discard(name)
+        if isinstance(result, Exception):
+            self.log(LogLevel.ERROR, f"Kicking '{name}' failed: {result}")
+        elif result is False:
+            self.log(LogLevel.WARN, f"Player '{name}' not found")
+        else:
+            self.remove_player(name)
+            self.log(LogLevel.WARN, f"Player '{name}' kicked")
 
     def update_stats(self):
         """
-        Berechnet und zeigt einfache Statistiken an.
+        Zeigt die laufenden Statistiken an, unabhängig von der Spielerzahl in O(1).
+        """
+        aggregates = self.aggregates
+        text = f"Stats: Players = {aggregates.count}, Avg Speed = {aggregates.average_speed():.1f} km/h"
+        fastest = aggregates.max_speed.max()
+        if fastest:
+            text += f", Max Speed = {fastest[1]:.1f} km/h"
+        leader = aggregates.top_points.max()
+        if leader:
+            text += f", Top = {leader[0]} ({leader[1]:.0f} Points)"
+        text += f", Messages/s = {self._message_rate:.0f}"
+        if self.server_stats:
+            text += " | Server: " + ", ".join(f"{key.capitalize()} = {value}" for key, value in self.server_stats.items())
+        self.stats_label.config(text=text)
+
+    def sample_sparklines(self):
+        """
+        Berechnet einmal pro Sekunde die Nachrichtenrate und ergänzt die Verlaufsdiagramme.
+        """
+        now = time.monotonic()
+        if self.message_total_function:
+            count = self.message_total_function()
+        else:
+            with self._pending_lock:
+                count = self._message_count
+        self._message_rate = (count - self._rate_count) / max(now - self._rate_time, 1e-6)
+        self._rate_count, self._rate_time = count, now
+        self.rate_sparkline.add(self._message_rate)
+        self.players_sparkline.add(self.aggregates.count)
+        self.update_stats()
+        self.after(SPARKLINE_INTERVAL_MS, self.sample_sparklines)
+
+    def attach_admin(self, admin_client):
         """
-        total = len(self.players)
-        avg_speed = 0
-        if total > 0:
-            avg_speed = sum(p.get("speed_kmh", 0) for p in self.players.values()) / total
-        self.stats_label.config(text=f"Stats: Players = {total}, Avg Speed = {avg_speed:.1f} km/h")
+        Verbindet die Oberfläche mit der Admin-Schnittstelle eines Servers (siehe AdminServer).
+
+        Ein Hintergrund-Thread fragt Spieler und neue Logzeilen im Takt der
+        Tabellenaktualisierung ab, Kick und Serverstatistik gehen ebenfalls
+        über die Admin-Schnittstelle. Der Server selbst ruft die Oberfläche
+        dann nicht mehr auf.
+
+        :param admin_client: AdminClient
+        """
+        self.kick_player_function = admin_client.kick
+        self.server_stats_function = admin_client.server_stats
+        self.log_player_changes = False
+        messages = [0]
+        self.message_total_function = lambda: messages[0]
+
+        def poll():
+            names = set()
+            position = 0
+            reachable = True
+            while True:
+                try:
+                    players, messages[0] = admin_client.players()
+                    records, position = admin_client.log(position)
+                except Exception as e:
+                    if reachable:
+                        self.log(LogLevel.ERROR, f"Admin interface not reachable: {e}")
+                    reachable = False
+                    time.sleep(ADMIN_RETRY_INTERVAL)
+                    continue
+                reachable = True
+                for created, level, message in records:
+                    self.server_log.log(level, message, created)
+                # Beim Server mit Worker-Prozessen sind Namen nur pro Raum eindeutig, angezeigt und gekickt wird "Raum/Name"
+                players = [dict(player, name=f'{player["room"]}/{player["name"]}') if "room" in player else player for player in players]
+                current = {player["name"] for player in players}
+                for name in names - current:
+                    self.update_player({"event": "leave", "name": name})
+                for player in players:
+                    self.update_player(player)
+                names = current
+                time.sleep(PLAYER_REFRESH_INTERVAL_MS / 1000)
+
+        threading.Thread(target=poll, daemon=True).start()
+
+    def poll_server_stats(self):
+        """
+        Zeigt die zuletzt abgefragte Serverstatistik an und startet die nächste Abfrage.
+
+        Die Abfrage läuft in einem eigenen Thread, da beim Server mit
+        Worker-Prozessen jeder Worker gefragt wird. Tk selbst wird nur im
+        UI-Thread verwendet.
+        """
+        if self._fetched_server_stats is not None:
+            self.server_stats = self._fetched_server_stats
+            self._fetched_server_stats = None
+            self.update_stats()
+        if self.server_stats_function and not self._fetching_server_stats:
+            self._fetching_server_stats = True
+            threading.Thread(target=self._fetch_server_stats, daemon=True).start()
+        self.after(SERVER_STATS_INTERVAL_MS, self.poll_server_stats)
+
+    def _fetch_server_stats(self):
+        try:
+            self._fetched_server_stats = self.server_stats_function()
+        except Exception as e:
+            self._fetched_server_stats = {"error": e}
+        finally:
+            self._fetching_server_stats = False
 
     def log(self, level, message):
         """
-        Fügt eine Nachricht in das Log-Feld ein mit Farbanpassung.
+        Schreibt eine Nachricht ins Log, darf aus jedem Thread aufgerufen werden.
+
+        Angezeigt wird sie bei der nächsten Aktualisierung (flush_log).
 
         :param level: INFO | WARN | ERROR
         :param message: Lognachricht
         """
-        self.log_box.config(state='normal')
-        color = {"INFO": "white", "WARN": "yellow", "ERROR": "red"}.get(level, "white")
-        self.log_box.insert(tk.END, f"[{level}|{datetime.now().strftime('%H:%M:%S')}] {message}\n", level)
-        self.log_box.tag_config(level, foreground=color)
-        self.log_box.config(state='disabled')
-        self.log_box.see(tk.END)
+        self.server_log.log(level, message)
+
+    def flush_log(self):
+        """
+        Zeigt die neuen Logzeilen mit einem einzigen Einfügen an und entfernt die ältesten Zeilen.
+        """
+        records = self.server_log.take_new()
+        if records:
+            # Nur mitscrollen, wenn das Ende des Logs sichtbar war
+            at_end = self.log_box.yview()[1] >= 1.0
+            chunks = []
+            for created, level, message in records:
+                chunks += (f"[{level}|{datetime.fromtimestamp(created).strftime('%H:%M:%S')}] {message}\n", level)
+            self.log_box.config(state='normal')
+            self.log_box.insert(tk.END, *chunks)
+            lines = int(self.log_box.index('end-1c').split('.')[0]) - 1
+            if lines > LOG_VIEW_LINES:
+                self.log_box.delete('1.0', f'{lines - LOG_VIEW_LINES + 1}.0')
+            self.log_box.config(state='disabled')
+            if at_end:
+                self.log_box.see(tk.END)
+        self.after(LOG_FLUSH_INTERVAL_MS, self.flush_log)
 
     def _player_to_row(self, player):
         """
@@ -0,0 +1,133 @@
+import io
+import json
+import logging
+import logging.handlers
+import threading
+import time
+from collections import deque
+
+# Records kept in memory (and waiting for the UI at most)
+LOG_CAPACITY = 2000
+
+# Rotating log file: size of one file and number of old files kept
+DEFAULT_LOG_FILE_SIZE = 5 * 1024 * 1024
+DEFAULT_LOG_FILE_BACKUPS = 3
+
+LEVELS = {"INFO": logging.INFO, "WARN": logging.WARNING, "ERROR": logging.ERROR}
+
+
+class ServerLog:
+    """
+    Thread-safe, bounded log of the server's admin messages.
+
+    Any thread may call log(), it never touches a UI: records go into a ring
+    buffer of the latest records and into a bounded list of records the UI
+    hasn't shown yet (see take_new), and optionally into a rotating log file
+    and a stream of JSON lines (headless mode), written by the calling thread.
+    """
+
+    def __init__(self, capacity: int = LOG_CAPACITY, log_file: str = None, max_bytes: int = DEFAULT_LOG_FILE_SIZE,
+                 backups: int = DEFAULT_LOG_FILE_BACKUPS, stream=None):
+        """
+        :param capacity: Records kept in memory
+        :param log_file: Path of the log file, None = no file
+        :param max_bytes: The log file is rotated when it reaches this size
+        :param backups: Number of rotated files kept (server.log.1, server.log.2, ...)
+        :param stream: Also write every record as a JSON line to this stream (e.g. sys.stdout)
+        """
+        self.records = deque(maxlen=capacity)   # (time, level, message)
+        self.pending = deque(maxlen=capacity)
+        self.skipped = 0
+        self.total = 0      # records logged so far, position for since()
+        self.lock = threading.Lock()
+        self.stream = stream
+
+        self.file_handler = None
+        if log_file:
+            self.file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backups, encoding="utf-8")
+            self.file_handler.setFormatter(logging.Formatter("%(asctime)s [%(levelname)s] %(message)s"))
+
+    def log(self, level: str, message: str, created: float = None):
+        """
+        :param level: INFO | WARN | ERROR
+        :param created: time.time() of the record if it was logged elsewhere (e.g. received from the admin interface)
+        """
+        record = (created or time.time(), level, message)
+        with self.lock:
+            self.records.append(record)
+            self.total += 1
+            if len(self.pending) == self.pending.maxlen:
+                self.skipped += 1
+            self.pending.append(record)
+            if self.stream:
+                line = {"time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record[0])), "level": level, "message": message}
+                self.stream.write(json.dumps(line) + "\n")
+                self.stream.flush()
+        if self.file_handler:
+            self.file_handler.handle(logging.makeLogRecord({"levelno": LEVELS.get(level, logging.INFO), "levelname": level,
+                                                             "msg": message, "created": record[0]}))
+
+    def take_new(self) -> list:
+        """Returns the records added since the last call, oldest first (with a note if some didn't fit)."""
+        with self.lock:
+            records = list(self.pending)
+            self.pending.clear()
+            skipped, self.skipped = self.skipped, 0
+        if skipped:
+            records.insert(0, (records[0][0], "WARN", f"{skipped} log lines skipped"))
+        return records
+
+    def since(self, position: int):
+        """
+        Returns the records logged after position and the new position.
+
+        :param position: 0 or the position returned by the previous call, records that are no longer kept are left out
+        """
+        with self.lock:
+            new = min(self.total - position, len(self.records))
+            records = list(self.records)[-new:] if new > 0 else []
+            return records, self.total
+
+    def recent(self, count: int = None) -> list:
+        """Returns the latest records (all kept records if count is None)."""
+        with self.lock:
+            records = list(self.records)
+        return records[-count:] if count else records
+
+    def capture_prints(self) -> "PrintCapture":
+        """Returns a stream that turns printed "[LEVEL] message" lines into records (for sys.stdout)."""
+        return PrintCapture(self)
+
+    def close(self):
+        if self.file_handler:
+            self.file_handler.close()
+
+
+class PrintCapture(io.TextIOBase):
+    """
+    Stream that logs every complete line written to it.
+
+    The server reports connects, disconnects and warnings with print("[INFO] ..."),
+    with this as sys.stdout those lines end up in the ServerLog. Lines are
+    collected per thread, so concurrent prints don't mix.
+    """
+
+    def __init__(self, server_log: ServerLog):
+        self.server_log = server_log
+        self.buffers = threading.local()
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        buffer = getattr(self.buffers, "text", "") + text
+        *lines, self.buffers.text = buffer.split("\n")
+        for line in lines:
+            if line.strip():
+                level, message = "INFO", line
+                if line.startswith("[") and "]" in line:
+                    prefix, message = line[1:].split("]", 1)
+                    level = prefix if prefix in LEVELS else "WARN" if prefix == "WARNING" else "INFO"
+                    message = message.strip()
+                self.server_log.log(level, message)
+        return len(text)
@@ -0,0 +1,90 @@
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from Protocol import PROTOCOL_BINARY
+from SessionFile import SessionWriter
+
+# Messages waiting for the writer, more are dropped (the relay never waits for the disk)
+RECORDER_QUEUE_SIZE = 10000
+
+
+class SessionRecorder(threading.Thread):
+    """
+    Records the relayed states and events of a server into a session file (see SessionFile).
+
+    record() only appends the message to a bounded queue, encoding and
+    writing (including the keyframes) happen in this background thread, one
+    write per batch. If the disk can't keep up the queue drops the oldest
+    messages and counts them. The index is written when the recorder is closed.
+    """
+
+    def __init__(self, path: str, max_pending: int = RECORDER_QUEUE_SIZE):
+        super().__init__(daemon=True)
+        self.path = path
+        self.writer = SessionWriter(path, time.time())
+        self.pending = deque(maxlen=max_pending)
+        self.condition = threading.Condition()
+        self.running = True
+
+        # Metrics
+        self.recorded = 0
+        self.dropped = 0
+
+    def record(self, message: dict, cache=None):
+        """
+        Queues a relayed message for the recording, never blocks on the disk.
+
+        :param cache: EncodeCache of the message, its bin1 encoding is reused if a client already needed it
+        """
+        encoded = cache.encoded.get(PROTOCOL_BINARY) if cache else None
+        with self.condition:
+            if len(self.pending) == self.pending.maxlen:
+                self.dropped += 1
+            self.pending.append((time.time(), message, encoded))
+            self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.pending:
+                    self.condition.wait()
+                batch = list(self.pending)
+                self.pending.clear()
+            if batch:
+                self.write(batch)
+            elif not self.running:
+                break
+        self.writer.close()
+
+    def write(self, batch):
+        written = 0
+        for created, message, encoded in batch:
+            try:
+                self.writer.write(max(0, round((created - self.writer.start_time) * 1000)), message, encoded)
+                written += 1
+            except Exception as e:
+                # E.g. a car color that doesn't fit into bytes, the writer has to keep running
+                print(f"[WARN] Unable to record {message.get('event', 'state')}: {e}")
+        try:
+            self.writer.flush()
+        except OSError as e:
+            self.dropped += written
+            print(f"[ERROR] Unable to write the session recording: {e}")
+            return
+        self.recorded += written
+
+    def close(self):
+        """Writes what is still queued and the index and closes the file."""
+        with self.condition:
+            if not self.running:
+                return
+            self.running = False
+            self.condition.notify()
+        if self.is_alive():
+            self.join()
+        else:
+            self.writer.close()
@@ -0,0 +1,450 @@
+import os
+import re
+import sys
+import socket
+import threading
+import itertools
+import multiprocessing
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CarGameServer import CarGameServer, LogLevel
+from FrameBuffer import FrameBuffer
+from Protocol import JsonCodec, ProtocolError
+from Metrics import merge_families
+
+# Room of clients that don't ask for one (including clients without handshake)
+DEFAULT_ROOM = "lobby"
+MAX_ROOM_NAME_LENGTH = 64
+# Rooms that may be open at the same time, clients asking for more go to DEFAULT_ROOM
+# (every room is a server with its own threads and recording file, the names come from clients)
+DEFAULT_MAX_ROOMS = 100
+# How long the acceptor waits for the first message of a new connection
+ROUTE_TIMEOUT = 2.0
+# How long kick and stats requests wait for the answer of a worker
+REQUEST_TIMEOUT = 2.0
+# How often workers stop the servers of empty rooms
+ROOM_CLEANUP_INTERVAL = 10.0
+
+
+class RoomWorker:
+    """
+    Runs in a worker process and owns some of the rooms.
+
+    Every room is an independent CarGameServer without its own listening
+    socket, the connections are handed over by the acceptor through the pipe.
+    Messages for the UI, log messages and answers to requests are sent back
+    through the same pipe.
+    """
+
+    def __init__(self, index, conn, room_options: dict, forward_ui: bool):
+        self.index = index
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.room_options = room_options
+        self.forward_ui = forward_ui
+        self.rooms = {}     # room name -> CarGameServer
+        self.connections = {}   # room name -> connections received since the room was opened
+        self.requests = {
+            "kick": self.kick,
+            "find": self.find,
+            "stats": self.stats,
+            "queue_stats": self.queue_stats,
+            "metrics": self.metrics,
+            "players": self.player_states,
+        }
+
+    def send(self, *message):
+        with self.send_lock:
+            try:
+                self.conn.send(message)
+            except OSError:
+                pass
+
+    def run(self):
+        try:
+            while True:
+                if not self.conn.poll(ROOM_CLEANUP_INTERVAL):
+                    self.close_empty_rooms()
+                    continue
+                command, *args = self.conn.recv()
+                if command == "connection":
+                    self.add_connection(*args)
+                elif command == "request":
+                    request_id, name, request_args = args
+                    try:
+                        result = self.requests[name](*request_args)
+                    except Exception as e:
+                        print(f"[ERROR] Worker {self.index}: request {name} failed: {e}")
+                        result = None
+                    self.send("reply", request_id, result)
+                elif command == "stop":
+                    break
+        except (EOFError, OSError, KeyboardInterrupt):
+            # Acceptor is gone
+            pass
+        finally:
+            for server in self.rooms.values():
+                server.stop()
+
+    def add_connection(self, room, addr, initial_data, conn):
+        server = self.rooms.get(room)
+        if server is None:
+            options = dict(self.room_options)
+            if options.get("record"):
+                # One recording per room: session.rec -> session-lobby.rec (room names are chosen by clients)
+                base, ext = os.path.splitext(options["record"])
+                options["record"] = f"{base}-{re.sub(r'[^A-Za-z0-9_-]', '_', room)}{ext}"
+            server = CarGameServer(
+                ui_callback=(lambda message, room=room: self.forward_to_ui(room, message)) if self.forward_ui else None,
+                ui_logbox_callback=self.log,
+                **options
+            )
+            server.start_services()
+            self.rooms[room] = server
+            print(f"[INFO] Worker {self.index} opened room '{room}'")
+        self.connections[room] = self.connections.get(room, 0) + 1
+        server.add_connection(conn, addr, initial_data)
+
+    def close_empty_rooms(self):
+        for room, server in list(self.rooms.items()):
+            with server.lock:
+                empty = not server.clients
+            if empty:
+                server.stop()
+                del self.rooms[room]
+                # The acceptor forgets the room unless connections for it are already on their way
+                self.send("room_closed", room, self.connections.pop(room, 0))
+                print(f"[INFO] Worker {self.index} closed empty room '{room}'")
+
+    def forward_to_ui(self, room: str, message: dict):
+        # Only joins, leaves and player infos, the acceptor asks for the states (see player_states)
+        self.send("ui", dict(message, room=room))
+
+    def log(self, level, message):
+        self.send("log", level, message)
+
+    def kick(self, room: str, player_name: str, reason: str) -> bool:
+        server = self.rooms.get(room)
+        return server is not None and server.kick_player_by_name(player_name, reason)
+
+    def find(self, player_name: str) -> list:
+        # Names are only unique within a room
+        return [room for room, server in list(self.rooms.items()) if server.players.find(player_name) is not None]
+
+    def stats(self) -> dict:
+        rooms = {}
+        for room, server in list(self.rooms.items()):
+            rooms[room] = server.server_stats()
+        return {"pid": os.getpid(), "rooms": rooms}
+
+    def player_states(self) -> list:
+        # Names are only unique within a room
+        return [dict(state, room=room) for room, server in list(self.rooms.items()) for state in server.player_states()]
+
+    def queue_stats(self) -> dict:
+        result = {}
+        for room, server in list(self.rooms.items()):
+            for client, stats in server.queue_stats().items():
+                result[f"{room}/{client}"] = stats
+        return result
+
+
+    def metrics(self) -> list:
+        # Counters of closed rooms are gone, Prometheus treats that like a restart
+        return merge_families([({"room": room}, server.collect_metrics()) for room, server in list(self.rooms.items())])
+
+
+def _worker_main(index, conn, room_options, forward_ui):
+    RoomWorker(index, conn, room_options, forward_ui).run()
+
+
+class WorkerHandle:
+    """Acceptor side of a worker process."""
+
+    def __init__(self, index, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.rooms = {}     # room name -> connections handed over since the worker opened the room
+
+    def send(self, *message):
+        # Connection objects aren't thread-safe, connections are routed by several threads
+        with self.send_lock:
+            self.conn.send(message)
+
+
+class ShardedCarGameServer:
+    """
+    Multi-process variant of the CarGameServer.
+
+    Players are grouped into rooms (the optional ``room`` of the hello message,
+    ``lobby`` by default). Every room is owned by one worker process, so rooms
+    run in parallel on multiple cores. This process only accepts connections,
+    reads the first message to find the room and hands the socket over to the
+    worker that owns the room. New rooms go to the worker with the fewest rooms.
+
+    Kicks and stats requested by the UI are forwarded to all workers. UDP
+    channels bind a random port per room, the port is sent in the welcome.
+    """
+
+    def __init__(self, host="0.0.0.0", port=5000, ui_callback=None, ui_logbox_callback=None, workers=None, max_rooms=DEFAULT_MAX_ROOMS, **room_options):
+        """
+        :param workers: Number of worker processes, None for one per CPU core
+        :param max_rooms: Rooms that may be open at the same time (including the default room)
+        :param room_options: Options of the CarGameServer of every room (tick_rate, aoi_margin, ...)
+        """
+        self.host = host
+        self.port = port
+        self.server_socket = None
+        self.ui_callback = ui_callback
+        self.ui_logbox_callback = ui_logbox_callback
+        self.worker_count = workers or os.cpu_count() or 1
+        self.max_rooms = max_rooms
+        if room_options.get("udp_port") is not None:
+            room_options["udp_port"] = 0
+        self.room_options = dict(room_options, host=host)
+        self.running = False
+
+        self.workers = []
+        self.room_workers = {}  # room name -> WorkerHandle (rooms stay on their worker)
+        self.lock = threading.Lock()
+        self._request_ids = itertools.count(1)
+        self._pending = {}      # request id -> Future
+
+    def start(self):
+        """Starts the workers and accepts new clients."""
+        # spawn instead of fork, this process may already run UI and other threads
+        context = multiprocessing.get_context("spawn")
+        for index in range(self.worker_count):
+            conn, child_conn = context.Pipe()
+            process = context.Process(
+                target=_worker_main,
+                args=(index, child_conn, self.room_options, self.ui_callback is not None),
+                daemon=True
+            )
+            process.start()
+            child_conn.close()
+            worker = WorkerHandle(index, process, conn)
+            self.workers.append(worker)
+            threading.Thread(target=self._listen_worker, args=(worker,), daemon=True).start()
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen()
+        # stop() clears the attribute, the loop ends with the OSError of the closed socket
+        server_socket = self.server_socket
+        self.running = True
+        print(f"[INFO] Server started on {self.host}:{self.port} ({self.worker_count} worker processes)")
+
+        try:
+            while True:
+                conn, addr = server_socket.accept()
+                threading.Thread(target=self._route, args=(conn, addr), daemon=True).start()
+        except KeyboardInterrupt:
+            print("[INFO] Server shutting down...")
+        except OSError:
+            # Server socket closed by stop()
+            pass
+        finally:
+            self.stop()
+
+    def _route(self, conn, addr):
+        """Reads the first message of a new connection and hands the connection to the worker of its room."""
+        buffer = FrameBuffer(4096)
+        room = DEFAULT_ROOM
+        try:
+            conn.settimeout(ROUTE_TIMEOUT)
+            while buffer.data.find(b'\n', 0, buffer.end) < 0:
+                if not buffer.recv_into(conn):
+                    conn.close()
+                    return
+            room = self._room_of(buffer)
+        except socket.timeout:
+            # Client without handshake that didn't send anything yet
+            pass
+        except OSError:
+            conn.close()
+            return
+
+        room, worker = self._worker_for(room)
+        try:
+            # The socket is duplicated into the worker process, this process doesn't need it anymore
+            conn.settimeout(None)
+            worker.send("connection", room, addr, bytes(buffer.pending()), conn)
+        except OSError as e:
+            print(f"[ERROR] Unable to hand {addr} to worker {worker.index}: {e}")
+            self._room_closed(worker, room, 1)
+        finally:
+            conn.close()
+
+    def _room_of(self, buffer: FrameBuffer) -> str:
+        end = buffer.data.find(b'\n', 0, buffer.end)
+        try:
+            message = JsonCodec().decode(buffer.view[:end])
+        except ProtocolError:
+            return DEFAULT_ROOM
+        room = message.get("room") if message.get("event") == "hello" else None
+        if not isinstance(room, str) or not room or len(room) > MAX_ROOM_NAME_LENGTH:
+            return DEFAULT_ROOM
+        return room
+
+    def _worker_for(self, room: str):
+        """Returns the room the connection goes to (DEFAULT_ROOM if no new room may be opened) and its worker."""
+        with self.lock:
+            other_rooms = len(self.room_workers) - (DEFAULT_ROOM in self.room_workers)
+            if room not in self.room_workers and room != DEFAULT_ROOM and other_rooms >= self.max_rooms - 1:
+                # One place is always left for the default room
+                print(f"[WARN] Room limit ({self.max_rooms}) reached, sending a player for room '{room}' to '{DEFAULT_ROOM}'")
+                room = DEFAULT_ROOM
+            worker = self.room_workers.get(room)
+            if worker is None:
+                worker = min(self.workers, key=lambda w: len(w.rooms))
+                self.room_workers[room] = worker
+            worker.rooms[room] = worker.rooms.get(room, 0) + 1
+            return room, worker
+
+    def _room_closed(self, worker: WorkerHandle, room: str, received: int):
+        """Forgets a room once its worker received all connections that were handed over for it (received = connections the worker got)."""
+        with self.lock:
+            routed = worker.rooms.get(room)
+            if routed is None:
+                return
+            if routed > received:
+                # The worker opens the room again for the connections that are on their way
+                worker.rooms[room] = routed - received
+            else:
+                del worker.rooms[room]
+                self.room_workers.pop(room, None)
+
+    def _listen_worker(self, worker: WorkerHandle):
+        """Handles the messages a worker sends back (UI updates, logs, request answers)."""
+        while True:
+            try:
+                command, *args = worker.conn.recv()
+            except (EOFError, OSError):
+                break
+            if command == "ui":
+                if self.ui_callback:
+                    self.ui_callback(args[0])
+            elif command == "log":
+                if self.ui_logbox_callback:
+                    self.ui_logbox_callback(*args)
+            elif command == "room_closed":
+                self._room_closed(worker, *args)
+            elif command == "reply":
+                request_id, result = args
+                future = self._pending.pop(request_id, None)
+                if future:
+                    future.set_result(result)
+        if self.running:
+            print(f"[ERROR] Worker {worker.index} stopped")
+
+    def _request_all(self, name: str, *args) -> list:
+        """Sends a request to all workers and returns their answers (None for workers that didn't answer)."""
+        return self._request(self.workers, name, *args)
+
+    def _request(self, workers: list, name: str, *args) -> list:
+        """Sends a request to the given workers and returns their answers (None for workers that didn't answer)."""
+        futures = []
+        for worker in workers:
+            request_id = next(self._request_ids)
+            future = Future()
+            self._pending[request_id] = future
+            try:
+                worker.send("request", request_id, name, args)
+            except OSError:
+                self._pending.pop(request_id, None)
+                future.set_result(None)
+            futures.append((request_id, future))
+
+        results = []
+        for request_id, future in futures:
+            try:
+                results.append(future.result(timeout=REQUEST_TIMEOUT))
+            except FutureTimeoutError:
+                self._pending.pop(request_id, None)
+                results.append(None)
+        return results
+
+    def kick_player_by_name(self, player_name: str, reason: str) -> bool:
+        """
+        Kicks a Player from the Server, no matter which worker it is connected to.
+
+        Names are only unique within a room, so the player is given as
+        ``room/name`` (like in queue_stats and the admin UI) or by a name that
+        only one room has. Raises ValueError if several rooms have a player
+        with that name.
+        """
+        with self.lock:
+            # Room names may contain "/" as well, every split that names an open room is a candidate
+            targets = [(player_name[:i], player_name[i + 1:], self.room_workers[player_name[:i]])
+                       for i, char in enumerate(player_name) if char == "/" and player_name[:i] in self.room_workers]
+        if not targets:
+            rooms = [room for found in self._request_all("find", player_name) if found for room in found]
+            if len(rooms) > 1:
+                raise ValueError(f"{player_name} is in several rooms, kick one of: {', '.join(sorted(f'{room}/{player_name}' for room in rooms))}")
+            with self.lock:
+                targets = [(room, player_name, self.room_workers[room]) for room in rooms if room in self.room_workers]
+        for room, name, worker in targets:
+            if any(self._request([worker], "kick", room, name, reason)):
+                return True
+        if self.ui_logbox_callback:
+            self.ui_logbox_callback(LogLevel.WARN, f'Unable to find {player_name}: Did the Player already disconnect?')
+        return False
+
+    def worker_stats(self) -> list:
+        """Returns the rooms and their stats per worker."""
+        return self._request_all("stats")
+
+    def queue_stats(self) -> dict:
+        """Returns the outbound queue metrics per client of all workers ("room/name (id)" -> stats)."""
+        result = {}
+        for stats in self._request_all("queue_stats"):
+            result.update(stats or {})
+        return result
+
+    def collect_metrics(self) -> list:
+        """Returns the metric families of all rooms of all workers, labelled with worker and room."""
+        return merge_families([({"worker": str(index)}, families) for index, families in enumerate(self._request_all("metrics")) if families])
+
+    def server_stats(self) -> dict:
+        """Returns summary values for the admin UI, summed up over all workers."""
+        total = {"workers": len(self.workers), "rooms": 0, "players": 0, "queued": 0, "dropped": 0, "messages": 0}
+        for stats in self.worker_stats():
+            if stats is None:
+                continue
+            for room_stats in stats["rooms"].values():
+                total["rooms"] += 1
+                for key in ("players", "queued", "dropped", "messages"):
+                    total[key] += room_stats[key]
+        return total
+
+    def player_states(self) -> list:
+        """Returns the latest state of every player of all workers, with the ``room`` of the player."""
+        return [state for states in self._request_all("players") if states for state in states]
+
+    def stop(self):
+        """Stops the acceptor and all workers."""
+        self.running = False
+        # The accept loop calls stop() as well when stop() ran in another thread, only one of them closes the socket
+        server_socket, self.server_socket = self.server_socket, None
+        if server_socket:
+            try:
+                # Wakes up accept() in start(), closing alone doesn't when stop() runs in another thread
+                server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            server_socket.close()
+            print("[INFO] Server socket closed")
+        for worker in self.workers:
+            try:
+                worker.send("stop")
+            except OSError:
+                pass
+        for worker in self.workers:
+            worker.process.join(timeout=2)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        self.workers.clear()
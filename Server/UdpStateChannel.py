@@ -0,0 +1,119 @@
+import random
+import socket
+import threading
+
+from Protocol import BinaryCodec, MAX_DATAGRAM_SIZE, ProtocolError, decode_datagram, encode_datagram, is_unreliable
+
+
+class UdpStateChannel(threading.Thread):
+    """
+    Unreliable UDP channel for the high-rate player states.
+
+    Clients get a token over their TCP connection (see the welcome message) and
+    send their states (or inputs) as datagrams tagged with that token and a sequence number.
+    The first datagram of a client registers its UDP endpoint, from then on the
+    server also sends the states and snapshots for that client over UDP.
+    Reliable events (disconnect, kicked, ...) always stay on TCP.
+    """
+
+    def __init__(self, host, port, server):
+        super().__init__(daemon=True)
+        self.server = server
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((host, port))
+        self.port = self.sock.getsockname()[1]
+        self.running = True
+        self.clients_by_token = {}
+        self.lock = threading.Lock()
+        # Only used for encoding, which doesn't depend on codec state
+        self.codec = BinaryCodec()
+
+    def register(self, client) -> int:
+        """Assigns a UDP token to the client and returns it."""
+        with self.lock:
+            token = random.getrandbits(32)
+            while token in self.clients_by_token:
+                token = random.getrandbits(32)
+            self.clients_by_token[token] = client
+        client.udp_token = token
+        return token
+
+    def unregister(self, client):
+        with self.lock:
+            self.clients_by_token.pop(client.udp_token, None)
+
+    def run(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(2048)
+            except OSError:
+                # Socket closed or ICMP port unreachable from a client
+                if not self.running:
+                    break
+                continue
+            self.handle_datagram(data, addr)
+
+    def handle_datagram(self, data: bytes, addr):
+        metrics = self.server.metrics
+        metrics.bytes_received.inc(len(data))
+        try:
+            token, sequence, frame = decode_datagram(data)
+        except ProtocolError:
+            metrics.decode_errors.inc()
+            return
+
+        with self.lock:
+            client = self.clients_by_token.get(token)
+        if client is None or not client.running:
+            return
+        if sequence <= client.udp_recv_seq:
+            # Stale or duplicated datagram
+            return
+        client.udp_recv_seq = sequence
+        client.received_bytes += len(data)
+
+        if client.udp_addr != addr:
+            first_datagram = client.udp_addr is None
+            client.udp_addr = addr
+            if first_datagram:
+                client.send_reliable({"event": "udp_ready"})
+
+        if frame is None:
+            # Probe, only used to register the client's endpoint
+            return
+        try:
+            message = client.codec.decode(frame)
+        except ProtocolError as e:
+            metrics.decode_errors.inc()
+            print(f"[WARN] Invalid datagram from {addr}: {e}")
+            return
+        if not is_unreliable(message):
+            # Events are only accepted over TCP
+            return
+        metrics.messages_received.inc()
+        self.server.handle_message(client, message)
+
+    def send(self, client, message: dict, cache=None) -> bool:
+        """
+        Sends a state or snapshot to the client.
+
+        :param cache: Optional EncodeCache of the message, the bin1 frame is the same as over TCP
+        :return: False if the message is too large for a datagram and has to go over TCP
+        """
+        frame = cache.encode(self.codec) if cache else self.codec.encode(message)
+        datagram = encode_datagram(client.udp_token, next(client.udp_send_seq), frame)
+        if len(datagram) > MAX_DATAGRAM_SIZE:
+            return False
+        try:
+            self.sock.sendto(datagram, client.udp_addr)
+        except OSError:
+            # Unreliable channel, the next state will replace this one anyway
+            return True
+        client.udp_sent_bytes += len(datagram)
+        self.server.metrics.messages_sent.inc()
+        self.server.metrics.bytes_sent.inc(len(datagram))
+        return True
+
+    def close(self):
+        self.running = False
+        self.sock.close()
@@ -0,0 +1,78 @@
+"""
+Command line admin tool for a running server (see AdminServer).
+
+Usage (from the Server directory):
+    python admin.py list
+    python admin.py kick <name> [--reason "..."]    (room/name with --workers)
+    python admin.py stats
+    python admin.py log [--follow]
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+from AdminClient import AdminClient, AdminError
+from AdminServer import DEFAULT_ADMIN_PORT
+
+LOG_FOLLOW_INTERVAL = 0.5
+
+
+def print_records(records):
+    for created, level, message in records:
+        print(f"[{level}|{datetime.fromtimestamp(created).strftime('%H:%M:%S')}] {message}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_ADMIN_PORT, help="Admin port of the server")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="List the connected players")
+    kick = commands.add_parser("kick", help="Kick a player")
+    kick.add_argument("name", help="Name of the player, room/name on servers with --workers")
+    kick.add_argument("--reason", default="No Reason specified.")
+    commands.add_parser("stats", help="Show server and player statistics")
+    log = commands.add_parser("log", help="Show the latest log lines")
+    log.add_argument("--follow", "-f", action="store_true", help="Keep printing new log lines")
+    args = parser.parse_args()
+
+    client = AdminClient(args.host, args.port)
+    try:
+        if args.command == "list":
+            players, _ = client.players()
+            print(f"{'Name':<20} {'Points':>8} {'Speed':>7} {'X':>9} {'Y':>9}")
+            for player in players:
+                if "room" in player:
+                    # Sharded servers: names are only unique per room, kick takes "room/name"
+                    player["name"] = f"{player['room']}/{player.get('name')}"
+            for player in sorted(players, key=lambda p: str(p.get("name"))):
+                print(f"{str(player.get('name')):<20} {player.get('points', 0):8.0f} {player.get('speed_kmh', 0):7.1f} "
+                      f"{player.get('x', 0):9.1f} {player.get('y', 0):9.1f}")
+            print(f"{len(players)} players")
+        elif args.command == "kick":
+            if not client.kick(args.name, args.reason):
+                print(f"Player {args.name} not found")
+                sys.exit(1)
+            print(f"Kicked {args.name}")
+        elif args.command == "stats":
+            print(json.dumps(client.stats(), indent=2))
+        elif args.command == "log":
+            records, position = client.log()
+            print_records(records)
+            while args.follow:
+                time.sleep(LOG_FOLLOW_INTERVAL)
+                records, position = client.log(position)
+                print_records(records)
+    except (OSError, AdminError) as e:
+        print(f"[ERROR] {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    main()
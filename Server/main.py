@@ -1,20 +1,118 @@
+import argparse
+import signal
+import sys
 import threading
 from CarGameServer import CarGameServer
-from ServerGUI import CarGameServerUI  # die angepasste UI-Klasse
+from AsyncCarGameServer import AsyncCarGameServer
+from ShardedCarGameServer import ShardedCarGameServer, DEFAULT_MAX_ROOMS
+from Metrics import MetricsHttpServer
+from ServerLog import ServerLog
+from AdminServer import AdminServer, DEFAULT_ADMIN_PORT
+from AdminClient import AdminClient
+from OutboundQueue import POLICY_DISCONNECT, POLICY_DROP
 
-def main():
+
+# Seconds the server gets to shut down after the UI was closed
+SHUTDOWN_TIMEOUT = 5.0
+
+
+def stop_on_sigterm(signum, frame):
+    raise KeyboardInterrupt
+
+
+def start_ui(admin_host: str, admin_port: int):
+    """Runs the Tk admin UI as a client of the admin interface until its window is closed."""
+    # Only imported here, headless servers don't need Tk
+    from ServerGUI import CarGameServerUI
     app = CarGameServerUI()
+    app.attach_admin(AdminClient(admin_host, admin_port))
+    app.mainloop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Car Game Multiplayer Server")
+    parser.add_argument("--asyncio", action="store_true", help="Serve all clients on one asyncio event loop instead of one thread per client")
+    parser.add_argument("--tick-rate", type=float, default=None, help="Send one combined world snapshot per tick at this rate (Hz) instead of relaying every message")
+    parser.add_argument("--udp-port", type=int, default=None, help="Offer an unreliable UDP channel for player states on this port")
+    parser.add_argument("--aoi-margin", type=float, default=None, help="Only send clients the players within their viewport plus this margin (world units)")
+    parser.add_argument("--queue-size", type=int, default=256, help="Maximum number of messages queued per client")
+    parser.add_argument("--queue-policy", choices=[POLICY_DROP, POLICY_DISCONNECT], default=POLICY_DROP, help="What to do when a client's queue is full: drop the oldest state or disconnect the client")
+    parser.add_argument("--max-send-rate", type=float, default=None, help="Highest rate (Hz) clients should send their state at (default: 60 or the tick rate)")
+    parser.add_argument("--authoritative", action="store_true", help="Simulate the cars on the server from the clients' inputs (implies --tick-rate 30 unless given)")
+    parser.add_argument("--dead-reckoning", type=float, default=None, help="Skip player updates while clients can extrapolate them within this many world units (tick mode)")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics at http://127.0.0.1:<port>/metrics")
+    parser.add_argument("--log-file", default=None, help="Also write the server log to this file (rotated at 5 MB, 3 old files kept)")
+    parser.add_argument("--record", default=None, help="Record the relayed states and events into this session file (see Tools/replay_session.py)")
+    parser.add_argument("--workers", type=int, default=None, help="Run rooms in this many worker processes (0 = one per CPU core)")
+    parser.add_argument("--max-rooms", type=int, default=DEFAULT_MAX_ROOMS, help="Rooms that may be open at the same time with --workers, players asking for more join the lobby")
+    parser.add_argument("--admin-port", type=int, default=DEFAULT_ADMIN_PORT, help="Port of the local admin interface (list, kick, stats, log; see admin.py)")
+    parser.add_argument("--headless", action="store_true", help="Run without the admin UI, log as JSON lines to stdout")
+    parser.add_argument("--ui-only", action="store_true", help="Only start the admin UI and connect it to a running server's admin port")
+    parser.add_argument("--admin-host", default="127.0.0.1", help="Host of the admin interface for --ui-only (e.g. through an SSH tunnel)")
+    args = parser.parse_args(argv)
+    if args.max_rooms < 1:
+        parser.error("--max-rooms must be at least 1")
+    if args.workers is not None and args.asyncio:
+        parser.error("--workers can't be combined with --asyncio")
+    if args.dead_reckoning is not None and not (args.tick_rate or args.authoritative):
+        parser.error("--dead-reckoning needs --tick-rate or --authoritative")
+    return args
 
+
+def create_server(args, server_log: ServerLog, port=5000):
+    """
+    Builds the server and its admin interface from the command line arguments (also used by Benchmarks/bench_sharded.py).
+
+    :return: Tuple (server, admin), neither is started yet
+    """
+    # The server only talks to the admin interface, the UI (if any) is one of its clients
     def ui_callback(message: dict):
-        app.update_player(message)
+        admin.on_message(message)
+
+    options = dict(tick_rate=args.tick_rate, udp_port=args.udp_port, aoi_margin=args.aoi_margin, queue_size=args.queue_size, queue_policy=args.queue_policy, max_send_rate=args.max_send_rate, authoritative=args.authoritative, dead_reckoning=args.dead_reckoning, record=args.record)
+    if args.workers is not None:
+        server = ShardedCarGameServer(host="127.0.0.1", port=port, ui_callback=ui_callback, ui_logbox_callback=server_log.log, workers=args.workers or None, max_rooms=args.max_rooms, **options)
+    else:
+        server_class = AsyncCarGameServer if args.asyncio else CarGameServer
+        server = server_class(host="127.0.0.1", port=port, ui_callback=ui_callback, ui_logbox_callback=server_log.log, **options)
+    admin = AdminServer(server, server_log, port=args.admin_port)
+    return server, admin
 
-    def start_server():
-        server = CarGameServer(host="127.0.0.1", port=5000, ui_callback=ui_callback, ui_logbox_callback=app.log)
-        app.kick_player_function = server.kick_player_by_name
+
+def main():
+    args = parse_args()
+    if args.ui_only:
+        start_ui(args.admin_host, args.admin_port)
+        return
+
+    if args.headless:
+        # Everything the server prints becomes a structured log record
+        server_log = ServerLog(log_file=args.log_file, stream=sys.stdout)
+        sys.stdout = server_log.capture_prints()
+    else:
+        server_log = ServerLog(log_file=args.log_file)
+
+    server, admin = create_server(args, server_log)
+    admin.start()
+    if args.metrics_port is not None:
+        MetricsHttpServer("127.0.0.1", args.metrics_port, server.collect_metrics).start()
+
+    # Service managers stop with SIGTERM, shut down like on Ctrl+C (e.g. the recording's index is written)
+    signal.signal(signal.SIGTERM, stop_on_sigterm)
+    if args.headless:
         server.start()
+        return
+    server_thread = threading.Thread(target=server.start, daemon=True)
+    server_thread.start()
+    try:
+        start_ui("127.0.0.1", admin.port)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # The server thread is a daemon, it has to be stopped before the process ends (closes the recording)
+        server.stop()
+        server_thread.join(SHUTDOWN_TIMEOUT)
 
-    threading.Thread(target=start_server, daemon=True).start()
-    app.mainloop()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,193 @@
+"""
+Car physics shared by the client and the server (no pygame dependency).
+
+The physics advance in fixed steps of ``1 / PHYSICS_RATE`` seconds, driven
+by an input bitmask per step (see the ``INPUT_*`` bits). The client creates
+the bitmask from the pressed keys, the server simulates the same steps from
+the bitmasks it receives, so both end up with the same car state.
+"""
+import math
+
+# Steps per second, velocities are in world units per step
+PHYSICS_RATE = 60
+STEP_TIME = 1 / PHYSICS_RATE
+
+# Input bits (one bitmask per physics step)
+INPUT_ACCELERATE = 1    # W
+INPUT_BRAKE = 2         # S
+INPUT_LEFT = 4          # A
+INPUT_RIGHT = 8         # D
+INPUT_DRIFT = 16        # SPACE
+INPUT_NITRO = 32        # SHIFT
+INPUT_MASK = 63
+
+# CAR TUNING - Easy to modify these values (client and server have to use the same ones)
+MAX_SPEED = 65          # Maximum speed of the car in m/s
+ACCELERATION = 0.3     # How fast the car accelerates
+TURN_SPEED = 5         # How responsive steering is (normal driving)
+DRIFT_TURN_SPEED = 2.5   # How responsive steering is (while drifting)
+MAX_NITRO = 100
+
+# Points
+HIGHSPEED_BONUS_KMH = 50
+HIGHSPEED_BONUS_POINTS = 500
+NITRO_POINTS = 2        # per step with nitro
+
+# Below this speed (units per step) the car only rolls out a few units
+REST_SPEED = 0.01
+
+
+class CarPhysics:
+    """Position, velocity and nitro of one car and the fixed step that updates them."""
+
+    def __init__(self, x=0.0, y=0.0, max_speed: int = MAX_SPEED, acceleration: float = ACCELERATION, turn_speed: float = TURN_SPEED,
+                 drift_turn_speed: float = DRIFT_TURN_SPEED, max_nitro: int = MAX_NITRO):
+        self.x = x
+        self.y = y
+        self.angle = 0
+        self.velocity_x = 0
+        self.velocity_y = 0
+        self.max_speed = max_speed
+        self.acceleration = acceleration
+        self.turn_speed = turn_speed
+        self.drift_turn_speed = drift_turn_speed
+        self.is_drifting = False
+        self.max_nitro = max_nitro
+        self.current_nitro = max_nitro
+        self.nitro_active = False
+        self.nitro_acceleration_boost = 0.3  # zusätzliche Beschleunigung bei Nitro
+        self.nitro_usage_rate = 20.0  # ml pro Sekunde
+        self.points = 0
+        self.received_highspeed_bonus = False
+
+    def get_speed(self):
+        """Returns the Car's current speed in m/s"""
+        return math.sqrt(self.velocity_x**2 + self.velocity_y**2)
+
+    def get_speed_kmh(self):
+        """Returns the Car's current speed in km/h"""
+        return self.get_speed() * 3.6
+
+    def is_at_rest(self) -> bool:
+        """Returns True if the car (almost) stands still, steps without input hardly change it then."""
+        return self.get_speed() < REST_SPEED
+
+    def step(self, inputs: int):
+        """
+        Advances the car by one physics step.
+
+        :param inputs: Bitmask of the INPUT_* bits held during this step
+        """
+        current_speed = math.sqrt(self.velocity_x**2 + self.velocity_y**2)
+        self.handle_nitro(inputs)
+        self.is_drifting = bool(inputs & INPUT_DRIFT) and current_speed > 1
+
+        if inputs & INPUT_ACCELERATE:
+            accel = self.acceleration + (self.nitro_acceleration_boost if self.nitro_active else 0)
+            self.velocity_x += accel * math.cos(math.radians(self.angle))
+            self.velocity_y += accel * math.sin(math.radians(self.angle))
+        elif inputs & INPUT_BRAKE:
+            self.velocity_x -= self.acceleration * 0.5 * math.cos(math.radians(self.angle))
+            self.velocity_y -= self.acceleration * 0.5 * math.sin(math.radians(self.angle))
+
+        if current_speed > 0.1:
+            turn_speed = self.drift_turn_speed if self.is_drifting else self.turn_speed
+            if inputs & INPUT_LEFT:
+                self.angle -= turn_speed
+            elif inputs & INPUT_RIGHT:
+                self.angle += turn_speed
+
+        if self.is_drifting:
+            self.velocity_x *= 0.96
+            self.velocity_y *= 0.96
+        else:
+            forward_x = math.cos(math.radians(self.angle))
+            forward_y = math.sin(math.radians(self.angle))
+
+            forward_velocity = self.velocity_x * forward_x + self.velocity_y * forward_y
+            sideways_velocity_x = self.velocity_x - forward_velocity * forward_x
+            sideways_velocity_y = self.velocity_y - forward_velocity * forward_y
+
+            sideways_velocity_x *= 0.3
+            sideways_velocity_y *= 0.3
+            forward_velocity *= 0.98
+
+            self.velocity_x = forward_velocity * forward_x + sideways_velocity_x
+            self.velocity_y = forward_velocity * forward_y + sideways_velocity_y
+
+            current_speed = math.sqrt(self.velocity_x**2 + self.velocity_y**2)
+            if current_speed > self.max_speed:
+                self.velocity_x = (self.velocity_x / current_speed) * self.max_speed
+                self.velocity_y = (self.velocity_y / current_speed) * self.max_speed
+
+        self.x += self.velocity_x
+        self.y += self.velocity_y
+
+        if not self.nitro_active and self.current_nitro < self.max_nitro:
+            # Nitro refills while it isn't used
+            self.current_nitro += 1
+        self.update_points()
+
+    def handle_nitro(self, inputs: int):
+        """Uses nitro while the nitro input is held and some is left."""
+        using_nitro = bool(inputs & INPUT_NITRO) and self.current_nitro > 0
+        self.nitro_active = using_nitro
+
+        if using_nitro:
+            self.current_nitro -= self.nitro_usage_rate * STEP_TIME
+            self.current_nitro = max(0, self.current_nitro)
+
+    def update_points(self):
+        """Awards the points of one step (high speed bonus, nitro and drifting)."""
+        speed_kmh = self.get_speed_kmh()
+        if speed_kmh > HIGHSPEED_BONUS_KMH: # This is a Bonus for high speed
+            if not self.received_highspeed_bonus:
+                self.received_highspeed_bonus = True
+                self.points += HIGHSPEED_BONUS_POINTS
+        else:
+            self.received_highspeed_bonus = False # Reset
+
+        if self.nitro_active:
+            self.points += NITRO_POINTS
+
+        if self.is_drifting:
+            self.points += speed_kmh / 10
+
+    def to_state(self) -> dict:
+        """Returns the fields of a player state message."""
+        return {
+            "x": self.x,
+            "y": self.y,
+            "angle": self.angle,
+            "is_drifting": self.is_drifting,
+            "points": self.points,
+            "is_boosting": self.nitro_active,
+            "speed_kmh": self.get_speed_kmh()
+        }
+
+    def get_physics_state(self) -> dict:
+        """Returns everything the next steps depend on (sent in corrections)."""
+        return {
+            "x": self.x,
+            "y": self.y,
+            "angle": self.angle,
+            "velocity_x": self.velocity_x,
+            "velocity_y": self.velocity_y,
+            "nitro": self.current_nitro,
+            "points": self.points,
+            "is_drifting": self.is_drifting,
+            "is_boosting": self.nitro_active
+        }
+
+    def set_physics_state(self, state: dict):
+        """Overwrites the car with a state from get_physics_state (e.g. a correction of the server)."""
+        self.x = state["x"]
+        self.y = state["y"]
+        self.angle = state["angle"]
+        self.velocity_x = state["velocity_x"]
+        self.velocity_y = state["velocity_y"]
+        self.current_nitro = state["nitro"]
+        self.points = state["points"]
+        self.is_drifting = state["is_drifting"]
+        self.nitro_active = state["is_boosting"]
+        self.received_highspeed_bonus = self.get_speed_kmh() > HIGHSPEED_BONUS_KMH
@@ -0,0 +1,43 @@
+"""
+Dead reckoning of remote cars, shared by the client and the server.
+
+A player state is extrapolated along its heading (``angle``) with its speed
+(``speed_kmh``). Clients extrapolate remote cars like this while no update
+arrives, and the server uses the same model to skip updates that the clients
+can extrapolate closely enough (see DeadReckoningFilter).
+"""
+import math
+
+from CarPhysics import PHYSICS_RATE
+
+# Clients extrapolate at most this long after the last state, then the car stops
+MAX_EXTRAPOLATION_TIME = 0.3
+
+
+def velocity(state: dict):
+    """Returns the velocity of a state in world units per second (x, y)."""
+    # speed_kmh = units per physics step * 3.6
+    speed = state.get("speed_kmh", 0) / 3.6 * PHYSICS_RATE
+    angle = math.radians(state["angle"])
+    return speed * math.cos(angle), speed * math.sin(angle)
+
+
+def extrapolate(state: dict, elapsed: float) -> dict:
+    """
+    Returns a copy of the state moved along its heading for elapsed seconds.
+
+    :param elapsed: Seconds since the state, limited to MAX_EXTRAPOLATION_TIME
+    """
+    elapsed = min(max(elapsed, 0.0), MAX_EXTRAPOLATION_TIME)
+    velocity_x, velocity_y = velocity(state)
+    result = dict(state)
+    result["x"] = state["x"] + velocity_x * elapsed
+    result["y"] = state["y"] + velocity_y * elapsed
+    return result
+
+
+def prediction_error(predicted: dict, actual: dict):
+    """Returns the distance (world units) and the angle difference (degrees) between two states."""
+    distance = math.hypot(actual["x"] - predicted["x"], actual["y"] - predicted["y"])
+    angle = abs((actual["angle"] - predicted["angle"] + 180) % 360 - 180)
+    return distance, angle
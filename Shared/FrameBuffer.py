@@ -0,0 +1,118 @@
+"""
+Receive buffer that splits a byte stream into frames without copying.
+
+Data is received straight into a preallocated bytearray (``recv_into``) and
+frames are returned as memoryview slices of that bytearray. Consumed bytes are
+only skipped by moving an offset, the unconsumed rest is moved to the front
+once when more space is needed. This keeps parsing linear even when a burst of
+many messages arrives in one read.
+
+A returned frame is only valid until the next call to ``feed`` or
+``recv_into``, so it has to be decoded (or copied) before receiving more data.
+"""
+import re
+
+DEFAULT_CAPACITY = 65536
+# Minimum free space for a single recv_into
+MIN_RECV_SIZE = 4096
+
+_BLANK = re.compile(rb'\s*')
+_WHITESPACE = b' \t\r\n\x0b\x0c'
+
+
+class FrameBuffer:
+    """Growable receive buffer with delimiter and length prefix framing."""
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.data = bytearray(capacity)
+        self.view = memoryview(self.data)
+        self.start = 0      # First unconsumed byte
+        self.end = 0        # End of the received data
+        self.scanned = 0    # Everything before this offset contains no delimiter
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def pending(self) -> memoryview:
+        """Returns the received but not yet consumed bytes."""
+        return self.view[self.start:self.end]
+
+    def _reserve(self, size: int):
+        """Makes sure there is space for at least size more bytes after end."""
+        if self.end + size <= len(self.data):
+            return
+        remaining = self.end - self.start
+        if remaining + size <= len(self.data):
+            # Move the unconsumed rest (usually a partial frame) to the front
+            self.data[:remaining] = self.view[self.start:self.end].tobytes()
+        else:
+            # Frames returned earlier keep referencing the old bytearray
+            data = bytearray(max(len(self.data) * 2, remaining + size))
+            data[:remaining] = self.view[self.start:self.end]
+            self.data = data
+            self.view = memoryview(data)
+        self.scanned -= self.start
+        self.start = 0
+        self.end = remaining
+
+    def feed(self, data):
+        """Appends received bytes (for sources that don't support recv_into)."""
+        size = len(data)
+        self._reserve(size)
+        self.view[self.end:self.end + size] = data
+        self.end += size
+
+    def recv_into(self, sock) -> int:
+        """
+        Receives from a socket directly into the free space of the buffer.
+
+        :return: Number of bytes received, 0 if the connection was closed
+        """
+        self._reserve(MIN_RECV_SIZE)
+        received = sock.recv_into(self.view[self.end:])
+        self.end += received
+        return received
+
+    def _consume(self, offset: int):
+        if offset >= self.end:
+            # Everything consumed, start at the front again without moving anything
+            self.start = self.end = self.scanned = 0
+        else:
+            self.start = self.scanned = offset
+
+    def next_line(self, skip_blank: bool = True):
+        """
+        Returns the next newline terminated frame (without the newline) or None.
+
+        :param skip_blank: Skip lines that only contain whitespace
+        """
+        data = self.data
+        while True:
+            start = self.start
+            index = data.find(b'\n', self.scanned, self.end)
+            if index < 0:
+                self.scanned = self.end
+                return None
+            self._consume(index + 1)
+            # Checking the first byte is enough for all usual (non-blank) lines
+            if not skip_blank or (index > start and data[start] not in _WHITESPACE):
+                return self.view[start:index]
+            line = self.view[start:index]
+            if not _BLANK.fullmatch(line):
+                return line
+
+    def next_length_prefixed(self, header):
+        """
+        Returns the next frame that is prefixed by its length or None.
+
+        :param header: struct.Struct with a single unsigned integer (the length of the frame without header)
+        """
+        if self.end - self.start < header.size:
+            return None
+        (length,) = header.unpack_from(self.data, self.start)
+        frame_end = self.start + header.size + length
+        if frame_end > self.end:
+            return None
+        frame = self.view[self.start + header.size:frame_end]
+        self._consume(frame_end)
+        return frame
@@ -0,0 +1,415 @@
+"""
+Wire protocol shared by the CarGame client and server.
+
+Two codecs are available and negotiated at handshake:
+
+* ``json``: newline delimited JSON, one message dict per line (the original
+  protocol and the fallback for clients/servers that don't negotiate).
+* ``bin1``: length prefixed binary frames. Every frame is
+  ``<u16 length><u8 frame type><payload>`` where length counts the type byte
+  and the payload. Player states only carry a small integer player ID, the
+  player's name and car color are sent once in a ``player_info`` frame.
+
+Handshake: the client sends ``{"event": "hello", "protocols": [...]}`` as a
+JSON line, the server answers with ``{"event": "welcome", "protocol": ...,
+"id": ...}`` (also JSON) and both sides switch to the chosen codec afterwards.
+The hello may contain a ``room``, the sharded server routes the connection by
+it (see ShardedCarGameServer).
+
+Optional UDP state channel: if the client asks for it (``"udp": true`` in the
+hello) and the connection uses ``bin1``, the welcome also contains a
+``udp_port`` and a ``udp_token``. Player states and snapshots can then be sent
+as datagrams ``<u32 token><u32 sequence><bin1 frame>``. Datagrams with a
+sequence number that isn't newer than the last one received are dropped.
+Events always stay on the TCP connection.
+
+Optional delta compression (``"delta": true`` in the hello, only with a server
+tick rate): instead of full snapshots the server sends ``delta`` messages that
+only contain the fields that changed since a baseline tick the client has
+acknowledged (``{"event": "ack", "tick": ...}``). Base tick 0 means "full
+state", which is also what the server sends after a ``resync`` request.
+
+Optional server-side simulation (``"inputs": true`` in the hello, answered
+with ``"authoritative": true`` by servers that simulate the cars): the client
+doesn't send its state anymore but ``{"event": "input", "seq": ..., "inputs":
+[...]}`` messages with the input bitmasks of consecutive physics steps
+starting at ``seq`` (see CarPhysics). Inputs are sent again until the server
+acknowledges them with the ``seq`` of a ``correction``, the authoritative
+state of the client's own car. Both may also go over the UDP channel.
+"""
+import json
+import math
+import struct
+
+from FrameBuffer import FrameBuffer
+from Serializer import get_serializer
+
+PROTOCOL_JSON = "json"
+PROTOCOL_BINARY = "bin1"
+
+# In order of preference
+SUPPORTED_PROTOCOLS = [PROTOCOL_BINARY, PROTOCOL_JSON]
+
+FRAME_STATE = 1
+FRAME_PLAYER_INFO = 2
+FRAME_EVENT = 3
+FRAME_SNAPSHOT = 4
+FRAME_DELTA = 5
+FRAME_INPUT = 6
+FRAME_CORRECTION = 7
+
+FLAG_DRIFTING = 1
+FLAG_BOOSTING = 2
+
+LENGTH = struct.Struct('<H')
+FRAME_TYPE = struct.Struct('<B')
+STATE = struct.Struct('<HfffffB')           # id, x, y, angle, speed_kmh, points, flags
+PLAYER_INFO = struct.Struct('<HBBB')        # id, r, g, b (followed by the utf-8 name)
+SNAPSHOT = struct.Struct('<IH')             # tick, player count (followed by the states)
+DELTA = struct.Struct('<IIH')               # tick, base tick, player count (followed by the entries)
+DELTA_ENTRY = struct.Struct('<HB')          # id, field mask (followed by the changed fields)
+INPUT = struct.Struct('<IB')                # first sequence number, count (followed by one bitmask byte per step)
+# seq, x, y, angle, velocity x/y, nitro, points, flags (doubles, the client continues the simulation from it)
+CORRECTION = struct.Struct('<IdddddddB')
+FLOAT = struct.Struct('<f')
+FLAGS = struct.Struct('<B')
+
+# Delta field mask bits for the float fields, in encoding order
+DELTA_FLOAT_FIELDS = [("x", 1), ("y", 2), ("angle", 4), ("speed_kmh", 8), ("points", 16)]
+DELTA_FLAGS = 32
+
+MAX_FRAME_LENGTH = 0xFFFF
+# Largest value of the float32 fields
+MAX_FLOAT32 = 3.4028234663852886e38
+
+UDP_HEADER = struct.Struct('<II')           # token, sequence number
+# Stay below the usual path MTU so datagrams don't get fragmented
+MAX_DATAGRAM_SIZE = 1200
+
+
+class ProtocolError(ValueError):
+    """Raised when a received frame can't be decoded."""
+
+
+class Codec:
+    """Base class of the codecs, handles the receive buffer."""
+
+    name = None
+
+    def __init__(self, serializer: str = None):
+        """
+        :param serializer: JSON backend ("json" or "orjson"), None for the default (see Serializer)
+        """
+        self.buffer = FrameBuffer()
+        self.serializer = get_serializer(serializer)
+
+    def feed(self, data):
+        """Appends received bytes to the receive buffer."""
+        self.buffer.feed(data)
+
+    def recv_into(self, sock) -> int:
+        """Receives from the socket directly into the receive buffer, returns 0 if the connection was closed."""
+        return self.buffer.recv_into(sock)
+
+    def next_frame(self):
+        """
+        Returns the next complete frame from the receive buffer or None.
+
+        The frame is a memoryview into the receive buffer and only valid until
+        more data is received, so decode it right away.
+        """
+        raise NotImplementedError
+
+
+class JsonCodec(Codec):
+    """Newline delimited JSON messages."""
+
+    name = PROTOCOL_JSON
+
+    def next_frame(self):
+        return self.buffer.next_line()
+
+    def decode(self, frame) -> dict:
+        try:
+            message = self.serializer.loads(frame)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise ProtocolError(f"Invalid JSON: {bytes(frame[:200])!r}")
+        if not isinstance(message, dict):
+            raise ProtocolError(f"Expected a JSON object: {bytes(frame[:200])!r}")
+        return message
+
+    def encode(self, message: dict) -> bytes:
+        return self.serializer.dumps(message) + b'\n'
+
+
+class BinaryCodec(Codec):
+    """Compact length prefixed binary frames (protocol ``bin1``)."""
+
+    name = PROTOCOL_BINARY
+
+    def __init__(self, serializer: str = None):
+        super().__init__(serializer)
+        # player id -> (name, car_color), filled from player_info frames
+        self.players = {}
+
+    def next_frame(self):
+        return self.buffer.next_length_prefixed(LENGTH)
+
+    def decode(self, frame: bytes) -> dict:
+        try:
+            (frame_type,) = FRAME_TYPE.unpack_from(frame)
+            if frame_type == FRAME_STATE:
+                return self._decode_state(frame, FRAME_TYPE.size)
+            elif frame_type == FRAME_PLAYER_INFO:
+                player_id, r, g, b = PLAYER_INFO.unpack_from(frame, FRAME_TYPE.size)
+                name = bytes(frame[FRAME_TYPE.size + PLAYER_INFO.size:]).decode('utf-8')
+                self.players[player_id] = (name, [r, g, b])
+                return {"event": "player_info", "id": player_id, "name": name, "car_color": [r, g, b]}
+            elif frame_type == FRAME_SNAPSHOT:
+                tick, count = SNAPSHOT.unpack_from(frame, FRAME_TYPE.size)
+                offset = FRAME_TYPE.size + SNAPSHOT.size
+                players = []
+                for i in range(count):
+                    players.append(self._decode_state(frame, offset + i * STATE.size))
+                return {"event": "snapshot", "tick": tick, "players": players}
+            elif frame_type == FRAME_DELTA:
+                return self._decode_delta(frame)
+            elif frame_type == FRAME_INPUT:
+                seq, count = INPUT.unpack_from(frame, FRAME_TYPE.size)
+                offset = FRAME_TYPE.size + INPUT.size
+                inputs = list(frame[offset:offset + count])
+                if len(inputs) != count:
+                    raise ProtocolError("Truncated input frame")
+                return {"event": "input", "seq": seq, "inputs": inputs}
+            elif frame_type == FRAME_CORRECTION:
+                seq, x, y, angle, velocity_x, velocity_y, nitro, points, flags = CORRECTION.unpack_from(frame, FRAME_TYPE.size)
+                return {
+                    "event": "correction", "seq": seq, "x": x, "y": y, "angle": angle,
+                    "velocity_x": velocity_x, "velocity_y": velocity_y, "nitro": nitro, "points": points,
+                    "is_drifting": bool(flags & FLAG_DRIFTING), "is_boosting": bool(flags & FLAG_BOOSTING)
+                }
+            elif frame_type == FRAME_EVENT:
+                message = self.serializer.loads(frame[FRAME_TYPE.size:])
+                if not isinstance(message, dict):
+                    raise ProtocolError("Event frame doesn't contain a JSON object")
+                return message
+        except (struct.error, json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ProtocolError(f"Malformed frame: {e}")
+        raise ProtocolError(f"Unknown frame type {frame[0] if frame else None}")
+
+    def _decode_state(self, frame, offset) -> dict:
+        player_id, x, y, angle, speed_kmh, points, flags = STATE.unpack_from(frame, offset)
+        name, car_color = self.players.get(player_id, (None, [255, 255, 255]))
+        return {
+            "id": player_id,
+            "name": name,
+            "x": x,
+            "y": y,
+            "angle": angle,
+            "is_drifting": bool(flags & FLAG_DRIFTING),
+            "car_color": car_color,
+            "points": points,
+            "is_boosting": bool(flags & FLAG_BOOSTING),
+            "speed_kmh": speed_kmh
+        }
+
+    def _decode_delta(self, frame) -> dict:
+        tick, base, count = DELTA.unpack_from(frame, FRAME_TYPE.size)
+        offset = FRAME_TYPE.size + DELTA.size
+        players = []
+        for i in range(count):
+            player_id, mask = DELTA_ENTRY.unpack_from(frame, offset)
+            offset += DELTA_ENTRY.size
+            name, car_color = self.players.get(player_id, (None, [255, 255, 255]))
+            entry = {"id": player_id, "name": name, "car_color": car_color}
+            for field, bit in DELTA_FLOAT_FIELDS:
+                if mask & bit:
+                    (entry[field],) = FLOAT.unpack_from(frame, offset)
+                    offset += FLOAT.size
+            if mask & DELTA_FLAGS:
+                (flags,) = FLAGS.unpack_from(frame, offset)
+                offset += FLAGS.size
+                entry["is_drifting"] = bool(flags & FLAG_DRIFTING)
+                entry["is_boosting"] = bool(flags & FLAG_BOOSTING)
+            players.append(entry)
+        return {"event": "delta", "tick": tick, "base": base, "players": players}
+
+    def encode(self, message: dict) -> bytes:
+        event = message.get("event")
+        if event is None:
+            frame = FRAME_TYPE.pack(FRAME_STATE) + self._encode_state(message)
+        elif event == "player_info":
+            r, g, b = message["car_color"]
+            frame = (FRAME_TYPE.pack(FRAME_PLAYER_INFO)
+                     + PLAYER_INFO.pack(message["id"], r, g, b)
+                     + message["name"].encode('utf-8'))
+        elif event == "snapshot":
+            players = message["players"]
+            frame = b"".join(
+                [FRAME_TYPE.pack(FRAME_SNAPSHOT), SNAPSHOT.pack(message["tick"], len(players))]
+                + [self._encode_state(player) for player in players]
+            )
+        elif event == "delta":
+            players = message["players"]
+            frame = b"".join(
+                [FRAME_TYPE.pack(FRAME_DELTA), DELTA.pack(message["tick"], message["base"], len(players))]
+                + [self._encode_delta_entry(entry) for entry in players]
+            )
+        elif event == "input":
+            inputs = message["inputs"]
+            frame = FRAME_TYPE.pack(FRAME_INPUT) + INPUT.pack(message["seq"], len(inputs)) + bytes(inputs)
+        elif event == "correction":
+            flags = (FLAG_DRIFTING if message.get("is_drifting") else 0) | (FLAG_BOOSTING if message.get("is_boosting") else 0)
+            frame = FRAME_TYPE.pack(FRAME_CORRECTION) + CORRECTION.pack(
+                message["seq"], message["x"], message["y"], message["angle"],
+                message["velocity_x"], message["velocity_y"], message["nitro"], message["points"], flags
+            )
+        else:
+            frame = FRAME_TYPE.pack(FRAME_EVENT) + self.serializer.dumps(message)
+
+        if len(frame) > MAX_FRAME_LENGTH:
+            raise ProtocolError(f"Frame too large ({len(frame)} bytes)")
+        return LENGTH.pack(len(frame)) + frame
+
+    def _encode_state(self, state: dict) -> bytes:
+        flags = (FLAG_DRIFTING if state.get("is_drifting") else 0) | (FLAG_BOOSTING if state.get("is_boosting") else 0)
+        return STATE.pack(
+            state["id"], state["x"], state["y"], state["angle"],
+            state.get("speed_kmh", 0), state.get("points", 0), flags
+        )
+
+
+    def _encode_delta_entry(self, entry: dict) -> bytes:
+        mask = 0
+        values = []
+        for field, bit in DELTA_FLOAT_FIELDS:
+            if field in entry:
+                mask |= bit
+                values.append(FLOAT.pack(entry[field]))
+        if "is_drifting" in entry or "is_boosting" in entry:
+            mask |= DELTA_FLAGS
+            flags = (FLAG_DRIFTING if entry.get("is_drifting") else 0) | (FLAG_BOOSTING if entry.get("is_boosting") else 0)
+            values.append(FLAGS.pack(flags))
+        return DELTA_ENTRY.pack(entry["id"], mask) + b"".join(values)
+
+
+class EncodeCache:
+    """
+    Encodes one outgoing message at most once per protocol.
+
+    Used when the same message is sent to many clients (broadcast, snapshots),
+    all recipients with the same protocol share the encoded bytes. Encoding
+    doesn't depend on codec state, so the bytes are the same for every codec
+    of a protocol.
+    """
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.encoded = {}   # protocol name -> bytes
+
+    def encode(self, codec) -> bytes:
+        data = self.encoded.get(codec.name)
+        if data is None:
+            data = self.encoded[codec.name] = codec.encode(self.message)
+        return data
+
+
+def diff_state(base, state: dict) -> dict:
+    """
+    Returns the fields of state that differ from base (always including the ID).
+
+    The drifting and boosting flags are sent together, so if one of them
+    changed both are part of the result.
+    """
+    if base is None:
+        return dict(state)
+    changes = {key: value for key, value in state.items() if base.get(key) != value}
+    if "is_drifting" in changes or "is_boosting" in changes:
+        changes["is_drifting"] = state.get("is_drifting")
+        changes["is_boosting"] = state.get("is_boosting")
+    changes["id"] = state["id"]
+    return changes
+
+
+def _is_number(value) -> bool:
+    # bool is an int, but not a coordinate; float32 fields can't hold more than MAX_FLOAT32
+    return (isinstance(value, (int, float)) and not isinstance(value, bool)
+            and math.isfinite(value) and abs(value) <= MAX_FLOAT32)
+
+
+def validate_car_color(car_color) -> list:
+    """Returns a car color received from a client as [r, g, b] clamped to 0-255, raises ProtocolError if it isn't a color."""
+    if not isinstance(car_color, (list, tuple)) or len(car_color) != 3 or not all(_is_number(c) for c in car_color):
+        raise ProtocolError(f"Invalid car color {car_color!r}")
+    return [min(255, max(0, int(c))) for c in car_color]
+
+
+def validate_state(state: dict):
+    """
+    Checks a player state received from a client before it is relayed.
+
+    Raises ProtocolError for states the codecs can't encode (missing position,
+    values that aren't numbers, a name that isn't a string). The car color is
+    clamped in place.
+    """
+    for field in ("x", "y", "angle"):
+        if not _is_number(state.get(field)):
+            raise ProtocolError(f"State without a valid {field}")
+    for field in ("speed_kmh", "points"):
+        if field in state and not _is_number(state[field]):
+            raise ProtocolError(f"State with an invalid {field}")
+    if state.get("name") is not None and not isinstance(state["name"], str):
+        raise ProtocolError("State with an invalid name")
+    if state.get("car_color") is not None:
+        state["car_color"] = validate_car_color(state["car_color"])
+
+
+def is_unreliable(message: dict) -> bool:
+    """Returns True for messages that may be sent over the unreliable state channel."""
+    return message.get("event") in (None, "snapshot", "delta", "input", "correction")
+
+
+def encode_datagram(token: int, sequence: int, frame: bytes = b"") -> bytes:
+    """Builds a UDP datagram around an encoded bin1 frame (empty frame = probe)."""
+    return UDP_HEADER.pack(token, sequence) + frame
+
+
+def decode_datagram(data: bytes):
+    """
+    Splits a UDP datagram into its header and frame.
+
+    :return: Tuple (token, sequence, frame) where frame is the frame without
+             length prefix or None for probes.
+    """
+    if len(data) < UDP_HEADER.size:
+        raise ProtocolError("Datagram too short")
+    token, sequence = UDP_HEADER.unpack_from(data)
+    if len(data) == UDP_HEADER.size:
+        return token, sequence, None
+    offset = UDP_HEADER.size
+    if len(data) < offset + LENGTH.size:
+        raise ProtocolError("Truncated datagram")
+    (length,) = LENGTH.unpack_from(data, offset)
+    frame = data[offset + LENGTH.size:offset + LENGTH.size + length]
+    if len(frame) != length:
+        raise ProtocolError("Truncated datagram")
+    return token, sequence, frame
+
+
+CODECS = {
+    PROTOCOL_JSON: JsonCodec,
+    PROTOCOL_BINARY: BinaryCodec,
+}
+
+
+def create_codec(protocol: str):
+    """Creates a new codec instance for the given protocol name."""
+    return CODECS[protocol]()
+
+
+def choose_protocol(offered: list) -> str:
+    """Picks the preferred protocol out of the ones offered by the peer."""
+    for protocol in SUPPORTED_PROTOCOLS:
+        if protocol in offered:
+            return protocol
+    return PROTOCOL_JSON
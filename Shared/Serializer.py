@@ -0,0 +1,72 @@
+"""
+JSON serializer backends used by the codecs.
+
+``orjson`` is used when it is installed, otherwise the standard library
+``json`` module. Both produce JSON that the other one (and older clients)
+can read, so client and server don't need to use the same backend.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class StdlibJsonSerializer:
+    """Serializer based on the json module of the standard library."""
+
+    name = "json"
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        return json.dumps(obj).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        """
+        :param data: bytes, bytearray or memoryview with utf-8 encoded JSON
+        """
+        return json.loads(str(data, 'utf-8'))
+
+
+class OrjsonSerializer:
+    """Serializer based on orjson (about 5-10x faster than json)."""
+
+    name = "orjson"
+
+    @staticmethod
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+
+    @staticmethod
+    def loads(data):
+        # orjson.JSONDecodeError is a subclass of json.JSONDecodeError
+        return orjson.loads(data)
+
+
+SERIALIZERS = {StdlibJsonSerializer.name: StdlibJsonSerializer}
+if orjson is not None:
+    SERIALIZERS[OrjsonSerializer.name] = OrjsonSerializer
+
+# The fastest available backend
+default_serializer = OrjsonSerializer if orjson is not None else StdlibJsonSerializer
+
+
+def get_serializer(name: str = None):
+    """
+    Returns a serializer backend.
+
+    :param name: "json" or "orjson", None for the default backend
+    """
+    if name is None:
+        return default_serializer
+    if name not in SERIALIZERS:
+        raise ValueError(f"Serializer {name!r} is not available (available: {', '.join(SERIALIZERS)})")
+    return SERIALIZERS[name]
+
+
+def set_default_serializer(name: str):
+    """Changes the backend used by codecs created afterwards."""
+    global default_serializer
+    default_serializer = get_serializer(name)
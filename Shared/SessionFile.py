@@ -0,0 +1,332 @@
+"""
+Session recordings of the relayed server traffic (see SessionRecorder and
+Tools/replay_session.py).
+
+A session file starts with the header ``<8s magic><f64 start time>`` (start
+time in seconds since the epoch) followed by records
+``<u32 milliseconds since the start><bin1 frame>``. The frame is a complete
+``bin1`` frame including its length prefix (see Protocol), so player states
+only carry the player ID and the names and colors come from the recorded
+``player_info`` frames, exactly like on a ``bin1`` connection.
+
+Keyframes make recordings seekable. Every few seconds the writer adds the
+whole world: a ``{"event": "keyframe", "records": n}`` event followed by n
+records with the ``player_info`` of every player and snapshots with their
+latest states. Reading can start at any keyframe with a fresh codec.
+
+When the writer is closed it appends an index of the keyframes:
+``<u32 0xFFFFFFFF><u32 count>`` followed by ``<u32 milliseconds><u64 offset>``
+per keyframe and the trailer ``<u64 offset of the index><8s index magic>``.
+Readers find the index through the trailer at the end of the file and seek
+with a binary search. Files without an index (e.g. the server crashed) are
+indexed by scanning them once.
+
+Files are append-only: a server that records into an existing file continues
+it, its record times stay relative to the start time of the file. An index in
+the middle of a file is skipped when reading, the last one covers the whole
+file. A record that was only partially written when the previous writer
+crashed is cut off before the file is continued.
+"""
+import bisect
+import mmap
+import struct
+
+from Protocol import BinaryCodec, FRAME_EVENT, LENGTH, ProtocolError
+
+MAGIC = b"CGSESS1\n"
+HEADER = struct.Struct('<8sd')      # magic, start time
+RECORD = struct.Struct('<I')        # milliseconds since the start (followed by the bin1 frame)
+
+# Written instead of the time of a record at the start of an index
+INDEX_MARKER = 0xFFFFFFFF
+INDEX_MAGIC = b"CGINDEX\n"
+INDEX_COUNT = struct.Struct('<II')  # marker, number of keyframes
+INDEX_ENTRY = struct.Struct('<IQ')  # milliseconds, file offset of the keyframe
+TRAILER = struct.Struct('<Q8s')     # file offset of the index, index magic
+
+# Seconds between two keyframes
+KEYFRAME_INTERVAL = 5.0
+# Players per snapshot of a keyframe (bin1 frames are limited to 64 KB)
+KEYFRAME_CHUNK = 2000
+
+
+def encode_header(start_time: float) -> bytes:
+    return HEADER.pack(MAGIC, start_time)
+
+
+def decode_header(data) -> float:
+    """Returns the start time of a session file, raises ProtocolError if it isn't one."""
+    if len(data) < HEADER.size:
+        raise ProtocolError("Session file too short")
+    magic, start_time = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ProtocolError("Not a session file")
+    return start_time
+
+
+def encode_record(elapsed_ms: int, frame: bytes) -> bytes:
+    """
+    :param elapsed_ms: Milliseconds since the start time of the file
+    :param frame: Encoded bin1 frame (with length prefix)
+    """
+    return RECORD.pack(elapsed_ms) + frame
+
+
+def iter_frames(data, offset: int = HEADER.size):
+    """
+    Yields (file offset, milliseconds since the start, bin1 frame without length prefix) of the records in data.
+
+    Indexes are skipped, a record that was only partially written ends the iteration.
+    """
+    end = len(data)
+    while offset + RECORD.size + LENGTH.size <= end:
+        (elapsed_ms,) = RECORD.unpack_from(data, offset)
+        if elapsed_ms == INDEX_MARKER:
+            _, count = INDEX_COUNT.unpack_from(data, offset)
+            offset += INDEX_COUNT.size + count * INDEX_ENTRY.size + TRAILER.size
+            continue
+        (length,) = LENGTH.unpack_from(data, offset + RECORD.size)
+        frame_start = offset + RECORD.size + LENGTH.size
+        if frame_start + length > end:
+            break
+        # Copied out of the map, so the map can be closed while frames are still referenced
+        yield offset, elapsed_ms, data[frame_start:frame_start + length]
+        offset = frame_start + length
+
+
+def _is_keyframe(frame) -> bool:
+    if not frame or frame[0] != FRAME_EVENT or b'"keyframe"' not in frame:
+        return False
+    try:
+        return BinaryCodec().decode(frame).get("event") == "keyframe"
+    except ProtocolError:
+        return False
+
+
+def _trailing_index(data):
+    """Returns the offset and the number of keyframes of the index at the end of data, None if the file doesn't end with one."""
+    if len(data) < HEADER.size + INDEX_COUNT.size + TRAILER.size:
+        return None
+    index_offset, magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+    if magic != INDEX_MAGIC or not HEADER.size <= index_offset <= len(data) - TRAILER.size - INDEX_COUNT.size:
+        return None
+    marker, count = INDEX_COUNT.unpack_from(data, index_offset)
+    if marker != INDEX_MARKER or index_offset + INDEX_COUNT.size + count * INDEX_ENTRY.size + TRAILER.size != len(data):
+        return None
+    return index_offset, count
+
+
+def read_index(data) -> list:
+    """
+    Returns the keyframes of a session file as a list of (milliseconds, offset).
+
+    Uses the index at the end of the file, files without one are scanned.
+    """
+    index = _trailing_index(data)
+    if index is not None:
+        start = index[0] + INDEX_COUNT.size
+        return [INDEX_ENTRY.unpack_from(data, start + i * INDEX_ENTRY.size) for i in range(index[1])]
+    return [(elapsed_ms, offset) for offset, elapsed_ms, frame in iter_frames(data) if _is_keyframe(frame)]
+
+
+def complete_length(data) -> int:
+    """
+    Returns the length of the complete part of a session file: up to the end
+    of the last record or index that was completely written.
+
+    Bytes after it are left over from a writer that crashed in the middle of
+    a record, a writer that continues the file has to cut them off.
+    """
+    if _trailing_index(data) is not None:
+        return len(data)
+    end = len(data)
+    offset = HEADER.size
+    while offset + RECORD.size <= end:
+        (elapsed_ms,) = RECORD.unpack_from(data, offset)
+        if elapsed_ms == INDEX_MARKER:
+            if offset + INDEX_COUNT.size > end:
+                break
+            _, count = INDEX_COUNT.unpack_from(data, offset)
+            next_offset = offset + INDEX_COUNT.size + count * INDEX_ENTRY.size + TRAILER.size
+        else:
+            if offset + RECORD.size + LENGTH.size > end:
+                break
+            (length,) = LENGTH.unpack_from(data, offset + RECORD.size)
+            next_offset = offset + RECORD.size + LENGTH.size + length
+        if next_offset > end:
+            break
+        offset = next_offset
+    return offset
+
+
+class SessionWriter:
+    """
+    Appends records to a session file, adds the keyframes and writes the index on close.
+
+    The writer keeps the latest player_info and state of every player from
+    the written messages, that is the world of the keyframes. Not thread-safe,
+    the server writes through a SessionRecorder.
+    """
+
+    def __init__(self, path: str, start_time: float, keyframe_interval: float = KEYFRAME_INTERVAL):
+        """
+        :param start_time: Start time (time.time()) of a new file, existing files keep theirs
+        :param keyframe_interval: Seconds between two keyframes
+        """
+        self.file = open(path, "ab+")
+        self.offset = self.file.seek(0, 2)
+        if self.offset:
+            # Continue an existing recording, its keyframes stay in the index
+            self.file.seek(0)
+            data = self.file.read()
+            self.start_time = decode_header(data)
+            complete = complete_length(data)
+            if complete < self.offset:
+                # The last record was only partially written (e.g. the server crashed), new records must not follow it
+                print(f"[WARN] Cutting off {self.offset - complete} bytes of an incomplete record from {path}")
+                self.file.truncate(complete)
+                self.offset = complete
+                data = data[:complete]
+            self.index = read_index(data)
+        else:
+            self.start_time = start_time
+            self.file.write(encode_header(start_time))
+            self.offset = HEADER.size
+            self.index = []
+        self.codec = BinaryCodec()
+        self.keyframe_interval_ms = round(keyframe_interval * 1000)
+        self.next_keyframe_ms = 0
+        self.players = {}   # player id -> player_info message
+        self.states = {}    # player id -> latest state
+        self.pending = []
+
+    def write(self, elapsed_ms: int, message: dict, frame: bytes = None):
+        """
+        Appends a message, preceded by a keyframe when one is due.
+
+        :param frame: The message already encoded with bin1
+        """
+        frame = frame or self.codec.encode(message)
+        if elapsed_ms >= self.next_keyframe_ms and self.states:
+            self.write_keyframe(elapsed_ms)
+        self.append(elapsed_ms, frame)
+        self.update_world(message)
+
+    def append(self, elapsed_ms: int, frame: bytes):
+        record = encode_record(elapsed_ms, frame)
+        self.pending.append(record)
+        self.offset += len(record)
+
+    def update_world(self, message: dict):
+        event = message.get("event")
+        if event == "player_info":
+            self.players[message["id"]] = message
+        elif event is None:
+            self.states[message["id"]] = message
+        elif event == "snapshot":
+            for state in message["players"]:
+                self.states[state["id"]] = state
+        elif event == "disconnect":
+            self.players.pop(message.get("id"), None)
+            self.states.pop(message.get("id"), None)
+
+    def write_keyframe(self, elapsed_ms: int):
+        """Appends the whole world as a keyframe and adds it to the index."""
+        states = list(self.states.values())
+        frames = [self.codec.encode(info) for info in self.players.values()]
+        frames += [self.codec.encode({"event": "snapshot", "tick": 0, "players": states[i:i + KEYFRAME_CHUNK]})
+                   for i in range(0, len(states), KEYFRAME_CHUNK)]
+        self.index.append((elapsed_ms, self.offset))
+        self.append(elapsed_ms, self.codec.encode({"event": "keyframe", "records": len(frames)}))
+        for frame in frames:
+            self.append(elapsed_ms, frame)
+        self.next_keyframe_ms = elapsed_ms + self.keyframe_interval_ms
+
+    def flush(self):
+        try:
+            self.file.write(b"".join(self.pending))
+            self.file.flush()
+        finally:
+            # Records that couldn't be written are lost, they aren't written twice
+            self.pending.clear()
+
+    def close(self):
+        """Writes the index and closes the file."""
+        self.pending.append(INDEX_COUNT.pack(INDEX_MARKER, len(self.index)))
+        self.pending += [INDEX_ENTRY.pack(elapsed_ms, offset) for elapsed_ms, offset in self.index]
+        self.pending.append(TRAILER.pack(self.offset, INDEX_MAGIC))
+        self.flush()
+        self.file.close()
+
+
+class SessionReader:
+    """
+    Reads a session file through a memory map.
+
+    Iterating yields ``(seconds since the start, message)`` with the messages
+    decoded like on a bin1 connection. A keyframe is yielded as one
+    ``{"event": "keyframe", "players": [...]}`` message with the states of all
+    players. records(start) begins at the last keyframe before start, found
+    with a binary search in the index.
+
+    The file may still be written while it is read: the map covers what was
+    written when the file was opened, a record that was only partially
+    written by then ends the iteration.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            self.file.close()
+            raise ProtocolError("Session file too short")
+        self.start_time = decode_header(self.data)
+        self.index = read_index(self.data)
+        self._index_times = [elapsed_ms for elapsed_ms, _ in self.index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __iter__(self):
+        return self.records()
+
+    def keyframe_offset(self, start: float) -> int:
+        """Returns the file offset of the last keyframe at or before start (seconds), the first record if there is none."""
+        position = bisect.bisect_right(self._index_times, start * 1000)
+        return self.index[position - 1][1] if position else HEADER.size
+
+    def records(self, start: float = 0.0):
+        """
+        Yields (seconds since the start, message) from the last keyframe at or before start on.
+
+        The records between that keyframe and start are included, the caller
+        skips or fast-forwards them.
+        """
+        codec = BinaryCodec()
+        keyframe = None     # [seconds, records left, states] while reading a keyframe
+        for offset, elapsed_ms, frame in iter_frames(self.data, self.keyframe_offset(start)):
+            try:
+                message = codec.decode(frame)
+            except ProtocolError as e:
+                print(f"[WARN] Skipping invalid record at {elapsed_ms} ms: {e}")
+                continue
+            if message.get("event") == "keyframe":
+                keyframe = [elapsed_ms / 1000, message.get("records", 0), []]
+            elif keyframe is not None:
+                keyframe[1] -= 1
+                keyframe[2] += message.get("players", [])
+            else:
+                yield elapsed_ms / 1000, message
+                continue
+            if keyframe[1] <= 0:
+                yield keyframe[0], {"event": "keyframe", "players": keyframe[2]}
+                keyframe = None
+
+    def close(self):
+        self.data.close()
+        self.file.close()
@@ -0,0 +1,87 @@
+"""
+Tests of the delta compressed snapshots (Server/DeltaCompression.py).
+
+Run from the repository root:
+    python -m unittest discover Tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server'))
+from DeltaCompression import ClientBaselines, MAX_BASELINE_HISTORY
+
+
+def state(player_id: int, x: float, y: float = 0.0) -> dict:
+    return {"id": player_id, "x": x, "y": y, "angle": 0.0, "is_drifting": False, "is_boosting": False}
+
+
+class ClientBaselinesTest(unittest.TestCase):
+
+    def test_full_state_without_baseline(self):
+        baselines = ClientBaselines()
+        delta = baselines.build_delta(1, [state(1, 1.0), state(2, 2.0)])
+        self.assertEqual(delta, {"event": "delta", "tick": 1, "base": 0, "players": [state(1, 1.0), state(2, 2.0)]})
+
+    def test_only_changes_since_the_acknowledged_tick(self):
+        baselines = ClientBaselines()
+        baselines.build_delta(1, [state(1, 1.0), state(2, 2.0)])
+        baselines.ack(1)
+        delta = baselines.build_delta(2, [state(1, 1.0), state(2, 3.0, 4.0)])
+        self.assertEqual(delta["base"], 1)
+        self.assertEqual(delta["players"], [{"id": 2, "x": 3.0, "y": 4.0}])
+
+    def test_nothing_changed(self):
+        baselines = ClientBaselines()
+        baselines.build_delta(1, [state(1, 1.0)])
+        baselines.ack(1)
+        self.assertIsNone(baselines.build_delta(2, [state(1, 1.0)]))
+
+    def test_lost_delta_is_repeated_against_the_old_baseline(self):
+        baselines = ClientBaselines()
+        baselines.build_delta(1, [state(1, 1.0)])
+        baselines.ack(1)
+        baselines.build_delta(2, [state(1, 2.0)])
+        # Tick 2 never arrived, tick 3 still has to contain the change of tick 2
+        delta = baselines.build_delta(3, [state(1, 2.0)])
+        self.assertEqual(delta["base"], 1)
+        self.assertEqual(delta["players"], [{"id": 1, "x": 2.0}])
+
+    def test_ack_forgets_older_baselines(self):
+        baselines = ClientBaselines()
+        for tick in range(1, 4):
+            baselines.build_delta(tick, [state(1, float(tick))])
+        baselines.ack(2)
+        self.assertEqual(sorted(baselines.sent), [2, 3])
+        # Old or unknown acknowledgements are ignored
+        baselines.ack(1)
+        baselines.ack(99)
+        self.assertEqual(baselines.acked_tick, 2)
+
+    def test_history_is_bounded(self):
+        baselines = ClientBaselines()
+        for tick in range(1, MAX_BASELINE_HISTORY + 10):
+            baselines.build_delta(tick, [state(1, float(tick))])
+        self.assertEqual(len(baselines.sent), MAX_BASELINE_HISTORY)
+        self.assertNotIn(1, baselines.sent)
+
+    def test_resync_sends_the_full_state(self):
+        baselines = ClientBaselines()
+        baselines.build_delta(1, [state(1, 1.0)])
+        baselines.ack(1)
+        baselines.resync()
+        delta = baselines.build_delta(2, [state(1, 1.0)])
+        self.assertEqual((delta["base"], delta["players"]), (0, [state(1, 1.0)]))
+
+    def test_removed_player_is_sent_in_full_when_the_id_returns(self):
+        baselines = ClientBaselines()
+        baselines.build_delta(1, [state(1, 1.0), state(2, 2.0)])
+        baselines.ack(1)
+        baselines.remove_player(2)
+        delta = baselines.build_delta(2, [state(1, 1.0), state(2, 2.0)])
+        self.assertEqual(delta["players"], [state(2, 2.0)])
+
+
+if __name__ == "__main__":
+    unittest.main()
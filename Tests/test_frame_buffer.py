@@ -0,0 +1,115 @@
+"""
+Tests of the receive framing (Shared/FrameBuffer.py).
+
+Run from the repository root:
+    python -m unittest discover Tests
+"""
+import os
+import socket
+import struct
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from FrameBuffer import FrameBuffer
+
+LENGTH = struct.Struct('<H')
+
+
+def lines(buffer: FrameBuffer, skip_blank: bool = True) -> list:
+    result = []
+    while True:
+        line = buffer.next_line(skip_blank)
+        if line is None:
+            return result
+        result.append(bytes(line))
+
+
+class LineFramingTest(unittest.TestCase):
+
+    def test_burst_of_lines(self):
+        buffer = FrameBuffer()
+        buffer.feed(b"a\nbb\nccc\n")
+        self.assertEqual(lines(buffer), [b"a", b"bb", b"ccc"])
+        self.assertEqual(len(buffer), 0)
+
+    def test_line_split_over_reads(self):
+        buffer = FrameBuffer()
+        buffer.feed(b'{"x": ')
+        self.assertEqual(lines(buffer), [])
+        buffer.feed(b'1}\n{"x"')
+        self.assertEqual(lines(buffer), [b'{"x": 1}'])
+        self.assertEqual(bytes(buffer.pending()), b'{"x"')
+
+    def test_blank_lines(self):
+        buffer = FrameBuffer()
+        buffer.feed(b"\n  \r\na\n\t\n")
+        self.assertEqual(lines(buffer), [b"a"])
+        buffer.feed(b"\nb\n")
+        self.assertEqual(lines(buffer, skip_blank=False), [b"", b"b"])
+
+    def test_leading_whitespace_is_kept(self):
+        buffer = FrameBuffer()
+        buffer.feed(b" a\n")
+        self.assertEqual(lines(buffer), [b" a"])
+
+
+class LengthPrefixedFramingTest(unittest.TestCase):
+
+    def test_frames_and_partial_frame(self):
+        buffer = FrameBuffer()
+        buffer.feed(LENGTH.pack(3) + b"abc" + LENGTH.pack(0) + LENGTH.pack(4) + b"de")
+        self.assertEqual(bytes(buffer.next_length_prefixed(LENGTH)), b"abc")
+        self.assertEqual(bytes(buffer.next_length_prefixed(LENGTH)), b"")
+        self.assertIsNone(buffer.next_length_prefixed(LENGTH))
+        buffer.feed(b"fg")
+        self.assertEqual(bytes(buffer.next_length_prefixed(LENGTH)), b"defg")
+
+    def test_incomplete_header(self):
+        buffer = FrameBuffer()
+        buffer.feed(b"\x05")
+        self.assertIsNone(buffer.next_length_prefixed(LENGTH))
+        buffer.feed(b"\x00hello")
+        self.assertEqual(bytes(buffer.next_length_prefixed(LENGTH)), b"hello")
+
+
+class BufferSpaceTest(unittest.TestCase):
+
+    def test_partial_frame_is_moved_to_the_front(self):
+        buffer = FrameBuffer(capacity=16)
+        buffer.feed(b"0123456789\nab")
+        self.assertEqual(lines(buffer), [b"0123456789"])
+        buffer.feed(b"cdefghij\n")
+        self.assertEqual(len(buffer.data), 16)
+        self.assertEqual(lines(buffer), [b"abcdefghij"])
+
+    def test_grows_for_large_frames(self):
+        buffer = FrameBuffer(capacity=16)
+        payload = bytes(range(256)) * 4
+        buffer.feed(LENGTH.pack(len(payload)) + payload)
+        self.assertEqual(bytes(buffer.next_length_prefixed(LENGTH)), payload)
+
+    def test_returned_frame_survives_growing(self):
+        buffer = FrameBuffer(capacity=16)
+        buffer.feed(b"abc\nd")
+        frame = buffer.next_line()
+        buffer.feed(b"x" * 64)
+        # Growing allocates a new bytearray, the old view still shows the old data
+        self.assertEqual(bytes(frame), b"abc")
+
+    def test_recv_into(self):
+        left, right = socket.socketpair()
+        self.addCleanup(left.close)
+        self.addCleanup(right.close)
+        buffer = FrameBuffer(capacity=16)
+        left.sendall(b"hello\nworld\n")
+        received = 0
+        while received < 12:
+            received += buffer.recv_into(right)
+        self.assertEqual(lines(buffer), [b"hello", b"world"])
+        left.close()
+        self.assertEqual(buffer.recv_into(right), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
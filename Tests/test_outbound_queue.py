@@ -0,0 +1,141 @@
+"""
+Tests of the per-client outbound queue (Server/OutboundQueue.py).
+
+Run from the repository root:
+    python -m unittest discover Tests
+"""
+import os
+import sys
+import threading
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server'))
+from OutboundQueue import OutboundQueue, POLICY_DISCONNECT, POLICY_DROP, coalesce_key
+
+STATE_1 = coalesce_key({"id": 1, "x": 0.0})
+STATE_2 = coalesce_key({"id": 2, "x": 0.0})
+SNAPSHOT = coalesce_key({"event": "snapshot", "tick": 1, "players": []})
+
+
+class CoalesceKeyTest(unittest.TestCase):
+
+    def test_keys(self):
+        self.assertNotEqual(STATE_1, STATE_2)
+        self.assertEqual(coalesce_key({"event": "delta"}), SNAPSHOT)
+        self.assertEqual(coalesce_key({"event": "correction"}), ("correction",))
+        self.assertIsNone(coalesce_key({"event": "player_info"}))
+        self.assertIsNone(coalesce_key({"event": "disconnect"}))
+
+
+class CoalescingTest(unittest.TestCase):
+
+    def test_newer_state_replaces_older_one(self):
+        queue = OutboundQueue()
+        queue.put(b"s1", STATE_1)
+        queue.put(b"s2", STATE_2)
+        queue.put(b"s1'", STATE_1)
+        self.assertEqual(queue.drain(), [b"s2", b"s1'"])
+        self.assertEqual(queue.coalesced, 1)
+
+    def test_replaced_state_stays_behind_events(self):
+        queue = OutboundQueue()
+        queue.put(b"state", STATE_1)
+        queue.put(b"player_info")
+        queue.put(b"state'", STATE_1)
+        # The newer state must not overtake the event that was queued before it
+        self.assertEqual(queue.drain(), [b"player_info", b"state'"])
+
+    def test_events_are_never_coalesced(self):
+        queue = OutboundQueue()
+        queue.put(b"e1")
+        queue.put(b"e1")
+        queue.put(b"snap1", SNAPSHOT)
+        queue.put(b"snap2", SNAPSHOT)
+        self.assertEqual(queue.drain(), [b"e1", b"e1", b"snap2"])
+
+
+class FullQueueTest(unittest.TestCase):
+
+    def test_drop_policy_drops_the_oldest_state(self):
+        queue = OutboundQueue(max_size=3, policy=POLICY_DROP)
+        queue.put(b"event")
+        queue.put(b"s1", STATE_1)
+        queue.put(b"s2", STATE_2)
+        self.assertTrue(queue.put(b"snap", SNAPSHOT))
+        self.assertEqual(queue.drain(), [b"event", b"s2", b"snap"])
+        self.assertEqual(queue.dropped, 1)
+
+    def test_events_are_never_dropped(self):
+        queue = OutboundQueue(max_size=2, policy=POLICY_DROP)
+        queue.put(b"s1", STATE_1)
+        queue.put(b"e1")
+        # The state makes room for the event
+        self.assertTrue(queue.put(b"e2"))
+        self.assertEqual(queue.drain(), [b"e1", b"e2"])
+
+    def test_new_state_is_dropped_if_only_events_are_queued(self):
+        queue = OutboundQueue(max_size=2, policy=POLICY_DROP)
+        queue.put(b"e1")
+        queue.put(b"e2")
+        self.assertFalse(queue.put(b"s1", STATE_1))
+        self.assertFalse(queue.overflowed)
+        self.assertEqual(queue.drain(), [b"e1", b"e2"])
+
+    def test_queue_full_of_events_overflows_with_drop_policy(self):
+        queue = OutboundQueue(max_size=2, policy=POLICY_DROP)
+        queue.put(b"e1")
+        queue.put(b"e2")
+        self.assertFalse(queue.put(b"e3"))
+        self.assertTrue(queue.overflowed)
+        self.assertTrue(queue.closed)
+        # Nothing queued before was lost, the writer still sends it before disconnecting
+        self.assertEqual(queue.get(), [b"e1", b"e2"])
+
+    def test_disconnect_policy(self):
+        queue = OutboundQueue(max_size=2, policy=POLICY_DISCONNECT)
+        queue.put(b"s1", STATE_1)
+        queue.put(b"s2", STATE_2)
+        self.assertFalse(queue.put(b"snap", SNAPSHOT))
+        self.assertTrue(queue.overflowed)
+        self.assertFalse(queue.put(b"e1"))
+        self.assertEqual(queue.dropped, 0)
+
+    def test_coalescing_doesnt_count_against_the_limit(self):
+        queue = OutboundQueue(max_size=2, policy=POLICY_DISCONNECT)
+        queue.put(b"s1", STATE_1)
+        queue.put(b"s2", STATE_2)
+        self.assertTrue(queue.put(b"s1'", STATE_1))
+        self.assertFalse(queue.overflowed)
+
+
+class WriterTest(unittest.TestCase):
+
+    def test_get_waits_for_data(self):
+        queue = OutboundQueue()
+        batches = []
+        writer = threading.Thread(target=lambda: batches.append(queue.get()))
+        writer.start()
+        queue.put(b"e1")
+        writer.join(5)
+        self.assertEqual(batches, [[b"e1"]])
+
+    def test_close_wakes_the_writer(self):
+        queue = OutboundQueue()
+        batches = []
+        writer = threading.Thread(target=lambda: batches.append(queue.get()))
+        writer.start()
+        queue.close()
+        writer.join(5)
+        self.assertEqual(batches, [[]])
+        self.assertFalse(queue.put(b"e1"))
+
+    def test_on_put_is_called(self):
+        calls = []
+        queue = OutboundQueue(on_put=lambda: calls.append(1))
+        queue.put(b"e1")
+        queue.close()
+        self.assertEqual(len(calls), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
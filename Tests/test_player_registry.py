@@ -0,0 +1,79 @@
+"""
+Tests of the session IDs and unique names (Server/PlayerRegistry.py).
+
+Run from the repository root:
+    python -m unittest discover Tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server'))
+import PlayerRegistry as player_registry
+from PlayerRegistry import PlayerRegistry
+
+
+class Client:
+    def __init__(self, registry: PlayerRegistry):
+        self.name = None
+        self.player_id = registry.register(self)
+
+
+class PlayerRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = PlayerRegistry()
+
+    def test_ids_count_up_and_are_found(self):
+        first, second = Client(self.registry), Client(self.registry)
+        self.assertEqual((first.player_id, second.player_id), (1, 2))
+        self.assertIs(self.registry.get(2), second)
+        self.assertIsNone(self.registry.get(3))
+        self.assertEqual(len(self.registry), 2)
+
+    def test_ids_are_not_reused_right_away(self):
+        first = Client(self.registry)
+        self.registry.unregister(first)
+        self.assertEqual(Client(self.registry).player_id, 2)
+        self.assertIsNone(self.registry.get(1))
+
+    def test_ids_wrap_around_and_skip_used_ones(self):
+        self.addCleanup(setattr, player_registry, "MAX_PLAYER_ID", player_registry.MAX_PLAYER_ID)
+        player_registry.MAX_PLAYER_ID = 3
+        clients = [Client(self.registry) for _ in range(3)]
+        with self.assertRaises(RuntimeError):
+            Client(self.registry)
+        self.registry.unregister(clients[1])
+        self.assertEqual(Client(self.registry).player_id, 2)
+
+    def test_names_are_unique(self):
+        first, second, third = Client(self.registry), Client(self.registry), Client(self.registry)
+        first.name = self.registry.set_name(first, "Bob")
+        second.name = self.registry.set_name(second, "Bob")
+        third.name = self.registry.set_name(third, "Bob")
+        self.assertEqual([first.name, second.name, third.name], ["Bob", "Bob (2)", "Bob (3)"])
+        self.assertIs(self.registry.find("Bob (2)"), second)
+
+    def test_client_keeps_its_name(self):
+        first = Client(self.registry)
+        first.name = self.registry.set_name(first, "Bob")
+        self.assertEqual(self.registry.set_name(first, "Bob"), "Bob")
+
+    def test_renaming_frees_the_old_name(self):
+        first, second = Client(self.registry), Client(self.registry)
+        first.name = self.registry.set_name(first, "Bob")
+        first.name = self.registry.set_name(first, "Alice")
+        self.assertIsNone(self.registry.find("Bob"))
+        self.assertEqual(self.registry.set_name(second, "Bob"), "Bob")
+
+    def test_unregister_frees_the_name(self):
+        first, second = Client(self.registry), Client(self.registry)
+        first.name = self.registry.set_name(first, "Bob")
+        self.registry.unregister(first)
+        self.assertIsNone(self.registry.find("Bob"))
+        self.assertEqual(self.registry.set_name(second, "Bob"), "Bob")
+        self.assertEqual(len(self.registry), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests of the client-side prediction (Client/PredictionBuffer.py).
+
+Run from the repository root:
+    python -m unittest discover Tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Client'))
+from CarPhysics import CarPhysics, INPUT_ACCELERATE, INPUT_LEFT
+from PredictionBuffer import PredictionBuffer
+
+INPUTS = [INPUT_ACCELERATE] * 20 + [INPUT_ACCELERATE | INPUT_LEFT] * 20
+
+
+def predict(buffer: PredictionBuffer, car: CarPhysics, inputs: list, first_seq: int = 1):
+    for seq, bits in enumerate(inputs, first_seq):
+        car.step(bits)
+        buffer.record(seq, bits, car)
+
+
+def simulate(inputs: list, car: CarPhysics = None) -> list:
+    """States of a server car after every input."""
+    car = car or CarPhysics()
+    states = []
+    for bits in inputs:
+        car.step(bits)
+        states.append(car.get_physics_state())
+    return states
+
+
+def correction(seq: int, state: dict) -> dict:
+    return dict(state, event="correction", seq=seq)
+
+
+class PredictionBufferTest(unittest.TestCase):
+
+    def test_correct_prediction_only_acknowledges(self):
+        buffer, car = PredictionBuffer(), CarPhysics()
+        predict(buffer, car, INPUTS)
+        server = simulate(INPUTS)
+        self.assertEqual(buffer.reconcile(car, correction(10, server[9])), (0, 0, 0))
+        self.assertEqual((len(buffer), buffer.replays), (len(INPUTS) - 10, 0))
+        self.assertEqual(car.get_physics_state(), server[-1])
+
+    def test_wrong_prediction_is_replayed(self):
+        buffer, car = PredictionBuffer(), CarPhysics()
+        predict(buffer, car, INPUTS)
+        # The server's car got pushed by 5 units in step 10
+        pushed = CarPhysics()
+        simulate(INPUTS[:10], pushed)
+        pushed.x += 5.0
+        server_at_10 = pushed.get_physics_state()
+        server = simulate(INPUTS[10:], pushed)
+        old_x = car.x
+        dx, dy, dangle = buffer.reconcile(car, correction(10, server_at_10))
+        self.assertEqual(buffer.replays, 1)
+        self.assertEqual(buffer.replayed_steps, len(INPUTS) - 10)
+        self.assertAlmostEqual(car.x, server[-1]["x"], places=6)
+        self.assertAlmostEqual(car.y, server[-1]["y"], places=6)
+        self.assertAlmostEqual(dx, car.x - old_x)
+        # The replayed predictions are the new reference, the next correction matches
+        self.assertEqual(buffer.reconcile(car, correction(20, server[9])), (0, 0, 0))
+
+    def test_old_and_future_corrections_are_ignored(self):
+        buffer, car = PredictionBuffer(), CarPhysics()
+        predict(buffer, car, INPUTS[:10])
+        server = simulate(INPUTS[:10])
+        buffer.reconcile(car, correction(5, server[4]))
+        state = car.get_physics_state()
+        wrong = dict(server[4], x=1000.0)
+        self.assertEqual(buffer.reconcile(car, correction(5, wrong)), (0, 0, 0))
+        self.assertEqual(buffer.reconcile(car, correction(3, wrong)), (0, 0, 0))
+        self.assertEqual(buffer.reconcile(car, correction(11, wrong)), (0, 0, 0))
+        self.assertEqual(car.get_physics_state(), state)
+        self.assertEqual(buffer.corrections, 1)
+
+    def test_overwritten_steps_are_given_up(self):
+        buffer, car = PredictionBuffer(capacity=8), CarPhysics()
+        predict(buffer, car, INPUTS[:20])
+        self.assertEqual(len(buffer), 8)
+        self.assertEqual(buffer.acked_seq, 12)
+        # Step 10 isn't buffered anymore, its correction can't be replayed
+        self.assertEqual(buffer.reconcile(car, correction(10, simulate(INPUTS[:10])[-1])), (0, 0, 0))
+
+    def test_correction_of_the_latest_step_resets_the_car(self):
+        buffer, car = PredictionBuffer(capacity=8), CarPhysics()
+        predict(buffer, car, INPUTS[:20])
+        server = simulate(INPUTS[:20])
+        # Nothing newer to replay, the car simply takes the server's state
+        buffer.reconcile(car, correction(20, dict(server[-1], x=server[-1]["x"] + 1.0)))
+        self.assertAlmostEqual(car.x, server[-1]["x"] + 1.0)
+        self.assertEqual(len(buffer), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+"""
+Tests of the wire protocol (Shared/Protocol.py).
+
+Run from the repository root:
+    python -m unittest discover Tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from Protocol import (BinaryCodec, EncodeCache, JsonCodec, ProtocolError, PROTOCOL_BINARY, PROTOCOL_JSON, STATE,
+                      choose_protocol, decode_datagram, diff_state, encode_datagram, validate_state)
+
+
+def state(player_id: int = 1, **fields) -> dict:
+    message = {"id": player_id, "x": 10.5, "y": -20.25, "angle": 90.0, "speed_kmh": 120.0, "points": 3.0,
+               "is_drifting": True, "is_boosting": False}
+    message.update(fields)
+    return message
+
+
+def round_trip(codec, *messages) -> list:
+    for message in messages:
+        codec.feed(codec.encode(message))
+    decoded = []
+    while True:
+        frame = codec.next_frame()
+        if frame is None:
+            return decoded
+        decoded.append(codec.decode(frame))
+
+
+class BinaryCodecTest(unittest.TestCase):
+
+    def test_state_round_trip(self):
+        codec = BinaryCodec()
+        info = {"event": "player_info", "id": 1, "name": "Bob", "car_color": [1, 2, 3]}
+        decoded_info, decoded_state = round_trip(codec, info, state())
+        self.assertEqual(decoded_info, info)
+        # Name and color come from the player_info frame
+        self.assertEqual(decoded_state, dict(state(), name="Bob", car_color=[1, 2, 3]))
+
+    def test_state_frame_size(self):
+        # Length prefix, frame type and the fixed state struct
+        self.assertEqual(len(BinaryCodec().encode(state())), 2 + 1 + STATE.size)
+
+    def test_snapshot_and_delta_round_trip(self):
+        codec = BinaryCodec()
+        snapshot = {"event": "snapshot", "tick": 7, "players": [state(1), state(2, x=1.0)]}
+        delta = {"event": "delta", "tick": 8, "base": 7, "players": [{"id": 2, "x": 2.0, "is_drifting": False, "is_boosting": True}]}
+        decoded_snapshot, decoded_delta = round_trip(codec, snapshot, delta)
+        self.assertEqual([player["x"] for player in decoded_snapshot["players"]], [10.5, 1.0])
+        self.assertEqual(decoded_delta["base"], 7)
+        entry = decoded_delta["players"][0]
+        self.assertEqual((entry["x"], entry["is_drifting"], entry["is_boosting"]), (2.0, False, True))
+        self.assertNotIn("y", entry)
+
+    def test_input_correction_and_event_round_trip(self):
+        codec = BinaryCodec()
+        inputs = {"event": "input", "seq": 100, "inputs": [1, 0, 33]}
+        correction = {"event": "correction", "seq": 5, "x": 1.5, "y": 2.5, "angle": 3.5, "velocity_x": 0.25,
+                      "velocity_y": -0.25, "nitro": 50.0, "points": 2.0, "is_drifting": False, "is_boosting": True}
+        event = {"event": "kicked", "reason": "Bye"}
+        self.assertEqual(round_trip(codec, inputs, correction, event), [inputs, correction, event])
+
+    def test_partial_frame_waits_for_the_rest(self):
+        codec = BinaryCodec()
+        data = codec.encode(state())
+        codec.feed(data[:5])
+        self.assertIsNone(codec.next_frame())
+        codec.feed(data[5:])
+        self.assertEqual(codec.decode(codec.next_frame())["x"], 10.5)
+
+    def test_malformed_frames(self):
+        codec = BinaryCodec()
+        with self.assertRaises(ProtocolError):
+            codec.decode(b"\x01\x00")
+        with self.assertRaises(ProtocolError):
+            codec.decode(b"\xff")
+        with self.assertRaises(ProtocolError):
+            # Announces 3 inputs, contains 1
+            codec.decode(b"\x06\x01\x00\x00\x00\x03\x00")
+
+
+class JsonCodecTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        message = dict(state(), name="Bob", car_color=[1, 2, 3])
+        self.assertEqual(round_trip(JsonCodec(), message, {"event": "ping", "time": 1.5}), [message, {"event": "ping", "time": 1.5}])
+
+    def test_invalid_json(self):
+        codec = JsonCodec()
+        with self.assertRaises(ProtocolError):
+            codec.decode(b"{no json")
+        with self.assertRaises(ProtocolError):
+            codec.decode(b"[1, 2]")
+
+
+class EncodeCacheTest(unittest.TestCase):
+
+    def test_encodes_once_per_protocol(self):
+        cache = EncodeCache(state())
+        first = cache.encode(BinaryCodec())
+        self.assertIs(cache.encode(BinaryCodec()), first)
+        cache.encode(JsonCodec())
+        self.assertEqual(set(cache.encoded), {PROTOCOL_BINARY, PROTOCOL_JSON})
+
+
+class DiffStateTest(unittest.TestCase):
+
+    def test_without_base_everything_is_sent(self):
+        self.assertEqual(diff_state(None, state()), state())
+
+    def test_only_changed_fields_and_id(self):
+        self.assertEqual(diff_state(state(), state(x=11.0)), {"id": 1, "x": 11.0})
+        self.assertEqual(diff_state(state(), state()), {"id": 1})
+
+    def test_flags_are_sent_together(self):
+        changes = diff_state(state(), state(is_boosting=True))
+        self.assertEqual(changes, {"id": 1, "is_drifting": True, "is_boosting": True})
+
+
+class ValidateStateTest(unittest.TestCase):
+
+    def test_valid_state_passes(self):
+        validate_state(state(name="Bob"))
+
+    def test_invalid_position(self):
+        for value in (None, "1", True, float("nan"), float("inf"), 1e39):
+            with self.subTest(value=value), self.assertRaises(ProtocolError):
+                validate_state(state(x=value))
+        with self.assertRaises(ProtocolError):
+            validate_state({"id": 1, "y": 0.0, "angle": 0.0})
+
+    def test_invalid_optional_fields(self):
+        with self.assertRaises(ProtocolError):
+            validate_state(state(speed_kmh="fast"))
+        with self.assertRaises(ProtocolError):
+            validate_state(state(name=5))
+        with self.assertRaises(ProtocolError):
+            validate_state(state(car_color=[1, 2]))
+
+    def test_car_color_is_clamped(self):
+        message = state(car_color=[-5, 300, 12.7])
+        validate_state(message)
+        self.assertEqual(message["car_color"], [0, 255, 12])
+
+    def test_validated_states_can_be_encoded(self):
+        message = state(x=-1e38, points=0)
+        validate_state(message)
+        BinaryCodec().encode(message)
+
+
+class NegotiationTest(unittest.TestCase):
+
+    def test_choose_protocol(self):
+        self.assertEqual(choose_protocol([PROTOCOL_JSON, PROTOCOL_BINARY]), PROTOCOL_BINARY)
+        self.assertEqual(choose_protocol([PROTOCOL_JSON]), PROTOCOL_JSON)
+        # Unknown protocols fall back to JSON
+        self.assertEqual(choose_protocol(["bin9"]), PROTOCOL_JSON)
+        self.assertEqual(choose_protocol([]), PROTOCOL_JSON)
+
+    def test_datagram_round_trip(self):
+        frame = BinaryCodec().encode(state())
+        self.assertEqual(decode_datagram(encode_datagram(42, 7, frame)), (42, 7, frame[2:]))
+        self.assertEqual(decode_datagram(encode_datagram(42, 8)), (42, 8, None))
+        with self.assertRaises(ProtocolError):
+            decode_datagram(encode_datagram(42, 9, frame)[:-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+"""
+Tests of the server-side simulation and send path of CarGameServer (Server/CarGameServer.py).
+
+No sockets are opened, the clients are connections without a network.
+
+Run from the repository root:
+    python -m unittest discover Tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Server'))
+from CarGameServer import CarGameServer, ClientConnection, INPUT_BUFFER_STEPS
+from CarPhysics import CarPhysics, INPUT_ACCELERATE
+from Protocol import BinaryCodec
+
+
+class Client(ClientConnection):
+    def __init__(self, server: CarGameServer, name: str = "Bob"):
+        self.setup_connection(("127.0.0.1", 0), server)
+        self.car = CarPhysics()
+        self.name = name
+        self.car_color = [1, 2, 3]
+        server.clients.append(self)
+
+
+class SimulationTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = CarGameServer(port=0, authoritative=True)
+        self.client = Client(self.server)
+        self.seq = 0
+
+    def send_inputs(self, count: int, bits: int = INPUT_ACCELERATE):
+        self.server.receive_inputs(self.client, {"event": "input", "seq": self.seq + 1, "inputs": [bits] * count})
+        self.seq += count
+
+    def test_every_input_is_one_step(self):
+        self.send_inputs(3)
+        for seq in range(1, 4):
+            self.server.simulate()
+            self.assertEqual(self.client.input_seq, seq)
+        reference = CarPhysics()
+        for _ in range(3):
+            reference.step(INPUT_ACCELERATE)
+        self.assertEqual(self.client.car.get_physics_state(), reference.get_physics_state())
+        self.assertEqual(self.client.last_state["x"], reference.x)
+
+    def test_repeated_inputs_are_skipped(self):
+        self.send_inputs(2)
+        self.server.receive_inputs(self.client, {"event": "input", "seq": 1, "inputs": [INPUT_ACCELERATE] * 3})
+        self.assertEqual([seq for seq, _ in self.client.inputs], [1, 2, 3])
+
+    def test_moving_car_waits_for_late_inputs(self):
+        self.send_inputs(1)
+        self.server.simulate()
+        state = self.client.car.get_physics_state()
+        for _ in range(3):
+            self.server.simulate()
+        self.assertEqual(self.client.car.get_physics_state(), state)
+        self.assertEqual(self.client.missed_steps, 3)
+
+    def test_parked_car_steps_without_inputs(self):
+        self.server.simulate()
+        self.assertEqual((self.client.input_seq, self.client.missed_steps), (0, 0))
+        self.assertIsNotNone(self.client.last_state)
+
+    def test_catch_up_is_limited_to_the_missed_steps(self):
+        self.send_inputs(1)
+        self.server.simulate()
+        for _ in range(3):
+            self.server.simulate()
+        self.send_inputs(INPUT_BUFFER_STEPS + 6)
+        # Two steps per physics step while steps were missed and the backlog is large
+        steps = []
+        for _ in range(4):
+            before = self.client.input_seq
+            self.server.simulate()
+            steps.append(self.client.input_seq - before)
+        self.assertEqual(steps, [2, 2, 2, 1])
+        self.assertEqual(self.client.missed_steps, 0)
+
+    def test_backlog_without_missed_steps_is_dropped(self):
+        # A client that sends faster than real time can't drive faster
+        self.send_inputs(INPUT_BUFFER_STEPS + 6)
+        self.server.simulate()
+        self.assertEqual(self.client.input_seq, 7)
+        self.assertEqual(len(self.client.inputs), INPUT_BUFFER_STEPS - 1)
+
+    def test_correction_contains_the_last_simulated_input(self):
+        self.send_inputs(2)
+        self.server.simulate()
+        self.server.simulate()
+        self.client.codec = BinaryCodec()
+        self.server.send_corrections()
+        (data,) = self.client.queue.drain()
+        codec = BinaryCodec()
+        codec.feed(data)
+        correction = codec.decode(codec.next_frame())
+        self.assertEqual(correction["seq"], 2)
+        self.assertAlmostEqual(correction["x"], self.client.car.x)
+
+
+class SendTest(unittest.TestCase):
+
+    def test_encode_error_only_loses_the_message(self):
+        server = CarGameServer(port=0)
+        client = Client(server)
+        client.codec = BinaryCodec()
+        # Player IDs are u16 in bin1
+        client.send({"id": 70000, "x": 0.0, "y": 0.0, "angle": 0.0})
+        self.assertEqual(server.metrics.encode_errors.value, 1)
+        client.send({"event": "ping", "time": 1.0})
+        self.assertEqual(len(client.queue.drain()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Tests of the session file format (Shared/SessionFile.py).
+
+Run from the repository root:
+    python -m unittest discover Tests
+"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from SessionFile import SessionReader, SessionWriter, complete_length
+
+
+def state(player_id: int, x: float) -> dict:
+    return {"id": player_id, "x": x, "y": 2.0, "angle": 90.0, "speed_kmh": 0.0, "points": 0.0,
+            "is_drifting": False, "is_boosting": False}
+
+
+class ContinueSessionFileTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "session.rec")
+
+    def write(self, states: list, start_ms: int, crash: bool = False):
+        writer = SessionWriter(self.path, 1000.0)
+        writer.write(start_ms, {"event": "player_info", "id": 1, "name": "Bob", "car_color": [1, 2, 3]})
+        for i, x in enumerate(states):
+            writer.write(start_ms + i * 100, state(1, x))
+        if crash:
+            # Like a server that crashed: records flushed, no index
+            writer.flush()
+            writer.file.close()
+        else:
+            writer.close()
+
+    def read_states(self) -> list:
+        with SessionReader(self.path) as reader:
+            return [message["x"] for _, message in reader if message.get("event") is None]
+
+    def test_partial_record_is_cut_off(self):
+        self.write([1.0, 2.0, 3.0], 0, crash=True)
+        with open(self.path, "rb") as f:
+            data = f.read()
+        self.assertEqual(complete_length(data), len(data))
+        # The last record was only written halfway
+        cut = len(data) - 10
+        with open(self.path, "r+b") as f:
+            f.truncate(cut)
+        with open(self.path, "rb") as f:
+            self.assertLess(complete_length(f.read()), cut)
+
+        self.write([4.0, 5.0], 1000)
+        self.assertEqual(self.read_states(), [1.0, 2.0, 4.0, 5.0])
+
+    def test_continue_after_index(self):
+        self.write([1.0, 2.0], 0)
+        self.write([3.0], 1000)
+        self.assertEqual(self.read_states(), [1.0, 2.0, 3.0])
+        with SessionReader(self.path) as reader:
+            self.assertEqual(reader.start_time, 1000.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
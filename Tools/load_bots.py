@@ -0,0 +1,259 @@
+"""
+Headless load generator: many synthetic players against a running server.
+
+Every bot is a CarGameClient without pygame, so it uses the same handshake,
+protocols, UDP channel, delta snapshots and send rate adaption as the game.
+The bots drive circles at the frame rate of the game and send their state
+(or their inputs, if the server is authoritative) through the client's send
+rate limiter. They are spread over several processes, each process drives
+its bots from one loop and every bot has the receive threads of the client.
+
+Measured after all bots connected (the ramp):
+
+* end-to-end relay latency: every bot sends the milliseconds since the start
+  of the run as its ``points`` and the receiving bots subtract that from their
+  own clock (all processes share time.monotonic()). It includes the tick
+  interval in tick mode and the time players are left out by dead reckoning.
+  Authoritative servers compute the points themselves, only the RTT is
+  measured then.
+* RTT of the client's pings (through the server's outbound queue)
+* delivered player updates per second, disconnects and failed connects
+* late frames: the generator itself couldn't keep up, use more processes
+
+Usage (from the repository root, with the server running):
+    python Tools/load_bots.py [--host 127.0.0.1] [--port 5000] [--bots 200] [--processes 4] [--duration 30]
+                              [--ramp 5] [--rate 60] [--protocol bin1|json] [--udp] [--room lobby] [--json report.json]
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Client'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CarGameClient import CarGameClient
+from CarPhysics import INPUT_ACCELERATE, INPUT_LEFT, PHYSICS_RATE
+
+# Time the processes get to start before the first bot connects
+START_DELAY = 1.0
+# Scripted path: circles of this radius at this speed, around centers spread over the world
+CIRCLE_RADIUS = 400
+SPEED_KMH = 50.0
+# Time to wait for the last messages after the run
+RESULT_TIMEOUT = 30
+
+
+class BotClient(CarGameClient):
+    """CarGameClient that drives a circle and counts what it receives instead of drawing it."""
+
+    def __init__(self, index: int, args, epoch: float, measure_start: float):
+        protocols = [args.protocol] if args.protocol else None
+        rng = random.Random(index)
+        super().__init__(args.host, args.port, f"bot{index}", [rng.randrange(256) for _ in range(3)], self.on_error,
+                         protocols=protocols, use_udp=args.udp, room=args.room, send_rate=args.rate)
+        self.on_player_disconnect = lambda player_id: None
+        self.epoch = epoch
+        self.measure_start = measure_start
+        self.center = (rng.uniform(-args.spread, args.spread), rng.uniform(-args.spread, args.spread))
+        self.phase = rng.uniform(0, 2 * math.pi)
+        self.error = None
+
+        # Statistics, only counted after measure_start
+        self.received = 0
+        self.latencies = Counter()      # ms -> samples
+        self.rtts = Counter()           # ms -> samples
+
+    def on_error(self, reason: str):
+        self.error = reason
+
+    def drive(self, now: float):
+        """Sends the state (or the inputs) of one frame."""
+        if self.authoritative:
+            self.send_input(INPUT_ACCELERATE | INPUT_LEFT, self.car_color)
+            return
+        speed = SPEED_KMH / 3.6 * PHYSICS_RATE     # world units per second
+        theta = self.phase + speed / CIRCLE_RADIUS * (now - self.epoch)
+        x = self.center[0] + CIRCLE_RADIUS * math.cos(theta)
+        y = self.center[1] + CIRCLE_RADIUS * math.sin(theta)
+        # Send time as points (float32 in bin1, exact for hours)
+        points = round((now - self.epoch) * 1000)
+        self.send_player_state(x, y, math.degrees(theta) + 90, False, self.car_color, points, False, SPEED_KMH)
+
+    def player_state_handler(self, message: dict):
+        if self.player_id is not None and message.get("id") == self.player_id:
+            return
+        now = time.monotonic()
+        if now < self.measure_start:
+            return
+        self.received += 1
+        if not self.authoritative and isinstance(message.get("points"), (int, float)):
+            self.latencies[max(0, round((now - self.epoch) * 1000 - message["points"]))] += 1
+
+    def pong_handler(self, message: dict):
+        super().pong_handler(message)
+        sent_time = message.get("time")
+        if isinstance(sent_time, (int, float)) and time.monotonic() >= self.measure_start:
+            self.rtts[round((time.monotonic() - sent_time) * 1000)] += 1
+
+    def event_handler(self, message: dict):
+        # Like the game's client, without printing every event
+        event = message.get("event")
+        if event == "udp_ready":
+            self.udp_ready = True
+        elif event == "kicked":
+            self.error = f"kicked: {message.get('reason')}"
+
+
+def run_bots(indices: list, args, epoch: float, results):
+    """Connects and drives the given bots (runs in a bot process) and puts the statistics into results."""
+    # The client prints every connect, silence it on file descriptor level
+    os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+    measure_start = epoch + START_DELAY + args.ramp
+    end = measure_start + args.duration
+    # Bots connect one after another over the ramp, interleaved over all processes
+    pending = [(epoch + START_DELAY + args.ramp * index / args.bots, index) for index in indices]
+    bots = []
+    result = {"bots": len(indices), "connect_failures": 0, "frames": 0, "late_frames": 0}
+
+    interval = 1 / args.fps
+    next_frame = time.monotonic()
+    while True:
+        now = time.monotonic()
+        if now >= end:
+            break
+        while pending and pending[0][0] <= now:
+            bot = BotClient(pending.pop(0)[1], args, epoch, measure_start)
+            try:
+                bot.connect()
+                bots.append(bot)
+            except OSError:
+                result["connect_failures"] += 1
+        for bot in bots:
+            if bot.running:
+                bot.drive(now)
+
+        if now >= measure_start:
+            result["frames"] += 1
+        next_frame += interval
+        delay = next_frame - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            if now >= measure_start:
+                result["late_frames"] += 1
+            next_frame = time.monotonic()
+
+    result.update(connected=len(bots), disconnects=0, sent=0, received=0, latencies=Counter(), rtts=Counter(), errors=Counter())
+    for bot in bots:
+        if not bot.running or bot.error:
+            result["disconnects"] += 1
+            result["errors"][bot.error or "connection closed"] += 1
+        result["sent"] += bot.rate_limiter.sent
+        result["received"] += bot.received
+        result["latencies"].update(bot.latencies)
+        result["rtts"].update(bot.rtts)
+        bot.close()
+    results.put(result)
+
+
+def percentiles(samples: Counter, fractions=(0.5, 0.9, 0.99)) -> dict:
+    """Returns the given percentiles and the maximum of a histogram (value -> count), None without samples."""
+    total = sum(samples.values())
+    if not total:
+        return {f"p{round(f * 100)}": None for f in fractions} | {"max": None}
+    result = {}
+    values = sorted(samples)
+    cumulative = 0
+    remaining = list(fractions)
+    for value in values:
+        cumulative += samples[value]
+        while remaining and cumulative >= remaining[0] * total:
+            result[f"p{round(remaining.pop(0) * 100)}"] = value
+    result["max"] = values[-1]
+    return result
+
+
+def summarize(results: list, args) -> dict:
+    total = {"bots": 0, "connected": 0, "connect_failures": 0, "disconnects": 0, "sent": 0, "received": 0, "frames": 0, "late_frames": 0}
+    latencies, rtts, errors = Counter(), Counter(), Counter()
+    for result in results:
+        for key in total:
+            total[key] += result[key]
+        latencies.update(result["latencies"])
+        rtts.update(result["rtts"])
+        errors.update(result["errors"])
+    # Sent counts the whole run (including the ramp), received only the measurement
+    total.update(
+        received_per_second=total["received"] / args.duration,
+        received_per_bot_per_second=total["received"] / args.duration / max(1, total["connected"]),
+        relay_latency_ms=percentiles(latencies),
+        rtt_ms=percentiles(rtts),
+        late_frame_ratio=total["late_frames"] / max(1, total["frames"]),
+        errors=dict(errors),
+        config={"host": args.host, "port": args.port, "bots": args.bots, "processes": args.processes, "duration": args.duration,
+                "rate": args.rate, "protocol": args.protocol, "udp": args.udp, "room": args.room},
+    )
+    return total
+
+
+def print_report(report: dict):
+    def ms(values):
+        return " / ".join("-" if value is None else f"{value}" for value in values.values()) + " ms (p50 / p90 / p99 / max)"
+
+    print(f"bots:              {report['connected']} of {report['bots']} connected, {report['connect_failures']} failed, {report['disconnects']} disconnected")
+    for reason, count in report["errors"].items():
+        print(f"                   {count}x {reason}")
+    print(f"delivered:         {report['received_per_second']:.0f} player updates/s ({report['received_per_bot_per_second']:.1f} per bot)")
+    print(f"relay latency:     {ms(report['relay_latency_ms'])}")
+    print(f"ping RTT:          {ms(report['rtt_ms'])}")
+    print(f"late frames:       {report['late_frame_ratio'] * 100:.1f}%" + (" (generator overloaded, use more --processes)" if report["late_frame_ratio"] > 0.05 else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--bots", type=int, default=200)
+    parser.add_argument("--processes", type=int, default=None, help="Processes running the bots (default: one per core)")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to measure after all bots connected")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which the bots connect")
+    parser.add_argument("--fps", type=float, default=PHYSICS_RATE, help="Frame rate of the bots (like the game loop)")
+    parser.add_argument("--rate", type=float, default=60.0, help="Highest state send rate per bot (Hz)")
+    parser.add_argument("--protocol", choices=["bin1", "json"], default=None, help="Offer only this protocol (default: both)")
+    parser.add_argument("--udp", action="store_true", help="Use the UDP state channel if the server offers it")
+    parser.add_argument("--room", default=None, help="Room to join on sharded servers")
+    parser.add_argument("--spread", type=float, default=0.0, help="Circle centers are spread this far (world units), for area of interest tests")
+    parser.add_argument("--json", default=None, help="Also write the report to this JSON file")
+    args = parser.parse_args()
+    args.processes = max(1, min(args.bots, args.processes or os.cpu_count() or 1))
+
+    print(f"{args.bots} bots in {args.processes} processes against {args.host}:{args.port}, "
+          f"ramp {args.ramp:.0f} s, measuring {args.duration:.0f} s")
+    epoch = time.monotonic()
+    results = multiprocessing.Queue()
+    processes = []
+    for i in range(args.processes):
+        process = multiprocessing.Process(target=run_bots, args=(list(range(i, args.bots, args.processes)), args, epoch, results))
+        process.start()
+        processes.append(process)
+    try:
+        collected = [results.get(timeout=START_DELAY + args.ramp + args.duration + RESULT_TIMEOUT) for _ in processes]
+    finally:
+        for process in processes:
+            process.join()
+
+    report = summarize(collected, args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Replays a session recorded by the server (``python main.py --record session.rec``).
+
+The recording is memory-mapped and its messages go through the same path as
+live traffic, in their recorded timing (scaled by --speed):
+
+* ``info``: duration, message counts and players of the recording
+* ``view``: pygame viewer, the messages are handled by a CarGameClient that
+  isn't connected to a server. Tab follows the next player, space pauses.
+* ``play``: connects one CarGameClient per recorded player to a server (e.g. a
+  server under test) and sends the recorded states of that player, so a real
+  session can be repeated as a load test.
+* ``extract``: writes the track of one player (their states, keyframes and
+  events) into a smaller session file.
+
+Replays can start anywhere (--start): the recording's keyframe index points to
+the world state before that time. The viewer seeks with the arrow keys.
+
+Usage (from the repository root):
+    python Tools/replay_session.py info session.rec
+    python Tools/replay_session.py view session.rec [--speed 2] [--start 3600] [--follow Player]
+    python Tools/replay_session.py play session.rec [--host 127.0.0.1] [--port 5000] [--speed 1] [--start 0] [--udp]
+    python Tools/replay_session.py extract session.rec Player track.rec [--start 0] [--end 600]
+"""
+import argparse
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Client'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Shared'))
+from CarGameClient import CarGameClient
+from SessionFile import SessionReader, SessionWriter
+
+VIEW_WIDTH = 1000
+VIEW_HEIGHT = 700
+VIEW_FPS = 60
+# Remote cars are drawn this many seconds in the past, like in the game
+INTERPOLATION_DELAY = 0.1
+# Highest state rate of a replayed player, the server's rate hints still apply
+PLAY_SEND_RATE = 120
+# Seconds the viewer seeks per arrow key (with shift: SEEK_STEP_LARGE)
+SEEK_STEP = 10
+SEEK_STEP_LARGE = 60
+
+
+def player_states(message: dict) -> list:
+    """Returns the player states contained in a recorded message (a state, snapshot or keyframe)."""
+    event = message.get("event")
+    if event is None:
+        return [message]
+    if event in ("snapshot", "keyframe"):
+        return message.get("players", [])
+    return []
+
+
+class Playback:
+    """
+    Hands out the records of a recording when their (scaled) time has come.
+
+    Playback starts at the keyframe before start, the records up to start are
+    handed out right away.
+    """
+
+    def __init__(self, reader: SessionReader, speed: float = 1.0, start: float = 0.0):
+        self.records = reader.records(start)
+        self.speed = speed
+        self.next_record = next(self.records, None)
+        self.offset = max(start, self.next_record[0] if self.next_record else 0.0)
+        self.started = time.monotonic()
+        self.paused_at = None
+
+    @property
+    def position(self) -> float:
+        """Current time in the recording (seconds since its start)."""
+        now = self.paused_at if self.paused_at is not None else time.monotonic()
+        return self.offset + (now - self.started) * self.speed
+
+    @property
+    def finished(self) -> bool:
+        return self.next_record is None
+
+    def toggle_pause(self):
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+        else:
+            self.started += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def due(self) -> list:
+        """Returns the messages whose time has come."""
+        position = self.position
+        messages = []
+        while self.next_record is not None and self.next_record[0] <= position:
+            messages.append(self.next_record[1])
+            self.next_record = next(self.records, None)
+        return messages
+
+    def wait(self):
+        """Sleeps until the next record is due."""
+        if self.next_record is not None and self.paused_at is None:
+            time.sleep(max(0.0, (self.next_record[0] - self.position) / self.speed))
+
+
+def show_info(reader: SessionReader):
+    kinds = Counter()
+    players = {}
+    duration = 0.0
+    for elapsed, message in reader:
+        duration = elapsed
+        kinds[message.get("event") or "state"] += 1
+        if message.get("event") == "player_info":
+            players[message["id"]] = message["name"]
+        for state in player_states(message):
+            players.setdefault(state["id"], state.get("name"))
+    print(f"recorded:  {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(reader.start_time))}, {duration:.1f} s")
+    print(f"messages:  {sum(kinds.values())} (" + ", ".join(f"{count} {kind}" for kind, count in kinds.most_common()) + ")")
+    print(f"keyframes: {len(reader.index)}")
+    print(f"players:   {len(players)}")
+    for player_id, name in sorted(players.items()):
+        print(f"  {player_id:5d}  {name}")
+
+
+class ReplayClient(CarGameClient):
+    """CarGameClient without a connection, recorded messages are passed to handle_message."""
+
+    def __init__(self):
+        super().__init__(None, None, None, [255, 255, 255], print)
+
+    def send(self, message: dict):
+        # Nothing to acknowledge, the recording contains full snapshots
+        pass
+
+
+def view(reader: SessionReader, speed: float, start: float = 0.0, follow: str = None):
+    import pygame
+    from GameObjects import MultiplayerCar
+
+    class Camera:
+        def __init__(self):
+            self.x = 0
+            self.y = 0
+
+        def apply(self, x, y):
+            return int(x - self.x), int(y - self.y)
+
+    pygame.init()
+    screen = pygame.display.set_mode((VIEW_WIDTH, VIEW_HEIGHT))
+    pygame.display.set_caption(f"Replay {os.path.basename(reader.file.name)}")
+    font = pygame.font.Font(None, 24)
+    clock = pygame.time.Clock()
+    camera = Camera()
+
+    cars = {}
+
+    def on_player_update(player_id, data):
+        if player_id not in cars:
+            cars[player_id] = MultiplayerCar(data["x"], data["y"], data["name"], data["car_color"], INTERPOLATION_DELAY)
+        cars[player_id].name = data["name"]
+        cars[player_id].update_state(x=data["x"], y=data["y"], angle=data["angle"], drifting=data.get("is_drifting", False),
+                                     visible=True, car_color=data["car_color"], points=data.get("points", 0),
+                                     boosting=data.get("is_boosting", False), speed_kmh=data.get("speed_kmh", 0))
+
+    def start_playback(position):
+        """Jumps to a position, the keyframe before it restores the world."""
+        cars.clear()
+        client = ReplayClient()
+        client.on_player_update = on_player_update
+        client.on_player_disconnect = lambda player_id: cars.pop(player_id, None)
+        client.on_player_out_of_range = lambda player_id: None
+        return client, Playback(reader, speed, max(0.0, position))
+
+    client, playback = start_playback(start)
+    followed = None
+    running = True
+    while running:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                playback.toggle_pause()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_TAB and cars:
+                ids = sorted(cars)
+                followed = ids[(ids.index(followed) + 1) % len(ids)] if followed in ids else ids[0]
+            elif event.type == pygame.KEYDOWN and event.key in (pygame.K_LEFT, pygame.K_RIGHT):
+                step = SEEK_STEP_LARGE if event.mod & pygame.KMOD_SHIFT else SEEK_STEP
+                paused = playback.paused_at is not None
+                client, playback = start_playback(playback.position + (step if event.key == pygame.K_RIGHT else -step))
+                if paused:
+                    playback.toggle_pause()
+
+        for message in playback.due():
+            if message.get("event") == "keyframe":
+                # The whole world: players that aren't in it are gone
+                ids = {state["id"] for state in message["players"]}
+                for player_id in [player_id for player_id in cars if player_id not in ids]:
+                    del cars[player_id]
+                message = {"event": "snapshot", "tick": 0, "players": message["players"]}
+            client.handle_message(message)
+
+        if followed not in cars:
+            named = [player_id for player_id, car in cars.items() if car.name == follow] or list(cars)
+            followed = min(named) if named else None
+        now = time.monotonic()
+        for car in cars.values():
+            car.interpolate(now)
+        if followed is not None:
+            camera.x = cars[followed].x - VIEW_WIDTH // 2
+            camera.y = cars[followed].y - VIEW_HEIGHT // 2
+
+        screen.fill((255, 255, 255))
+        for car in cars.values():
+            if car.visible:
+                car.draw(screen, camera)
+        status = "paused" if playback.paused_at is not None else "finished" if playback.finished else f"{speed:g}x"
+        screen.blit(font.render(f"{playback.position:7.1f} s  {status}  {len(cars)} players", True, (0, 0, 0)), (10, 10))
+        pygame.display.flip()
+        clock.tick(VIEW_FPS)
+    pygame.quit()
+
+
+def play(reader: SessionReader, args):
+    clients = {}    # recorded player id -> CarGameClient
+    sent = 0
+
+    def on_error(message):
+        print(f"[WARN] {message}")
+
+    playback = Playback(reader, args.speed, args.start)
+    try:
+        while not playback.finished:
+            playback.wait()
+            for message in playback.due():
+                if message.get("event") == "disconnect":
+                    client = clients.pop(message.get("id"), None)
+                    if client:
+                        client.close()
+                    continue
+                for state in player_states(message):
+                    client = clients.get(state["id"])
+                    if client is None:
+                        if state.get("name") is None:
+                            # player_info not recorded (yet)
+                            continue
+                        client = CarGameClient(args.host, args.port, state["name"], state["car_color"], on_error,
+                                               use_udp=args.udp, send_rate=PLAY_SEND_RATE, use_inputs=False)
+                        client.on_player_disconnect = lambda player_id: None
+                        client.connect()
+                        clients[state["id"]] = client
+                    client.send_player_state(state["x"], state["y"], state["angle"], state.get("is_drifting", False),
+                                             state["car_color"], state.get("points", 0), state.get("is_boosting", False),
+                                             state.get("speed_kmh", 0))
+                    sent += 1
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"[ERROR] Unable to connect to {args.host}:{args.port}: {e}")
+    finally:
+        for client in clients.values():
+            client.close()
+    print(f"Replayed {sent} states of {playback.position:.1f} s")
+
+
+def extract(reader: SessionReader, args):
+    """Writes the records of one player into a new session file."""
+    if os.path.exists(args.output):
+        print(f"[ERROR] {args.output} already exists")
+        sys.exit(1)
+    writer = SessionWriter(args.output, reader.start_time)
+    ids = set()     # session IDs the player had (one per connection)
+    written = 0
+    for elapsed, message in reader.records(args.start):
+        if args.end is not None and elapsed > args.end:
+            break
+        if elapsed < args.start and message.get("event") != "keyframe":
+            continue
+        event = message.get("event")
+        if event == "player_info":
+            if message["name"] != args.player:
+                ids.discard(message["id"])
+                continue
+            ids.add(message["id"])
+        elif event == "disconnect":
+            if message.get("id") not in ids:
+                continue
+            ids.discard(message["id"])
+        elif event in (None, "snapshot", "keyframe"):
+            states = [state for state in player_states(message) if state["id"] in ids or state.get("name") == args.player]
+            if not states:
+                continue
+            for state in states:
+                if state["id"] not in writer.players:
+                    # Started at a keyframe or the player's info came before --start
+                    ids.add(state["id"])
+                    writer.write(round(elapsed * 1000), {"event": "player_info", "id": state["id"], "name": state["name"], "car_color": state["car_color"]})
+            message = {"event": "snapshot", "tick": message.get("tick", 0), "players": states} if event else message
+        else:
+            continue
+        writer.write(round(elapsed * 1000), message)
+        written += 1
+    writer.close()
+    if not written:
+        os.remove(args.output)
+        print(f"[ERROR] No records of {args.player} found")
+        sys.exit(1)
+    print(f"Wrote {written} records of {args.player} to {args.output} ({os.path.getsize(args.output)} of {os.path.getsize(args.file)} bytes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    info_parser = commands.add_parser("info", help="Summarize a recording")
+    info_parser.add_argument("file")
+    view_parser = commands.add_parser("view", help="Watch a recording")
+    view_parser.add_argument("file")
+    view_parser.add_argument("--speed", type=float, default=1.0)
+    view_parser.add_argument("--start", type=float, default=0.0, help="Seconds into the recording to start at")
+    view_parser.add_argument("--follow", default=None, help="Name of the player the camera follows first")
+    play_parser = commands.add_parser("play", help="Replay the recorded players against a server")
+    play_parser.add_argument("file")
+    play_parser.add_argument("--host", default="127.0.0.1")
+    play_parser.add_argument("--port", type=int, default=5000)
+    play_parser.add_argument("--speed", type=float, default=1.0)
+    play_parser.add_argument("--start", type=float, default=0.0, help="Seconds into the recording to start at")
+    play_parser.add_argument("--udp", action="store_true", help="Use the UDP state channel if the server offers it")
+    extract_parser = commands.add_parser("extract", help="Write the track of one player into a new session file")
+    extract_parser.add_argument("file")
+    extract_parser.add_argument("player", help="Name of the player")
+    extract_parser.add_argument("output")
+    extract_parser.add_argument("--start", type=float, default=0.0, help="Seconds into the recording to start at")
+    extract_parser.add_argument("--end", type=float, default=None, help="Seconds into the recording to stop at")
+    args = parser.parse_args()
+
+    with SessionReader(args.file) as reader:
+        if args.command == "info":
+            show_info(reader)
+        elif args.command == "view":
+            view(reader, args.speed, args.start, args.follow)
+        elif args.command == "play":
+            play(reader, args)
+        else:
+            extract(reader, args)
+
+
+if __name__ == "__main__":
+    main()